@@ -0,0 +1,3 @@
+# Benchmarks are run as modules from the repository root, for example:
+#
+#   python -m benchmarks.bench_settings
@@ -0,0 +1,48 @@
+"""
+A minimal ASGI app for benchmarks/bench_asgi.py.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.asgi_settings')
+
+from django.core.asgi import get_asgi_application
+from django.http import JsonResponse
+from django.urls import path
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.aio import AsyncHawkAuthentication
+
+application = get_asgi_application()
+
+auth = HawkAuthentication()
+async_auth = AsyncHawkAuthentication()
+
+
+def json_response(data, status=200):
+    response = JsonResponse(data, status=status)
+    # Keeps uvicorn from using chunked encoding.
+    response['Content-Length'] = len(response.content)
+    return response
+
+
+def sync_view(request):
+    try:
+        auth.authenticate(request)
+    except AuthenticationFailed as exc:
+        return json_response({'detail': str(exc)}, status=401)
+    return json_response({'ok': True})
+
+
+async def async_view(request):
+    try:
+        await async_auth.aauthenticate(request)
+    except AuthenticationFailed as exc:
+        return json_response({'detail': str(exc)}, status=401)
+    return json_response({'ok': True})
+
+
+urlpatterns = [
+    path('sync', sync_view),
+    path('async', async_view),
+]
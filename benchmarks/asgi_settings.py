@@ -0,0 +1,12 @@
+import os
+
+from benchmarks.settings import *  # noqa
+
+ALLOWED_HOSTS = ['*']
+ROOT_URLCONF = 'benchmarks.asgi'
+
+# HAWK_BENCH_MODE=async uses the async middleware and view.
+if os.environ.get('HAWK_BENCH_MODE') == 'async':
+    MIDDLEWARE = ['hawkrest.aio.AsyncHawkResponseMiddleware']
+else:
+    MIDDLEWARE = ['hawkrest.middleware.HawkResponseMiddleware']
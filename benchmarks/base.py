@@ -0,0 +1,83 @@
+import logging
+import os
+import timeit
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django
+from django.conf import settings
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment
+
+from mohawk import Sender
+
+django.setup()
+# Allows the testserver host, among other things.
+setup_test_environment()
+# Log output would dominate the timings.
+logging.disable(logging.WARNING)
+
+URL = 'http://testserver/'
+CREDENTIALS_ID = 'script-user'
+
+
+def credentials():
+    return settings.HAWK_CREDENTIALS[CREDENTIALS_ID]
+
+
+def hawk_request(method='GET', content='', content_type='', url=URL,
+                 factory=None):
+    """
+    Returns a RequestFactory request signed with a fresh Hawk header.
+    """
+    sender = Sender(credentials(), url, method,
+                    content=content, content_type=content_type)
+    factory = factory or RequestFactory()
+    do_request = getattr(factory, method.lower())
+    return do_request(url,
+                      data=content,
+                      content_type=content_type,
+                      HTTP_AUTHORIZATION=sender.request_header)
+
+
+@contextmanager
+def nullcontext():
+    yield
+
+
+def bench(label, func, number=10000, repeat=5):
+    """
+    Runs func() and prints the best per-call time in microseconds.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{label:<50} {usec:10.2f} usec/call'
+          .format(label=label, usec=best * 1e6))
+    return best
+
+
+def compare(cases, number=1000, repeat=15):
+    """
+    Times each ``(label, func)`` or ``(label, func, context)`` in
+    ``cases`` ``repeat`` times, taking turns so that noise on a busy
+    machine hits every case alike, and prints the best and median per-call
+    times in microseconds. ``context``, such as ``override_settings()``, is
+    entered around each timed batch.
+
+    Returns the median per-call time of each case in seconds.
+    """
+    times = [[] for _ in cases]
+    for _ in range(repeat):
+        for case, case_times in zip(cases, times):
+            with (case[2] if len(case) > 2 else nullcontext()):
+                case_times.append(timeit.timeit(case[1], number=number) /
+                                  number)
+    medians = []
+    for case, case_times in zip(cases, times):
+        case_times.sort()
+        median = case_times[len(case_times) // 2]
+        print('{label:<50} {best:10.2f} usec best {median:10.2f} usec median'
+              .format(label=case[0], best=case_times[0] * 1e6,
+                      median=median * 1e6))
+        medians.append(median)
+    return medians
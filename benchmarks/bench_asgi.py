@@ -0,0 +1,121 @@
+"""
+Compare request throughput of the sync and async Hawk code paths served by
+uvicorn on this machine:
+
+    pip install uvicorn
+    python -m benchmarks.bench_asgi [requests] [concurrency]
+
+The sync path is HawkAuthentication in a sync view with
+HawkResponseMiddleware, which Django runs in threads under ASGI. The async
+path is AsyncHawkAuthentication in an async view with
+AsyncHawkResponseMiddleware. Requests are signed up front and sent over
+keep-alive connections.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.base import credentials
+
+from mohawk import Sender
+
+HOST = '127.0.0.1'
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind((HOST, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(mode, port):
+    env = dict(os.environ, HAWK_BENCH_MODE=mode,
+               DJANGO_SETTINGS_MODULE='benchmarks.asgi_settings')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.asgi:application',
+         '--host', HOST, '--port', str(port), '--log-level', 'warning',
+         '--no-access-log'], env=env)
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, port)).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+def signed_requests(port, path, count):
+    url = 'http://{}:{}{}'.format(HOST, port, path)
+    requests = []
+    for _ in range(count):
+        header = Sender(credentials(), url, 'GET', content='',
+                        content_type='').request_header
+        requests.append(
+            'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+            'Authorization: {header}\r\n\r\n'
+            .format(path=path, host=HOST, port=port, header=header)
+            .encode('ascii'))
+    return requests
+
+
+async def client(port, requests, latencies):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    while requests:
+        start = time.time()
+        writer.write(requests.pop())
+        head = await reader.readuntil(b'\r\n\r\n')
+        status = head.split(b' ', 2)[1]
+        if status != b'200':
+            raise RuntimeError('unexpected status {}'.format(status))
+        length = 0
+        for line in head.split(b'\r\n'):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+        latencies.append(time.time() - start)
+    writer.close()
+
+
+async def load(port, requests, concurrency):
+    latencies = []
+    start = time.time()
+    await asyncio.gather(*[client(port, requests, latencies)
+                           for _ in range(concurrency)])
+    return time.time() - start, sorted(latencies)
+
+
+def run(mode, count, concurrency):
+    port = free_port()
+    server = start_server(mode, port)
+    try:
+        path = '/' + mode
+        # Warm up.
+        asyncio.run(load(port, signed_requests(port, path, 200),
+                         concurrency))
+        seconds, latencies = asyncio.run(
+            load(port, signed_requests(port, path, count), concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+    print('{mode:<6} {rps:8.0f} req/s, p50 {p50:6.2f} ms, p99 {p99:6.2f} ms'
+          .format(mode=mode, rps=count / seconds,
+                  p50=latencies[len(latencies) // 2] * 1000,
+                  p99=latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print('{} requests, {} connections'.format(count, concurrency))
+    for mode in ('sync', 'async'):
+        run(mode, count, concurrency)
+
+
+if __name__ == '__main__':
+    main()
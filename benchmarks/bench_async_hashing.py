@@ -0,0 +1,121 @@
+"""
+Measure event loop latency under ASGI while large payloads are hashed.
+
+A probe keeps authenticating and signing tiny requests with
+AsyncHawkAuthentication and AsyncHawkResponseMiddleware while other tasks
+verify large uploads and sign large downloads concurrently. The probe's
+latency is how long every other connection would wait.
+
+Modes:
+
+- ``inline``: every payload is hashed on the event loop.
+- ``pool``: payloads of at least HAWK_ASYNC_HASH_THRESHOLD bytes are
+  hashed on the hash thread pool.
+
+Run it with:
+
+    python -m benchmarks.bench_async_hashing [size_in_mb] [concurrency]
+"""
+import asyncio
+import io
+import sys
+import time
+
+from benchmarks.base import URL, credentials
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from mohawk import Sender
+
+from hawkrest.aio import AsyncHawkAuthentication, AsyncHawkResponseMiddleware
+
+CONTENT_TYPE = 'application/octet-stream'
+MODES = (
+    ('inline', float('inf')),
+    ('pool', 1024 * 1024),
+)
+ROUNDS = 3
+PROBE_INTERVAL = 0.001
+
+
+def signed_request(content):
+    # A file object keeps mohawk from formatting the content for its log.
+    sender = Sender(credentials(), URL, 'POST', content=io.BytesIO(content),
+                    content_type=CONTENT_TYPE)
+    return RequestFactory().post(URL, data=content,
+                                 content_type=CONTENT_TYPE,
+                                 HTTP_AUTHORIZATION=sender.request_header)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+async def serve(auth, middleware, request):
+    await auth.aauthenticate(request)
+    return await middleware(request)
+
+
+async def probe(auth, tiny, latencies, done):
+    while not done.is_set():
+        request = signed_request(b'{}')
+        start = time.perf_counter()
+        # A stalled event loop delays the wake up as well as the request.
+        await asyncio.sleep(PROBE_INTERVAL)
+        await serve(auth, tiny, request)
+        latencies.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run(size, concurrency):
+    auth = AsyncHawkAuthentication()
+    content = b'x' * size
+
+    async def tiny_response(request):
+        return HttpResponse(b'{}', content_type='application/json')
+
+    async def large_response(request):
+        return HttpResponse(content, content_type=CONTENT_TYPE)
+
+    tiny = AsyncHawkResponseMiddleware(tiny_response)
+    large = AsyncHawkResponseMiddleware(large_response)
+
+    # Signing ahead of time keeps the Sender out of the timings.
+    rounds = [[signed_request(content) for _ in range(concurrency)]
+              for _ in range(ROUNDS)]
+
+    latencies = []
+    done = asyncio.Event()
+    prober = asyncio.ensure_future(probe(auth, tiny, latencies, done))
+    start = time.perf_counter()
+    for requests in rounds:
+        await asyncio.gather(*[serve(auth, large, request)
+                               for request in requests])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return elapsed, latencies
+
+
+def main():
+    size = int(sys.argv[1] if len(sys.argv) > 1 else 16) * 1024 * 1024
+    concurrency = int(sys.argv[2] if len(sys.argv) > 2 else 4)
+    print('{} concurrent {} MB uploads with {} MB responses, {} rounds'
+          .format(concurrency, size // (1024 * 1024),
+                  size // (1024 * 1024), ROUNDS))
+    for mode, threshold in MODES:
+        with override_settings(HAWK_ASYNC_HASH_THRESHOLD=threshold,
+                               DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+            elapsed, latencies = asyncio.run(run(size, concurrency))
+        print('{mode:<8} tiny request p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  '
+              'max {max:7.1f} ms  ({n} served); large requests took '
+              '{elapsed:.2f} s'
+              .format(mode=mode, n=len(latencies),
+                      p50=percentile(latencies, 50) * 1e3,
+                      p99=percentile(latencies, 99) * 1e3,
+                      max=max(latencies) * 1e3, elapsed=elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare cache round trips per request for CacheNonceStore and
+BatchedCacheNonceStore under concurrent requests.
+
+The default cache is in-process so each round trip is nearly free here and
+requests/second mostly shows the latency added by waiting for a batch:
+with wait_for_remote, each thread checks at most about 1 / flush_interval
+nonces per second. With a network cache, the saved round trips are what
+matters.
+"""
+import threading
+import time
+
+from benchmarks.base import bench  # noqa: sets up Django
+
+from django.core.cache import caches
+
+from hawkrest.nonce import BatchedCacheNonceStore, CacheNonceStore
+
+
+class CountingCacheNonceStore(CacheNonceStore):
+    checks = 0
+
+    def seen_nonce(self, id, nonce, timestamp):
+        # Every check is one cache.add() round trip.
+        self.checks += 1
+        return super(CountingCacheNonceStore, self).seen_nonce(
+            id, nonce, timestamp)
+
+
+def run(store, threads=32, per_thread=200):
+    now = str(int(time.time()))
+
+    def work(thread_id):
+        for n in range(per_thread):
+            store.seen_nonce('script-user',
+                             '{}-{}'.format(thread_id, n), now)
+
+    workers = [threading.Thread(target=work, args=(t,))
+               for t in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.time() - start
+
+
+def main():
+    caches['default'].clear()
+    store = CountingCacheNonceStore()
+    seconds = run(store)
+    print('CacheNonceStore: {rt:.3f} round trips/request, {rate:.0f} '
+          'requests/second'.format(rt=1.0, rate=store.checks / seconds))
+
+    for wait_for_remote in (True, False):
+        for interval in (0.001, 0.005, 0.02):
+            caches['default'].clear()
+            store = BatchedCacheNonceStore(flush_interval=interval,
+                                           wait_for_remote=wait_for_remote)
+            seconds = run(store)
+            store.close()
+            print('BatchedCacheNonceStore flush_interval={i} '
+                  'wait_for_remote={w}: {rt:.3f} round trips/request, '
+                  '{rate:.0f} requests/second'
+                  .format(i=interval, w=wait_for_remote,
+                          rt=store.round_trips / float(store.checks),
+                          rate=store.checks / seconds))
+
+
+if __name__ == '__main__':
+    main()
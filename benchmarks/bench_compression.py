@@ -0,0 +1,67 @@
+"""
+Compare response size and signing latency with and without
+HAWK_COMPRESS_RESPONSES, for JSON bodies of several sizes:
+
+    python -m benchmarks.bench_compression [megabits_per_second]
+
+The estimated total adds the time to send the body at the given
+bandwidth (100 Mbit/s by default).
+"""
+import json
+import sys
+
+from benchmarks.base import bench
+from benchmarks.bench_download import signed_request
+
+from django.http import HttpResponse
+from django.test.utils import override_settings
+
+from hawkrest.middleware import HawkResponseMiddleware
+
+SIZES = (1024, 10 * 1024, 100 * 1024, 1024 * 1024)
+
+
+def json_item(i):
+    return {'id': i, 'name': 'item {}'.format(i), 'tags': ['hawk', 'rest'],
+            'active': True}
+
+
+def json_body(size):
+    """
+    Returns a JSON list of items that is about ``size`` bytes long.
+    """
+    # Items grow slowly with their id, so size the list from the last one.
+    item_size = len(json.dumps(json_item(size))) + 2
+    count = max(1, size // item_size)
+    return json.dumps([json_item(i) for i in range(count)]).encode('utf8')
+
+
+def main():
+    mbps = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+    bytes_per_second = mbps * 1000 * 1000 / 8
+    middleware = HawkResponseMiddleware(lambda r: None)
+    request, sender = signed_request()
+    request.META['HTTP_ACCEPT_ENCODING'] = 'gzip, deflate'
+
+    for size in SIZES:
+        content = json_body(size)
+        number = max(5, 100000 // size)
+        print('{} byte JSON body'.format(len(content)))
+        for compress in (False, True):
+            with override_settings(HAWK_COMPRESS_RESPONSES=compress):
+                def respond():
+                    return middleware.process_response(
+                        request, HttpResponse(
+                            content, content_type='application/json'))
+
+                wire_size = len(respond().content)
+                seconds = bench('  compress={}'.format(compress), respond,
+                                number=number, repeat=3)
+            print('  {:>50} {:10d} bytes, ~{:.2f} ms total at {} Mbit/s'
+                  .format('', wire_size,
+                          (seconds + wire_size / bytes_per_second) * 1000,
+                          mbps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Measure DatabaseNonceStore inserts per second on each benchmark database.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import itertools
+import time
+
+from benchmarks.base import bench
+
+from django.conf import settings
+from django.core.management import call_command
+
+from hawkrest.models import Nonce
+from hawkrest.nonce import DatabaseNonceStore
+
+
+def main():
+    number = 5000
+    for alias in ('sqlite', 'postgres'):
+        if alias not in settings.DATABASES:
+            print('{alias}: not configured, skipping'.format(alias=alias))
+            continue
+        call_command('migrate', 'hawkrest', database=alias, verbosity=0)
+        Nonce.objects.using(alias).all().delete()
+
+        store = DatabaseNonceStore(using=alias, cleanup=False)
+        counter = itertools.count()
+        now = str(int(time.time()))
+        seconds = bench('DatabaseNonceStore on {}'.format(alias),
+                        lambda: store.seen_nonce('script-user',
+                                                 str(next(counter)), now),
+                        number=number, repeat=1)
+        print('  {rate:.0f} inserts/second'.format(rate=1 / seconds))
+
+        start = time.time()
+        deleted = store.delete_expired(now=int(time.time()) + 3600)
+        print('  deleted {n} expired nonces in {ms:.1f} ms'
+              .format(n=deleted, ms=(time.time() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare peak memory (RSS) and latency while signing a large download with
+HawkResponseMiddleware.
+
+Modes:
+
+- ``buffered``: reads the whole response into memory and signs it, which
+  is what signing ``response.content`` amounts to.
+- ``streaming``: a StreamingHttpResponse, hashed while it is copied to a
+  temporary file.
+- ``file``: a FileResponse, hashed in place and then rewound.
+
+Each mode runs in its own process so that peaks don't mix:
+
+    python -m benchmarks.bench_download [size_in_mb]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.base import credentials
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from mohawk import Receiver, Sender
+
+from hawkrest import default_credentials_lookup
+from hawkrest.middleware import HawkResponseMiddleware
+
+URL = 'http://testserver/download'
+CONTENT_TYPE = 'application/octet-stream'
+CHUNK = b'x' * (64 * 1024)
+MODES = ('buffered', 'streaming', 'file')
+
+
+def signed_request():
+    sender = Sender(credentials(), URL, 'GET', content='', content_type='')
+    request = RequestFactory().get(URL,
+                                   HTTP_AUTHORIZATION=sender.request_header)
+    request.META['hawk.receiver'] = Receiver(
+        default_credentials_lookup, sender.request_header, URL, 'GET',
+        content='', content_type='')
+    return request, sender
+
+
+def chunks(size):
+    for _ in range(size // len(CHUNK)):
+        yield CHUNK
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(size, mode, path):
+    request, sender = signed_request()
+    if mode == 'file':
+        response = FileResponse(open(path, 'rb'), content_type=CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(chunks(size),
+                                         content_type=CONTENT_TYPE)
+
+    baseline = peak_rss_mb()
+    start = time.time()
+    if mode == 'buffered':
+        content = b''.join(response.streaming_content)
+        receiver = request.META['hawk.receiver']
+        receiver.respond(content=content, content_type=CONTENT_TYPE)
+    else:
+        HawkResponseMiddleware(lambda r: response).process_response(
+            request, response)
+    signed = time.time() - start
+
+    # Send the response somewhere.
+    if mode == 'buffered':
+        sent = len(content)
+    else:
+        sent = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+    assert sent == size, 'sent {} bytes, expected {}'.format(sent, size)
+
+    print('{mode:<10} signed in {signed:.2f}s, total {total:.2f}s, '
+          'peak RSS grew by {mb:.0f} MB'
+          .format(mode=mode, signed=signed, total=time.time() - start,
+                  mb=peak_rss_mb() - baseline))
+
+
+def main():
+    if sys.argv[1:2] == ['--run']:
+        run(int(sys.argv[2]), sys.argv[3], sys.argv[4])
+        return
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = size_mb * 1024 * 1024
+    print('Signing a {} MB download'.format(size_mb))
+
+    handle, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            for chunk in chunks(size):
+                f.write(chunk)
+        for mode in MODES:
+            subprocess.check_call([
+                sys.executable, '-m', 'benchmarks.bench_download',
+                '--run', str(size), mode, path])
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
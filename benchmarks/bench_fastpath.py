@@ -0,0 +1,47 @@
+"""
+Compare Hawk request verifications per second on one core with mohawk's
+Receiver, HawkReceiver and FastHawkReceiver:
+
+    python -m benchmarks.bench_fastpath
+"""
+from benchmarks.base import URL, bench, credentials
+
+from mohawk import Receiver, Sender
+
+from hawkrest import default_credentials_lookup
+from hawkrest.fastpath import FastHawkReceiver
+from hawkrest.receiver import HawkReceiver
+
+CONTENT = '{"name": "example"}'
+CONTENT_TYPE = 'application/json'
+
+
+def main():
+    url = URL + 'api/items/1?format=json'
+    header = Sender(credentials(), url, 'POST', content=CONTENT,
+                    content_type=CONTENT_TYPE, ext='some ext').request_header
+
+    # Nonces aren't checked so that the same header can be verified again.
+    def mohawk():
+        Receiver(default_credentials_lookup, header, url, 'POST',
+                 content=CONTENT, content_type=CONTENT_TYPE)
+
+    def receive(receiver_class):
+        receiver_class(default_credentials_lookup, header, url, 'POST',
+                       content_type=CONTENT_TYPE).verify_content(CONTENT)
+
+    timings = [
+        ('mohawk Receiver', mohawk),
+        ('HawkReceiver', lambda: receive(HawkReceiver)),
+        ('FastHawkReceiver', lambda: receive(FastHawkReceiver)),
+    ]
+    baseline = None
+    for label, func in timings:
+        seconds = bench(label, func, number=5000)
+        baseline = baseline or seconds
+        print('{:<50} {:10.0f} verifications/s, {:.1f}x'
+              .format('', 1 / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Measure what hawkrest logging costs per request with debug logging off,
+before and after moving to lazy formatting, and what logging auth events
+costs with and without the event queue:
+
+    python -m benchmarks.bench_logging
+"""
+import logging
+import os
+import tempfile
+import time
+import traceback
+
+from benchmarks.base import bench, hawk_request
+
+from django.test.utils import override_settings
+from mohawk.exc import MacMismatch
+
+from hawkrest import HawkAuthentication
+from hawkrest.events import (event_log, log_auth_event, start_event_queue,
+                             stop_event_queue)
+
+CONTENT = '{"name": "example"}'
+CONTENT_TYPE = 'application/json'
+NUMBER = 100000
+
+log = logging.getLogger('hawkrest.bench')
+
+
+class SlowHandler(logging.Handler):
+    """
+    Stands in for a handler that sends records over the network.
+    """
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(0.0002)
+
+
+def eager_success(receiver, key):
+    # The debug calls a signed request used to make.
+    log.debug('cached nonce {k}'.format(k=key))
+    log.debug('receiver? {rec}; hawk auth processed? {auth}'
+              .format(rec=receiver, auth=True))
+
+
+def lazy_success(receiver, key):
+    log.debug('cached nonce %s', key)
+    log.debug('receiver? %s; hawk auth processed? %s', receiver, True)
+
+
+def eager_failure():
+    try:
+        raise MacMismatch('MACs do not match')
+    except MacMismatch:
+        log.debug(traceback.format_exc())
+
+
+def lazy_failure():
+    try:
+        raise MacMismatch('MACs do not match')
+    except MacMismatch:
+        log.debug('Hawk authentication failed', exc_info=True)
+
+
+def main():
+    # Warnings are still logged, as by default, but not written anywhere.
+    logging.disable(logging.NOTSET)
+    hawk_log = logging.getLogger('hawkrest')
+    hawk_log.setLevel(logging.INFO)
+    hawk_log.addHandler(logging.NullHandler())
+    hawk_log.propagate = False
+    log.setLevel(logging.INFO)
+
+    key = 'script-user:1234567890:abcdefghijkl'
+    receiver = object()
+    eager = bench('eager debug logging, signed request',
+                  lambda: eager_success(receiver, key), number=NUMBER)
+    lazy = bench('lazy debug logging, signed request',
+                 lambda: lazy_success(receiver, key), number=NUMBER)
+    eager_fail = bench('eager debug logging, rejected request',
+                       eager_failure, number=NUMBER // 10)
+    lazy_fail = bench('lazy debug logging, rejected request',
+                      lazy_failure, number=NUMBER // 10)
+    print('Lazy logging saves {:.2f} usec per signed request and {:.2f} '
+          'usec per rejected request'.format((eager - lazy) * 1e6,
+                                             (eager_fail - lazy_fail) * 1e6))
+
+    request = hawk_request('POST', CONTENT, CONTENT_TYPE)
+    HawkAuthentication().authenticate(request)
+    receiver = request.META['hawk.receiver']
+    number = 2000
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    def auth_event():
+        log_auth_event(request, receiver)
+
+    # Off by default, even with INFO enabled for hawkrest.
+    off = bench('auth event, events logger off', auth_event, number=number)
+    event_log.setLevel(logging.INFO)
+    for label, handler in (('a file', logging.FileHandler(path)),
+                           ('the network', SlowHandler())):
+        event_log.addHandler(handler)
+        direct = bench('auth event written to {} directly'.format(label),
+                       auth_event, number=number)
+        event_log.removeHandler(handler)
+
+        start_event_queue(handler)
+        try:
+            queued = bench('auth event queued for {}'.format(label),
+                           auth_event, number=number)
+        finally:
+            stop_event_queue()
+        handler.close()
+        print('An auth event written to {} costs the request thread {:.1f} '
+              'usec directly and {:.1f} usec queued'
+              .format(label, direct * 1e6, queued * 1e6))
+    event_log.setLevel(logging.WARNING)
+    os.remove(path)
+    print('With the events logger off, it costs {:.2f} usec'
+          .format(off * 1e6))
+
+
+if __name__ == '__main__':
+    with override_settings(USE_CACHE_FOR_HAWK_NONCE=False):
+        main()
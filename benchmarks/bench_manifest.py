@@ -0,0 +1,57 @@
+"""
+Compare download throughput of a Hawk signed FileResponse with and
+without HAWK_PAYLOAD_MANIFEST:
+
+    python -m benchmarks.bench_manifest [size_in_mb]
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.base import bench
+from benchmarks.bench_download import CHUNK, signed_request
+
+from django.core.management import call_command
+from django.http import FileResponse
+from django.test.utils import override_settings
+
+from hawkrest.middleware import HawkResponseMiddleware
+
+
+def download(path):
+    request, sender = signed_request()
+    response = FileResponse(open(path, 'rb'))
+    HawkResponseMiddleware(lambda r: response).process_response(
+        request, response)
+    for chunk in response.streaming_content:
+        pass
+    response.close()
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'download.bin')
+        with open(path, 'wb') as f:
+            for _ in range(size_mb * 1024 * 1024 // len(CHUNK)):
+                f.write(CHUNK)
+        manifest_path = os.path.join(directory, 'manifest.json')
+        call_command('hawkmanifest', directory, output=manifest_path,
+                     stdout=open(os.devnull, 'w'))
+
+        print('Downloading a {} MB file'.format(size_mb))
+        hashed = bench('hashed per download', lambda: download(path),
+                       number=3, repeat=3)
+        with override_settings(HAWK_PAYLOAD_MANIFEST=manifest_path):
+            manifest = bench('hash from the manifest',
+                             lambda: download(path), number=3, repeat=3)
+        print('throughput: {:.0f} MB/s hashed, {:.0f} MB/s with manifest'
+              .format(size_mb / hashed, size_mb / manifest))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
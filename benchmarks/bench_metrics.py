@@ -0,0 +1,74 @@
+"""
+Measure what recording HAWK_METRICS costs per request, in one process
+and with a multiprocess directory, where a background thread writes the
+totals:
+
+    python -m benchmarks.bench_metrics
+"""
+import shutil
+import tempfile
+
+from benchmarks.base import bench, compare, hawk_request
+
+from django.http import HttpResponse
+from django.test.utils import override_settings
+from mohawk.exc import AlreadyProcessed
+
+from hawkrest import HawkAuthentication
+from hawkrest.metrics import MetricsRegistry
+from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.util import perf_counter
+
+CONTENT = '{"name": "example"}'
+CONTENT_TYPE = 'application/json'
+NUMBER = 5000
+
+
+def main():
+    authentication = HawkAuthentication()
+    middleware = HawkResponseMiddleware(lambda r: None)
+    request = hawk_request('POST', CONTENT, CONTENT_TYPE)
+
+    def authenticate_and_sign():
+        request.META.pop('hawk.receiver', None)
+        authentication.authenticate(request)
+        middleware.process_response(
+            request, HttpResponse(CONTENT, content_type=CONTENT_TYPE))
+
+    off, on = compare([
+        ('request without metrics', authenticate_and_sign,
+         override_settings(HAWK_METRICS=None)),
+        ('request with metrics', authenticate_and_sign,
+         override_settings(HAWK_METRICS={})),
+    ], number=NUMBER // 10)
+
+    registry = MetricsRegistry()
+    error = AlreadyProcessed()
+    started = perf_counter()
+    bench('record a verified request',
+          lambda: registry.authenticated(started), number=100000)
+    bench('record a rejected request',
+          lambda: registry.authenticated(started, error=error),
+          number=100000)
+    bench('record a signed response', lambda: registry.signed(started),
+          number=100000)
+
+    directory = tempfile.mkdtemp()
+    try:
+        registry = MetricsRegistry(multiprocess_dir=directory)
+        bench('record a verified request with a multiprocess dir',
+              lambda: registry.authenticated(started), number=100000)
+        bench('collect from a multiprocess dir', registry.render,
+              number=100)
+        registry.close()
+    finally:
+        shutil.rmtree(directory)
+
+    print('Measured: metrics add {:.2f} usec ({:.1f}%) to the median '
+          'request'.format((on - off) * 1e6, (on - off) / off * 100))
+
+
+if __name__ == '__main__':
+    # The same header is verified again and again.
+    with override_settings(USE_CACHE_FOR_HAWK_NONCE=False):
+        main()
@@ -0,0 +1,54 @@
+"""
+Compare the cost of checking a fresh nonce with each nonce store.
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.base import bench
+
+from hawkrest.nonce import (BloomNonceStore, CacheNonceStore,
+                            MemoryNonceStore, SharedMemoryNonceStore)
+
+
+def fresh_nonces(store):
+    counter = itertools.count()
+    now = str(int(time.time()))
+
+    def check():
+        store.seen_nonce('script-user', str(next(counter)), now)
+    return check
+
+
+def main():
+    number = 50000
+    tmp_dir = tempfile.mkdtemp()
+    stores = [
+        ('CacheNonceStore (LocMemCache)', CacheNonceStore()),
+        ('MemoryNonceStore', MemoryNonceStore(max_entries=10 ** 6)),
+        ('SharedMemoryNonceStore',
+         SharedMemoryNonceStore(path=os.path.join(tmp_dir, 'nonces'))),
+        # Sized for the number of nonces checked below.
+        ('BloomNonceStore',
+         BloomNonceStore(requests_per_second=number / 65.0)),
+    ]
+    try:
+        for label, store in stores:
+            seconds = bench(label, fresh_nonces(store), number=number,
+                            repeat=1)
+            print('  {rate:.0f} nonces/second'.format(rate=1 / seconds))
+            if hasattr(store, 'memory_usage'):
+                print('  uses {kb:.0f} KB'
+                      .format(kb=store.memory_usage() / 1024.0))
+            if hasattr(store, 'false_rejection_rate'):
+                print('  {r} of {n} new nonces rejected, estimated rate {p:.5f}'
+                      .format(r=store.rejections, n=store.checks,
+                              p=store.false_rejection_rate()))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
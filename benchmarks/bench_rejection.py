@@ -0,0 +1,98 @@
+"""
+Measure how long it takes to reject bad requests that carry a large body.
+
+Replayed, expired and forged requests are rejected by HawkAuthentication
+before the body is read. This compares that with verifying the header and
+body in one step, like mohawk's Receiver does:
+
+    python -m benchmarks.bench_rejection [size_in_mb]
+"""
+import sys
+
+from benchmarks.base import bench, credentials
+from benchmarks.bench_upload_memory import CONTENT_TYPE, URL, UploadStream
+
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+from django.test.utils import override_settings
+from mohawk import Receiver, Sender
+from mohawk.exc import HawkFail
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication, default_credentials_lookup
+from hawkrest.conf import hawk_settings
+
+
+def sign(size, **kw):
+    return Sender(kw.pop('credentials', None) or credentials(), URL, 'POST',
+                  content=UploadStream(size), content_type=CONTENT_TYPE,
+                  **kw).request_header
+
+
+def upload_request(size, header):
+    return WSGIRequest({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/upload',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': UploadStream(size),
+        'CONTENT_LENGTH': str(size),
+        'CONTENT_TYPE': CONTENT_TYPE,
+        'HTTP_AUTHORIZATION': header,
+    })
+
+
+def one_phase(request):
+    try:
+        Receiver(default_credentials_lookup,
+                 request.META['HTTP_AUTHORIZATION'],
+                 request.build_absolute_uri(),
+                 request.method,
+                 content=request.body,
+                 content_type=request.META['CONTENT_TYPE'],
+                 seen_nonce=hawk_settings.nonce_store.seen_nonce)
+    except HawkFail:
+        pass
+    else:
+        raise AssertionError('expected the request to be rejected')
+
+
+def two_phase(request):
+    try:
+        HawkAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        pass
+    else:
+        raise AssertionError('expected the request to be rejected')
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    size = size_mb * 1024 * 1024
+    print('Rejecting requests with a {} MB body'.format(size_mb))
+
+    replayed = sign(size)
+    accepted = HawkAuthentication().authenticate(
+        upload_request(size, replayed))
+    assert accepted, 'expected the first request to be accepted'
+    forged = sign(size, credentials=dict(credentials(), key='wrong key'))
+    expired = sign(size, _timestamp='123')
+
+    for label, header in (('replayed', replayed),
+                          ('expired', expired),
+                          ('forged', forged)):
+        one = bench('{}: header and body together'.format(label),
+                    lambda: one_phase(upload_request(size, header)),
+                    number=3, repeat=3)
+        two = bench('{}: header before body'.format(label),
+                    lambda: two_phase(upload_request(size, header)),
+                    number=100, repeat=3)
+        print('{:<50} {:10.0f}x faster'.format('', one / two))
+
+    cache.clear()
+
+
+if __name__ == '__main__':
+    with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+        main()
@@ -0,0 +1,62 @@
+"""
+Compare signing repeated response bodies with and without
+HAWK_RESPONSE_HASH_CACHE, across body sizes:
+
+    python -m benchmarks.bench_response_hash
+"""
+from benchmarks.base import bench, credentials
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from mohawk import Receiver, Sender
+
+from hawkrest import default_credentials_lookup
+from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.receiver import get_payload_hash_cache
+
+URL = 'http://testserver/'
+SIZES = (100, 10 * 1024, 100 * 1024, 1024 * 1024)
+
+
+def signed_request():
+    sender = Sender(credentials(), URL, 'GET', content='', content_type='')
+    request = RequestFactory().get(URL,
+                                   HTTP_AUTHORIZATION=sender.request_header)
+    request.META['hawk.receiver'] = Receiver(
+        default_credentials_lookup, sender.request_header, URL, 'GET',
+        content='', content_type='')
+    return request
+
+
+def main():
+    middleware = HawkResponseMiddleware(lambda r: None)
+    request = signed_request()
+
+    for size in SIZES:
+        content = b'{"x": "' + b'x' * (size - 9) + b'"}'
+        number = max(10, 200000 // size)
+
+        def respond(etag=None):
+            response = HttpResponse(content, content_type='application/json')
+            if etag:
+                response['ETag'] = etag
+            middleware.process_response(request, response)
+
+        print('{} byte body'.format(size))
+        uncached = bench('  no cache', respond, number=number, repeat=3)
+        with override_settings(HAWK_RESPONSE_HASH_CACHE={'MAX_SIZE': 100}):
+            etag = bench('  cached by ETag', lambda: respond(etag='"v1"'),
+                         number=number, repeat=3)
+        with override_settings(HAWK_RESPONSE_HASH_CACHE={
+                'MAX_SIZE': 100, 'USE_CHECKSUM': True}):
+            checksum = bench('  cached by checksum', respond,
+                             number=number, repeat=3)
+            print('  checksum hit rate: {:.3f}'.format(
+                get_payload_hash_cache().hit_rate))
+        print('  {:.1f}x as fast by ETag, {:.1f}x as fast by checksum'
+              .format(uncached / etag, uncached / checksum))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare per-request settings resolution with the cached hawk_settings.
+"""
+from benchmarks.base import bench, compare, hawk_request
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from mohawk import Receiver
+
+from hawkrest import (HawkAuthentication, default_credentials_lookup,
+                      default_message_expiration, default_user_lookup)
+from hawkrest.util import get_auth_header, is_hawk_request
+
+
+def legacy_credentials_lookup(cr_id):
+    # What HawkAuthentication.hawk_credentials_lookup used to do on
+    # every request.
+    lookup = default_credentials_lookup
+    lookup_name = getattr(settings, 'HAWK_CREDENTIALS_LOOKUP', None)
+    if lookup_name:
+        lookup = import_string(lookup_name)
+    return lookup(cr_id)
+
+
+def legacy_user_lookup(request, credentials):
+    lookup = default_user_lookup
+    lookup_name = getattr(settings, 'HAWK_USER_LOOKUP', None)
+    if lookup_name:
+        lookup = import_string(lookup_name)
+    return lookup(request, credentials)
+
+
+def legacy_seen_nonce(id, nonce, timestamp):
+    key = '{id}:{n}:{ts}'.format(id=id, n=nonce, ts=timestamp)
+    if cache.get(key):
+        return True
+    cache.set(key, True,
+              timeout=getattr(settings, 'HAWK_MESSAGE_EXPIRATION',
+                              default_message_expiration) + 5)
+    return False
+
+
+class LegacyAuthentication(HawkAuthentication):
+    """
+    Authenticates the way HawkAuthentication did before hawk_settings,
+    reading every setting and importing both lookups per request.
+    """
+
+    def authenticate(self, request):
+        request.META['hawk.receiver'] = None
+
+        http_authorization = get_auth_header(request)
+        if not http_authorization or not is_hawk_request(request):
+            return None
+
+        receiver = Receiver(
+            legacy_credentials_lookup,
+            http_authorization,
+            request.build_absolute_uri(),
+            request.method,
+            content=request.body,
+            seen_nonce=(legacy_seen_nonce
+                        if getattr(settings, 'USE_CACHE_FOR_HAWK_NONCE',
+                                   True)
+                        else None),
+            content_type=request.META.get('CONTENT_TYPE', ''),
+            timestamp_skew_in_seconds=getattr(settings,
+                                              'HAWK_MESSAGE_EXPIRATION',
+                                              default_message_expiration))
+        request.META['hawk.receiver'] = receiver
+        return legacy_user_lookup(request, receiver.resource.credentials)
+
+
+def main():
+    auth = HawkAuthentication()
+    legacy_auth = LegacyAuthentication()
+
+    legacy = bench('credentials lookup, resolved per call',
+                   lambda: legacy_credentials_lookup('script-user'))
+    cached = bench('credentials lookup, hawk_settings',
+                   lambda: auth.hawk_credentials_lookup('script-user'))
+    print('savings per call: {:.2f} usec'.format((legacy - cached) * 1e6))
+
+    # Requests are signed up front so that only authenticate() is timed.
+    number, repeat = 500, 15
+    legacy_reqs = iter([hawk_request() for _ in range(number * repeat)])
+    cached_reqs = iter([hawk_request() for _ in range(number * repeat)])
+    legacy, cached = compare([
+        ('authenticate(), resolved per call',
+         lambda: legacy_auth.authenticate(next(legacy_reqs))),
+        ('authenticate(), hawk_settings',
+         lambda: auth.authenticate(next(cached_reqs))),
+    ], number=number, repeat=repeat)
+    print('median savings per request: {:.2f} usec'
+          .format((legacy - cached) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare peak memory (RSS) while authenticating a large upload with and
+without HAWK_STREAM_REQUEST_BODY.
+
+Each mode runs in its own process so that peaks don't mix:
+
+    python -m benchmarks.bench_upload_memory [size_in_mb]
+"""
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.base import credentials
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.test.utils import override_settings
+from mohawk import Sender
+
+from hawkrest import HawkAuthentication
+
+URL = 'http://testserver/upload'
+CONTENT_TYPE = 'application/octet-stream'
+
+
+class UploadStream(object):
+    """
+    A WSGI input stream producing `size` bytes without holding them.
+    """
+    block = b'x' * (64 * 1024)
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining -= size
+        return (self.block * (size // len(self.block) + 1))[:size]
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def upload_request(size):
+    sender = Sender(credentials(), URL, 'POST',
+                    content=UploadStream(size), content_type=CONTENT_TYPE)
+    return WSGIRequest({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/upload',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': UploadStream(size),
+        'CONTENT_LENGTH': str(size),
+        'CONTENT_TYPE': CONTENT_TYPE,
+        'HTTP_AUTHORIZATION': sender.request_header,
+    })
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(size, stream):
+    request = upload_request(size)
+    baseline = peak_rss_mb()
+    start = time.time()
+    with override_settings(HAWK_STREAM_REQUEST_BODY=stream,
+                           DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+        HawkAuthentication().authenticate(request)
+    print('stream={stream}: {sec:.2f}s, peak RSS grew by {mb:.0f} MB'
+          .format(stream=stream, sec=time.time() - start,
+                  mb=peak_rss_mb() - baseline))
+
+
+def main():
+    if sys.argv[1:2] == ['--run']:
+        run(int(sys.argv[2]), sys.argv[3] == 'True')
+        return
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print('Authenticating a {} MB upload'.format(size_mb))
+    for stream in (False, True):
+        subprocess.check_call([
+            sys.executable, '-m', 'benchmarks.bench_upload_memory',
+            '--run', str(size_mb * 1024 * 1024), str(stream)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare how fast bad Hawk requests are rejected by HawkWSGIMiddleware
+with rejecting them in a DRF view behind Django's middleware stack:
+
+    python -m benchmarks.bench_wsgi_gate
+"""
+import io
+
+from benchmarks.base import bench, credentials
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.utils import override_settings
+from mohawk import Sender
+
+from hawkrest.wsgi import HawkWSGIMiddleware
+
+URL = 'http://testserver/api/items/1'
+CONTENT = b'{"name": "example"}'
+CONTENT_TYPE = 'application/json'
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hawkrest.middleware.HawkResponseMiddleware',
+]
+
+
+def sign(**kw):
+    return Sender(kw.pop('credentials', None) or credentials(), URL, 'POST',
+                  content=CONTENT, content_type=CONTENT_TYPE,
+                  **kw).request_header
+
+
+def environ(header):
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/api/items/1',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(CONTENT),
+        'CONTENT_LENGTH': str(len(CONTENT)),
+        'CONTENT_TYPE': CONTENT_TYPE,
+        'HTTP_AUTHORIZATION': header,
+    }
+
+
+def request(application, header, expected_status):
+    statuses = []
+    b''.join(application(environ(header),
+                         lambda status, headers: statuses.append(status)))
+    assert statuses[0].startswith(expected_status), statuses
+
+
+def main():
+    django = WSGIHandler()
+    gate = HawkWSGIMiddleware(django)
+
+    replayed = sign()
+    request(gate, replayed, '200')
+    forged = sign(credentials=dict(credentials(), key='wrong key'))
+    expired = sign(_timestamp='123')
+
+    for label, header in (('replayed', replayed),
+                          ('expired', expired),
+                          ('forged', forged)):
+        drf = bench('{}: rejected by DRF'.format(label),
+                    lambda: request(django, header, '401'),
+                    number=2000, repeat=3)
+        wsgi = bench('{}: rejected by HawkWSGIMiddleware'.format(label),
+                     lambda: request(gate, header, '401'),
+                     number=2000, repeat=3)
+        print('{:<50} {:7.0f} vs {:.0f} rejections/s, {:.1f}x'
+              .format('', 1 / drf, 1 / wsgi, drf / wsgi))
+
+    cache.clear()
+
+
+if __name__ == '__main__':
+    # The default AnonymousUser needs django.contrib.auth.
+    rest_framework = dict(settings.REST_FRAMEWORK, UNAUTHENTICATED_USER=None)
+    with override_settings(ROOT_URLCONF='benchmarks.wsgi_app',
+                           MIDDLEWARE=MIDDLEWARE,
+                           REST_FRAMEWORK=rest_framework):
+        main()
@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+from tests.settings import *  # noqa
+
+# A file database is closer to production than the in-memory test database.
+DATABASES['sqlite'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(tempfile.gettempdir(), 'hawkrest-bench.sqlite3'),
+}
+
+# Point these at a local Postgres instance to benchmark it, for example:
+#
+#   HAWK_BENCH_POSTGRES=hawkrest python -m benchmarks.bench_db_nonce
+if os.environ.get('HAWK_BENCH_POSTGRES'):
+    DATABASES['postgres'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['HAWK_BENCH_POSTGRES'],
+        'HOST': os.environ.get('PGHOST', 'localhost'),
+        'PORT': os.environ.get('PGPORT', ''),
+        'USER': os.environ.get('PGUSER', ''),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+    }
@@ -0,0 +1,21 @@
+"""
+A small DRF API for benchmarks/bench_wsgi_gate.py.
+"""
+from django.urls import path
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class ItemView(APIView):
+
+    def post(self, request, pk):
+        return Response({'id': pk, 'data': request.data})
+
+
+# Some routes to resolve before reaching the view, like a real API has.
+urlpatterns = [
+    path('api/other-{}/<int:pk>'.format(i), ItemView.as_view())
+    for i in range(50)
+] + [
+    path('api/items/<int:pk>', ItemView.as_view()),
+]
@@ -1,28 +1,21 @@
 import logging
-import sys
-import traceback
 
 from django.conf import settings
-from django.core.cache import cache
-
-try:
-    from django.utils.module_loading import import_string
-except ImportError:
-    # compatibility with django < 1.7
-    from django.utils.module_loading import import_by_path
-    import_string = import_by_path
 
 from mohawk import Receiver
 from mohawk.exc import BadHeaderValue, HawkFail, TokenExpired
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
-from hawkrest.util import get_auth_header, is_hawk_request
+from hawkrest.conf import default_message_expiration, hawk_settings
+from hawkrest.events import log_auth_event
+from hawkrest.nonce import CacheNonceStore
+from hawkrest.signals import authentication_timed, is_timed
+from hawkrest.util import (BodySpool, PhaseTimer, can_stream_body,
+                           get_auth_header, is_hawk_request, perf_counter)
 
 
 log = logging.getLogger(__name__)
-# Number of seconds until a Hawk message expires.
-default_message_expiration = 60
 
 
 def default_credentials_lookup(cr_id):
@@ -38,30 +31,38 @@ def default_user_lookup(request, credentials):
 class HawkAuthentication(BaseAuthentication):
 
     def hawk_credentials_lookup(self, cr_id):
-        lookup = default_credentials_lookup
-        lookup_name = getattr(
-            settings,
-            'HAWK_CREDENTIALS_LOOKUP',
-            None)
-        if lookup_name:
-            log.debug('Using custom credentials lookup from: {}'
-                .format(lookup_name))
-            lookup = import_string(lookup_name)
-        return lookup(cr_id)
+        return hawk_settings.credentials_lookup(cr_id)
 
     def hawk_user_lookup(self, request, credentials):
-        lookup = default_user_lookup
-        lookup_name = getattr(
-            settings,
-            'HAWK_USER_LOOKUP',
-            None)
-        if lookup_name:
-            log.debug('Using custom user lookup from: {}'
-                .format(lookup_name))
-            lookup = import_string(lookup_name)
-        return lookup(request, credentials)
+        return hawk_settings.HAWK_USER_LOOKUP(request, credentials)
 
     def authenticate(self, request):
+        receiver = self.verify(request)
+        if receiver is None:
+            return None
+        timer = getattr(receiver, 'timer', None)
+        if timer is None:
+            return self.hawk_user_lookup(request,
+                                         receiver.resource.credentials)
+
+        timer.mark()
+        user = self.hawk_user_lookup(request, receiver.resource.credentials)
+        timer.lap('user_lookup')
+        authentication_timed.send(sender=self.__class__, request=request,
+                                  phases=timer.phases, error=None)
+        return user
+
+    def verify(self, request):
+        """
+        Verifies a Hawk request and returns its receiver, or None if the
+        request doesn't use Hawk. Raises AuthenticationFailed otherwise.
+        """
+        receiver = request.META.get('hawk.receiver')
+        if isinstance(receiver, Receiver):
+            # HawkWSGIMiddleware or an earlier call already verified this
+            # request. Verifying it again would fail the nonce check.
+            return receiver
+
         # In case there is an exception, tell others that the view passed
         # through Hawk authorization. The META dict is used because
         # middleware may not get an identical request object.
@@ -69,49 +70,98 @@ class HawkAuthentication(BaseAuthentication):
         # pollution of META.
         request.META['hawk.receiver'] = None
 
-        http_authorization = get_auth_header(request)
+        http_authorization = self.get_hawk_header(request)
         if not http_authorization:
-            log.debug('no authorization header in request')
-            return None
-        elif not is_hawk_request(request):
-            log.debug('ignoring non-Hawk authorization header: {} '
-                      .format(http_authorization))
             return None
 
+        nonce_store = hawk_settings.nonce_store
+        timer = PhaseTimer() if is_timed(authentication_timed) else None
+        metrics = hawk_settings.metrics
+        if metrics:
+            started = perf_counter()
         try:
-            receiver = Receiver(
+            # Verify the header first so that forged, expired and replayed
+            # requests are rejected before the body is read.
+            receiver = hawk_settings.receiver_class(
                 lambda cr_id: self.hawk_credentials_lookup(cr_id),
                 http_authorization,
                 request.build_absolute_uri(),
                 request.method,
-                content=request.body,
-                seen_nonce=(seen_nonce
-                            if getattr(settings, 'USE_CACHE_FOR_HAWK_NONCE',
-                                       True)
-                            else None),
+                seen_nonce=(nonce_store.seen_nonce
+                            if nonce_store is not None else None),
                 content_type=request.META.get('CONTENT_TYPE', ''),
-                timestamp_skew_in_seconds=getattr(settings,
-                                                  'HAWK_MESSAGE_EXPIRATION',
-                                                  default_message_expiration))
+                timestamp_skew_in_seconds=(
+                    hawk_settings.HAWK_MESSAGE_EXPIRATION),
+                timer=timer)
+            spool = self.verify_body(request, receiver)
         except HawkFail as e:
-            etype, val, tb = sys.exc_info()
-            log.debug(traceback.format_exc())
-            log.warning('access denied: {etype.__name__}: {val}'
-                        .format(etype=etype, val=val))
-            # The exception message is sent to the client as part of the
-            # 401 response, so we're intentionally vague about the original
-            # exception type/value, to avoid assisting attackers.
-            msg = 'Hawk authentication failed'
-            if isinstance(e, BadHeaderValue):
-                msg += ': The request header was malformed'
-            elif isinstance(e, TokenExpired):
-                msg += ': The token has expired. Is your system clock correct?'
-            raise AuthenticationFailed(msg)
+            if metrics:
+                metrics.authenticated(started, error=e)
+            log_auth_event(request, error=e)
+            if timer:
+                authentication_timed.send(sender=self.__class__,
+                                          request=request,
+                                          phases=timer.phases, error=e)
+            raise self.authentication_failed(e)
+
+        if metrics:
+            metrics.authenticated(started)
+        log_auth_event(request, receiver)
+        if spool:
+            spool.restore()
 
         # Pass our receiver object to the middleware so the request header
         # doesn't need to be parsed again.
         request.META['hawk.receiver'] = receiver
-        return self.hawk_user_lookup(request, receiver.resource.credentials)
+        return receiver
+
+    def verify_body(self, request, receiver):
+        """
+        Verifies the request body with a receiver that has verified the
+        header. Returns a BodySpool to restore afterwards, if one was used.
+        """
+        if (hawk_settings.HAWK_STREAM_REQUEST_BODY and
+                can_stream_body(request)):
+            # Hash the body in chunks rather than reading it into memory.
+            spool = BodySpool(request,
+                              hawk_settings.HAWK_BODY_SPOOL_MAX_MEMORY_SIZE)
+            receiver.verify_content(spool)
+            return spool
+        receiver.verify_content(request.body)
+        return None
+
+    def get_hawk_header(self, request):
+        """
+        Returns the Hawk Authorization header or None if the request isn't
+        using Hawk.
+        """
+        http_authorization = get_auth_header(request)
+        if not http_authorization:
+            log.debug('no authorization header in request')
+            return None
+        elif not is_hawk_request(request):
+            log.debug('ignoring non-Hawk authorization header: %s ',
+                      http_authorization)
+            return None
+        return http_authorization
+
+    def authentication_failed(self, exc):
+        """
+        Logs a HawkFail exception, which must be the one being handled,
+        and returns the AuthenticationFailed exception to raise.
+        """
+        # exc_info only formats the traceback if a debug record is emitted.
+        log.debug('Hawk authentication failed', exc_info=True)
+        log.warning('access denied: %s: %s', type(exc).__name__, exc)
+        # The exception message is sent to the client as part of the
+        # 401 response, so we're intentionally vague about the original
+        # exception type/value, to avoid assisting attackers.
+        msg = 'Hawk authentication failed'
+        if isinstance(exc, BadHeaderValue):
+            msg += ': The request header was malformed'
+        elif isinstance(exc, TokenExpired):
+            msg += ': The token has expired. Is your system clock correct?'
+        return AuthenticationFailed(msg)
 
     def authenticate_header(self, request):
         return 'Hawk'
@@ -187,17 +237,8 @@ class HawkAuthenticatedUser(object):
 def seen_nonce(id, nonce, timestamp):
     """
     Returns True if the Hawk nonce has been seen already.
+
+    This checks the default cache. See ``HAWK_NONCE_STORE`` to configure
+    how nonces are stored.
     """
-    key = '{id}:{n}:{ts}'.format(id=id, n=nonce, ts=timestamp)
-    if cache.get(key):
-        log.warning('replay attack? already processed nonce {k}'
-                    .format(k=key))
-        return True
-    else:
-        log.debug('caching nonce {k}'.format(k=key))
-        cache.set(key, True,
-                  # We only need the nonce until the message itself expires.
-                  # This also adds a little bit of padding.
-                  timeout=getattr(settings, 'HAWK_MESSAGE_EXPIRATION',
-                                  default_message_expiration) + 5)
-        return False
+    return CacheNonceStore().seen_nonce(id, nonce, timestamp)
@@ -0,0 +1,325 @@
+"""
+Async versions of the Hawk authentication and middleware for ASGI.
+
+This module requires Python 3 and Django 4.0 or greater.
+"""
+import asyncio
+import functools
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from mohawk import Receiver
+from mohawk.exc import HawkFail
+from mohawk.util import parse_authorization_header
+
+from hawkrest import HawkAuthentication, default_user_lookup
+from hawkrest.conf import hawk_settings
+from hawkrest.credentials import CachedCredentialsLookup
+from hawkrest.events import log_auth_event
+from hawkrest.fastpath import FastHawkReceiver
+from hawkrest.middleware import HawkResponseMiddleware, compress_response
+from hawkrest.nonce import CacheNonceStore
+from hawkrest.receiver import HawkReceiver
+from hawkrest.signals import authentication_timed, is_timed
+from hawkrest.util import FileChunks, PhaseTimer, perf_counter
+
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+
+log = logging.getLogger(__name__)
+
+
+_hash_executor = None
+
+
+def get_hash_executor():
+    """
+    Returns the thread pool for hashing large payloads, which has
+    ``HAWK_ASYNC_HASH_WORKERS`` threads.
+    """
+    global _hash_executor
+    workers = hawk_settings.HAWK_ASYNC_HASH_WORKERS
+    if _hash_executor is None or _hash_executor._max_workers != workers:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(wait=False)
+        _hash_executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='hawk-hash')
+    return _hash_executor
+
+
+async def run_in_hash_pool(func, *args):
+    """
+    Runs ``func(*args)`` on the hash thread pool.
+
+    hashlib releases the GIL while it hashes large buffers so the event
+    loop and other hashes keep running meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_executor(),
+                                      functools.partial(func, *args))
+
+
+def is_large_payload(size):
+    return size >= hawk_settings.HAWK_ASYNC_HASH_THRESHOLD
+
+
+async def aseen_nonce(store, id, nonce, timestamp):
+    """
+    Async version of ``store.seen_nonce()``.
+
+    A store can implement its own ``aseen_nonce()`` method. Otherwise,
+    cache stores use ``cache.aadd()``, stores that don't block are called
+    directly and any other store is called in a thread. That is Django's
+    thread for sync code if the store uses the database, so that its
+    connections are closed like those of any sync view.
+    """
+    if hasattr(store, 'aseen_nonce'):
+        return await store.aseen_nonce(id, nonce, timestamp)
+
+    if type(store).seen_nonce is CacheNonceStore.seen_nonce:
+        key = store.make_key(id, nonce, timestamp)
+        if await store.get_cache(id, nonce).aadd(key, True,
+                                                 timeout=store.timeout):
+            log.debug('cached nonce %s', key)
+            return False
+        log.warning('replay attack? already processed nonce %s', key)
+        return True
+
+    if not store.blocking:
+        return store.seen_nonce(id, nonce, timestamp)
+    return await sync_to_async(
+        store.seen_nonce,
+        thread_sensitive=store.uses_database)(id, nonce, timestamp)
+
+
+def overrides(authentication, name):
+    """
+    Returns True if ``authentication`` overrides the HawkAuthentication
+    method ``name``, which then has to be called, and in a thread since
+    it may well be sync code such as ORM queries.
+    """
+    return getattr(type(authentication), name) is not getattr(
+        HawkAuthentication, name)
+
+
+class AsyncHawkReceiver(HawkReceiver):
+    """
+    A HawkReceiver whose nonce is checked with ``await acheck_nonce()``
+    after the constructor verified the rest of the header.
+    """
+
+    def _check_nonce(self):
+        # See acheck_nonce().
+        pass
+
+    async def acheck_nonce(self, nonce_store):
+        if nonce_store is None:
+            log.warning('seen_nonce was None; not checking nonce. '
+                        'You may be vulnerable to replay attacks')
+            return
+        if await aseen_nonce(nonce_store,
+                             self.resource.credentials['id'],
+                             self.parsed_header['nonce'],
+                             self.parsed_header['ts']):
+            raise self._already_processed()
+        if self.timer:
+            self.timer.lap('nonce')
+
+
+class AsyncFastHawkReceiver(AsyncHawkReceiver, FastHawkReceiver):
+    """
+    AsyncHawkReceiver with the header checks of FastHawkReceiver, used
+    when ``HAWK_FAST_VERIFIER`` is True.
+    """
+
+
+class AsyncHawkAuthentication(HawkAuthentication):
+    """
+    HawkAuthentication with an ``aauthenticate()`` coroutine for async
+    views. For example:
+
+        user, auth = await AsyncHawkAuthentication().aauthenticate(request)
+
+    ``authenticate()`` still works for sync views. Subclasses can override
+    ``ahawk_credentials_lookup()`` and ``ahawk_user_lookup()``.
+    """
+
+    async def ahawk_credentials_lookup(self, cr_id):
+        if not overrides(self, 'hawk_credentials_lookup'):
+            lookup = hawk_settings.credentials_lookup
+            if iscoroutinefunction(lookup):
+                return await lookup(cr_id)
+            if isinstance(lookup, CachedCredentialsLookup):
+                credentials = lookup.get_cached(cr_id)
+                if credentials is not None:
+                    return credentials
+        return await sync_to_async(self.hawk_credentials_lookup)(cr_id)
+
+    async def ahawk_user_lookup(self, request, credentials):
+        if not overrides(self, 'hawk_user_lookup'):
+            lookup = hawk_settings.HAWK_USER_LOOKUP
+            if iscoroutinefunction(lookup):
+                return await lookup(request, credentials)
+            if lookup is default_user_lookup:
+                # This doesn't do any I/O.
+                return self.hawk_user_lookup(request, credentials)
+        return await sync_to_async(self.hawk_user_lookup)(request,
+                                                          credentials)
+
+    async def averify_body(self, request, receiver):
+        """
+        Async version of ``verify_body()`` that hashes large bodies on the
+        hash thread pool and small ones inline.
+        """
+        # ASGI request bodies have already been received so this only
+        # needs to know how big they are.
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            size = 0
+        if is_large_payload(size):
+            return await run_in_hash_pool(self.verify_body, request, receiver)
+        return self.verify_body(request, receiver)
+
+    async def aauthenticate(self, request):
+        # See verify().
+        receiver = request.META.get('hawk.receiver')
+        if isinstance(receiver, Receiver):
+            return await self.auser_lookup(request, receiver)
+
+        request.META['hawk.receiver'] = None
+
+        http_authorization = self.get_hawk_header(request)
+        if not http_authorization:
+            return None
+
+        timer = PhaseTimer() if is_timed(authentication_timed) else None
+        metrics = hawk_settings.metrics
+        if metrics:
+            started = perf_counter()
+        try:
+            cr_id = parse_authorization_header(http_authorization)['id']
+            try:
+                credentials = await self.ahawk_credentials_lookup(cr_id)
+                lookup_error = None
+            except LookupError as exc:
+                credentials, lookup_error = None, exc
+            if timer:
+                timer.lap('credentials_lookup')
+
+            def credentials_map(cr_id):
+                if lookup_error is not None:
+                    raise lookup_error
+                return credentials
+
+            receiver_class = (AsyncFastHawkReceiver
+                              if hawk_settings.HAWK_FAST_VERIFIER
+                              else AsyncHawkReceiver)
+            receiver = receiver_class(
+                credentials_map,
+                http_authorization,
+                request.build_absolute_uri(),
+                request.method,
+                content_type=request.META.get('CONTENT_TYPE', ''),
+                timestamp_skew_in_seconds=(
+                    hawk_settings.HAWK_MESSAGE_EXPIRATION),
+                timer=timer)
+            await receiver.acheck_nonce(hawk_settings.nonce_store)
+            spool = await self.averify_body(request, receiver)
+        except HawkFail as e:
+            if metrics:
+                metrics.authenticated(started, error=e)
+            log_auth_event(request, error=e)
+            if timer:
+                authentication_timed.send(sender=self.__class__,
+                                          request=request,
+                                          phases=timer.phases, error=e)
+            raise self.authentication_failed(e)
+
+        if metrics:
+            metrics.authenticated(started)
+        log_auth_event(request, receiver)
+        if spool:
+            spool.restore()
+
+        request.META['hawk.receiver'] = receiver
+        return await self.auser_lookup(request, receiver)
+
+    async def auser_lookup(self, request, receiver):
+        # See authenticate().
+        timer = getattr(receiver, 'timer', None)
+        if timer is None:
+            return await self.ahawk_user_lookup(
+                request, receiver.resource.credentials)
+
+        timer.mark()
+        user = await self.ahawk_user_lookup(request,
+                                            receiver.resource.credentials)
+        timer.lap('user_lookup')
+        authentication_timed.send(sender=self.__class__, request=request,
+                                  phases=timer.phases, error=None)
+        return user
+
+
+async def spool_async_content(streaming_content, spool, payload_hash=None):
+    """
+    Copies async streaming content to ``spool`` and, if given, hashes it
+    with ``payload_hash`` on the way.
+    """
+    async for chunk in streaming_content:
+        if payload_hash is not None:
+            payload_hash.update(chunk)
+        spool.write(chunk)
+
+
+class AsyncHawkResponseMiddleware(HawkResponseMiddleware):
+    """
+    HawkResponseMiddleware that signs responses on the event loop under
+    ASGI rather than in a thread.
+
+    Responses of at least ``HAWK_ASYNC_HASH_THRESHOLD`` bytes and those
+    that stream from a file are signed on the hash thread pool. Responses
+    that stream from a sync iterator, which may need Django's thread for
+    sync code, are signed in that thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if not request.META.get('hawk.receiver'):
+            return self.process_response(request, response)
+
+        if not response.streaming:
+            if is_large_payload(len(response.content)):
+                return await run_in_hash_pool(self.process_response,
+                                              request, response)
+            return self.process_response(request, response)
+
+        if response.is_async:
+            response = await self.aspool_streaming_content(request, response)
+        if getattr(response, 'file_to_stream', None) is not None:
+            return await run_in_hash_pool(self.process_response,
+                                          request, response)
+        return await sync_to_async(self.process_response)(request, response)
+
+    async def aspool_streaming_content(self, request, response):
+        """
+        Copies async streaming content to a temporary file so that
+        process_response() can hash it in place.
+        """
+        if hawk_settings.HAWK_COMPRESS_RESPONSES:
+            response = compress_response(request, response)
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=hawk_settings.HAWK_BODY_SPOOL_MAX_MEMORY_SIZE)
+        await spool_async_content(response.streaming_content, spool)
+        spool.seek(0)
+        response.streaming_content = FileChunks(spool)
+        # This is what process_response() looks for on a FileResponse.
+        response.file_to_stream = spool
+        return response
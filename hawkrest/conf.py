@@ -0,0 +1,196 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    # compatibility with django < 1.7
+    from django.utils.module_loading import import_by_path
+    import_string = import_by_path
+
+from hawkrest.credentials import CachedCredentialsLookup
+from hawkrest.fastpath import FastHawkReceiver
+from hawkrest.manifest import PayloadHashManifest
+from hawkrest.metrics import DEFAULT_BUCKETS, MetricsRegistry
+from hawkrest.receiver import HawkReceiver, PayloadHashCache
+
+
+log = logging.getLogger(__name__)
+# Number of seconds until a Hawk message expires.
+default_message_expiration = 60
+
+DEFAULTS = {
+    # Read by hawkrest.default_credentials_lookup. Listed here so that
+    # changing it drops cached credentials.
+    'HAWK_CREDENTIALS': {},
+    'HAWK_CREDENTIALS_LOOKUP': 'hawkrest.default_credentials_lookup',
+    'HAWK_USER_LOOKUP': 'hawkrest.default_user_lookup',
+    'HAWK_MESSAGE_EXPIRATION': default_message_expiration,
+    'USE_CACHE_FOR_HAWK_NONCE': True,
+    'HAWK_NONCE_STORE': 'hawkrest.nonce.CacheNonceStore',
+    'HAWK_NONCE_STORE_OPTIONS': {},
+    # Set to a dict to memoize HAWK_CREDENTIALS_LOOKUP. See usage docs.
+    'HAWK_CREDENTIALS_CACHE': None,
+    'HAWK_STREAM_REQUEST_BODY': False,
+    # Same as Django's FILE_UPLOAD_MAX_MEMORY_SIZE default.
+    'HAWK_BODY_SPOOL_MAX_MEMORY_SIZE': 2621440,
+    # Set to a dict to cache response payload hashes. See usage docs.
+    'HAWK_RESPONSE_HASH_CACHE': None,
+    # Path to a manifest written by the hawkmanifest command.
+    'HAWK_PAYLOAD_MANIFEST': None,
+    'HAWK_COMPRESS_RESPONSES': False,
+    # Under ASGI, payloads of at least this many bytes are hashed on a
+    # thread pool of HAWK_ASYNC_HASH_WORKERS threads. See hawkrest.aio.
+    'HAWK_ASYNC_HASH_THRESHOLD': 1048576,
+    'HAWK_ASYNC_HASH_WORKERS': 4,
+    # Paths that hawkrest.wsgi.HawkWSGIMiddleware verifies.
+    'HAWK_WSGI_PATH_PREFIXES': ('/',),
+    # Verify requests with hawkrest.fastpath.FastHawkReceiver.
+    'HAWK_FAST_VERIFIER': False,
+    # Set to a dict to record Hawk metrics. See usage docs.
+    'HAWK_METRICS': None,
+}
+
+# Settings that hold a dotted path which must be imported.
+IMPORT_STRINGS = (
+    'HAWK_CREDENTIALS_LOOKUP',
+    'HAWK_USER_LOOKUP',
+    'HAWK_NONCE_STORE',
+)
+
+
+class HawkSettings(object):
+    """
+    Hawk settings, resolved once and then cached as attributes.
+
+    Reading ``django.conf.settings`` and importing dotted paths on every
+    request adds measurable overhead so this object does it the first
+    time an attribute is accessed. For example:
+
+        from hawkrest.conf import hawk_settings
+        lookup = hawk_settings.HAWK_CREDENTIALS_LOOKUP
+
+    Lower case attributes are objects derived from those settings and
+    are built by the ``resolve_<name>()`` method of the same name.
+
+    The cache is cleared whenever Django sends ``setting_changed``
+    for one of the settings above, which is what
+    ``override_settings()`` does in tests.
+    """
+
+    def __init__(self, defaults=None, import_strings=None):
+        self.defaults = defaults or DEFAULTS
+        self.import_strings = import_strings or IMPORT_STRINGS
+        self._cached_attrs = set()
+        # Reentrant because resolving one attribute reads others.
+        self._lock = threading.RLock()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self.defaults:
+            val = self.get_setting(attr)
+        else:
+            resolve = getattr(type(self), 'resolve_{}'.format(attr), None)
+            if not resolve:
+                raise AttributeError('Invalid Hawk setting: {}'.format(attr))
+            with self._lock:
+                # Objects like the nonce store keep state, so two threads
+                # must not each build one.
+                if attr in self.__dict__:
+                    return self.__dict__[attr]
+                val = resolve(self)
+                self._cached_attrs.add(attr)
+                setattr(self, attr, val)
+                return val
+
+        with self._lock:
+            self._cached_attrs.add(attr)
+            setattr(self, attr, val)
+        return val
+
+    def get_setting(self, attr):
+        val = getattr(settings, attr, None)
+        if val is None:
+            val = self.defaults[attr]
+        elif attr in self.import_strings:
+            log.debug('Using custom %s from: %s', attr, val)
+
+        if attr in self.import_strings:
+            val = import_string(val)
+        return val
+
+    def resolve_credentials_lookup(self):
+        lookup = self.HAWK_CREDENTIALS_LOOKUP
+        cache_options = self.HAWK_CREDENTIALS_CACHE
+        if cache_options:
+            lookup = CachedCredentialsLookup(
+                lookup,
+                max_size=cache_options.get('MAX_SIZE', 1000),
+                timeout=cache_options.get('TIMEOUT', 60),
+                negative_timeout=cache_options.get('NEGATIVE_TIMEOUT', 5))
+        return lookup
+
+    def resolve_receiver_class(self):
+        if self.HAWK_FAST_VERIFIER:
+            return FastHawkReceiver
+        return HawkReceiver
+
+    def resolve_response_hash_cache(self):
+        cache_options = self.HAWK_RESPONSE_HASH_CACHE
+        if not cache_options:
+            return None
+        return PayloadHashCache(
+            max_size=cache_options.get('MAX_SIZE', 1000),
+            use_checksum=cache_options.get('USE_CHECKSUM', False))
+
+    def resolve_payload_manifest(self):
+        path = self.HAWK_PAYLOAD_MANIFEST
+        if not path:
+            return None
+        try:
+            return PayloadHashManifest.load(path)
+        except (IOError, OSError, ValueError) as exc:
+            log.warning('Could not load HAWK_PAYLOAD_MANIFEST %s: %s',
+                        path, exc)
+            return None
+
+    def resolve_metrics(self):
+        options = self.HAWK_METRICS
+        if options is None:
+            return None
+        return MetricsRegistry(
+            buckets=options.get('BUCKETS', DEFAULT_BUCKETS),
+            multiprocess_dir=options.get('MULTIPROCESS_DIR'),
+            flush_interval=options.get('FLUSH_INTERVAL', 5))
+
+    def resolve_nonce_store(self):
+        if not self.USE_CACHE_FOR_HAWK_NONCE:
+            return None
+        return self.HAWK_NONCE_STORE(**self.HAWK_NONCE_STORE_OPTIONS)
+
+    def reload(self):
+        with self._lock:
+            for attr in self._cached_attrs:
+                val = self.__dict__.pop(attr)
+                if attr in ('nonce_store', 'metrics'):
+                    # Release the threads, files and pools of the old
+                    # store or registry.
+                    close = getattr(val, 'close', None)
+                    if close:
+                        close()
+            self._cached_attrs.clear()
+
+
+hawk_settings = HawkSettings()
+
+
+def reload_hawk_settings(*args, **kwargs):
+    if kwargs['setting'] in hawk_settings.defaults:
+        hawk_settings.reload()
+
+
+setting_changed.connect(reload_hawk_settings)
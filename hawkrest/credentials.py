@@ -0,0 +1,104 @@
+import logging
+
+from hawkrest.util import LRUCache, get_hawk_setting
+
+
+log = logging.getLogger(__name__)
+
+
+class CachedCredentialsLookup(object):
+    """
+    Memoizes a Hawk credentials lookup function.
+
+    Found credentials are kept for ``timeout`` seconds. IDs that raise
+    ``LookupError`` are remembered separately for ``negative_timeout``
+    seconds so that a flood of unknown IDs can't reach the underlying
+    lookup (for example, your database) nor evict valid credentials.
+    """
+
+    def __init__(self, lookup, max_size=1000, timeout=60,
+                 negative_timeout=5):
+        self.lookup = lookup
+        self.hits = 0
+        self.misses = 0
+        self.found = LRUCache(max_size, timeout=timeout)
+        self.not_found = None
+        if negative_timeout:
+            self.not_found = LRUCache(max_size, timeout=negative_timeout)
+
+    def __call__(self, cr_id):
+        credentials = self.get_cached(cr_id)
+        if credentials is not None:
+            return credentials
+
+        self.misses += 1
+        try:
+            credentials = self.lookup(cr_id)
+        except LookupError as exc:
+            if self.not_found is not None:
+                log.debug('caching failed credentials lookup for %s', cr_id)
+                self.not_found.set(cr_id, str(exc))
+            raise
+
+        self.found.set(cr_id, credentials)
+        return credentials
+
+    def get_cached(self, cr_id):
+        """
+        Returns cached credentials or None without calling the lookup.
+
+        Raises ``LookupError`` if the ID is cached as unknown.
+        """
+        credentials = self.found.get(cr_id)
+        if credentials is not None:
+            self.hits += 1
+            return credentials
+
+        if self.not_found is not None:
+            error = self.not_found.get(cr_id)
+            if error is not None:
+                self.hits += 1
+                raise LookupError(error)
+        return None
+
+    def invalidate(self, cr_id):
+        """
+        Forget any cached result for the credentials ID.
+        """
+        self.found.delete(cr_id)
+        if self.not_found is not None:
+            self.not_found.delete(cr_id)
+
+    def clear(self):
+        """
+        Forget all cached results.
+        """
+        self.found.clear()
+        if self.not_found is not None:
+            self.not_found.clear()
+
+
+def get_credentials_cache():
+    """
+    Returns the active CachedCredentialsLookup or None if
+    ``HAWK_CREDENTIALS_CACHE`` is not configured.
+    """
+    lookup = get_hawk_setting('credentials_lookup')
+    if isinstance(lookup, CachedCredentialsLookup):
+        return lookup
+    return None
+
+
+def invalidate_credentials(cr_id=None):
+    """
+    Drop cached credentials for one ID or, when cr_id is None, for all IDs.
+
+    Call this when credentials are changed or revoked.
+    """
+    cache = get_credentials_cache()
+    if cache is None:
+        return
+    if cr_id is None:
+        cache.clear()
+    else:
+        cache.invalidate(cr_id)
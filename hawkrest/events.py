@@ -0,0 +1,120 @@
+"""
+Structured Hawk authentication events.
+
+When the ``hawkrest.events`` logger is set to INFO, HawkAuthentication
+logs an event for every Hawk request it verifies or rejects. Events are
+off by default: the logger starts at WARNING so that it doesn't pick up
+INFO from the ``hawkrest`` or root logger. The event is
+the record's ``hawk_event`` attribute, a dict with ``outcome``, ``reason``,
+``id``, ``method`` and ``path`` keys.
+
+``start_event_queue()`` sends those events through a QueueHandler so that
+formatting them and writing them out happens on a background thread
+rather than the request thread.
+"""
+import logging
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:  # Python 2
+    QueueHandler = QueueListener = None
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from django.core.exceptions import ImproperlyConfigured
+
+from hawkrest.metrics import failure_reason
+
+
+# Events are opt-in, unless the logger was configured before this import.
+DEFAULT_LEVEL = logging.WARNING
+
+event_log = logging.getLogger('hawkrest.events')
+if event_log.level == logging.NOTSET:
+    event_log.setLevel(DEFAULT_LEVEL)
+_listener = None
+_queue_handler = None
+# The level and propagate flag of the events logger before the queue.
+_restore = None
+
+
+def log_auth_event(request, receiver=None, error=None):
+    """
+    Logs a verified Hawk request, or a rejected one if ``error`` is the
+    HawkFail exception, when the events logger is enabled.
+    """
+    if not event_log.isEnabledFor(logging.INFO):
+        return
+    if error is None:
+        event = {'outcome': 'success', 'reason': None,
+                 'id': receiver.resource.credentials['id']}
+    else:
+        event = {'outcome': 'failure', 'reason': failure_reason(error),
+                 'id': None}
+    event['method'] = request.method
+    event['path'] = request.path
+    # The dict is only formatted into the message if a handler emits it.
+    event_log.info('Hawk authentication %(outcome)s: %(method)s %(path)s '
+                   '(id=%(id)s reason=%(reason)s)', event,
+                   extra={'hawk_event': event})
+
+
+if QueueHandler is not None:
+
+    class EventQueueHandler(QueueHandler):
+        """
+        A QueueHandler that leaves records as they are.
+
+        QueueHandler formats each record before queueing it, in case it
+        has to be pickled. Events stay in this process so the formatting
+        is left to the listener's handlers, on the listener's thread.
+        """
+
+        def prepare(self, record):
+            return record
+
+
+def start_event_queue(*handlers):
+    """
+    Logs Hawk authentication events to ``handlers`` on a background
+    thread and returns the started QueueListener.
+
+    This sets the events logger to INFO. It no longer propagates to its
+    parents, so these handlers are the only ones that see events. Call
+    ``stop_event_queue()`` on shutdown to write out queued events.
+    """
+    global _listener, _queue_handler, _restore
+    if QueueHandler is None:
+        raise ImproperlyConfigured('The Hawk event queue requires Python 3')
+    stop_event_queue()
+
+    # Unbounded, so that a slow handler never blocks or drops requests.
+    event_queue = queue.Queue(-1)
+    _listener = QueueListener(event_queue, *handlers,
+                              respect_handler_level=True)
+    _queue_handler = EventQueueHandler(event_queue)
+    event_log.addHandler(_queue_handler)
+    _restore = event_log.level, event_log.propagate
+    event_log.setLevel(logging.INFO)
+    event_log.propagate = False
+    _listener.start()
+    return _listener
+
+
+def stop_event_queue():
+    """
+    Stops the listener started by ``start_event_queue()`` once it has
+    handled all queued events, and puts the events logger back the way
+    it was.
+    """
+    global _listener, _queue_handler, _restore
+    if _listener is None:
+        return
+    event_log.removeHandler(_queue_handler)
+    level, event_log.propagate = _restore
+    event_log.setLevel(level)
+    _listener.stop()
+    _listener = _queue_handler = _restore = None
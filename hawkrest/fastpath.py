@@ -0,0 +1,228 @@
+"""
+A faster HawkReceiver for the common case.
+
+mohawk parses headers with a regular expression, parses the URL with
+``urlparse()``, formats both for debug logs and creates a new HMAC object
+for every request. ``FastHawkReceiver`` does the same work more directly
+for sha256 credentials, plain http(s) URLs and well formed headers. For
+anything else, each step falls back to mohawk so the results and
+exceptions are the same either way. Turn it on with
+``HAWK_FAST_VERIFIER = True``.
+"""
+import hashlib
+import hmac
+import logging
+import re
+from base64 import b64encode
+
+try:
+    from urllib.parse import urlparse
+except ImportError:  # Python 2
+    from urlparse import urlparse
+
+from mohawk.base import EmptyValue, Resource
+from mohawk.exc import MacMismatch
+from mohawk.util import (HAWK_VER, MAX_LENGTH, allowable_header_keys,
+                         prepare_header_val)
+
+from hawkrest.receiver import HawkReceiver
+from hawkrest.util import LRUCache
+
+
+log = logging.getLogger(__name__)
+
+# The characters mohawk allows in header values: printable ASCII except
+# for double quotes and backslashes.
+_header_value = re.compile(r'[ !#-\[\]-~]*\Z')
+# URL characters that urlparse() strips or treats specially.
+_unusual_url_chars = re.compile(r'[\x00-\x20#;\x7f]')
+_default_ports = {'http': '80', 'https': '443'}
+_header_mac_prefix = 'hawk.{ver}.header\n'.format(ver=HAWK_VER)
+
+# Keyed HMAC objects by key and the normalized host and port by origin.
+_keyed_macs = LRUCache(1000)
+_origins = LRUCache(1000)
+
+
+def parse_header(header):
+    """
+    Parses a Hawk Authorization header into a dict like mohawk's
+    ``parse_authorization_header()``.
+
+    Only accepts attributes separated by a comma and spaces. Returns None
+    for anything else, including headers mohawk would reject.
+    """
+    if (not isinstance(header, str) or len(header) > MAX_LENGTH or
+            not header.startswith('Hawk ')):
+        return None
+
+    attributes = {}
+    pos = 5
+    end = len(header)
+    while pos < end:
+        equals = header.find('="', pos)
+        if equals < 0:
+            return None
+        key = header[pos:equals]
+        if key not in allowable_header_keys or key in attributes:
+            return None
+        quote = header.find('"', equals + 2)
+        if quote < 0:
+            return None
+        value = header[equals + 2:quote]
+        if not _header_value.match(value):
+            return None
+        attributes[key] = value
+
+        pos = quote + 1
+        while pos < end and header[pos] == ' ':
+            pos += 1
+        if pos < end:
+            if header[pos] != ',':
+                return None
+            pos += 1
+            while pos < end and header[pos] == ' ':
+                pos += 1
+    return attributes
+
+
+def parse_origin(origin):
+    """
+    Returns the normalized ``host\\nport`` of a URL's scheme and host,
+    as mohawk would compute it, or None.
+    """
+    normalized = _origins.get(origin)
+    if normalized is None:
+        parts = urlparse(origin)
+        try:
+            port = parts.port
+        except ValueError:
+            return None
+        port = (str(port) if port is not None
+                else _default_ports.get(parts.scheme))
+        if port is None:
+            return None
+        normalized = '{host}\n{port}'.format(host=parts.hostname or '',
+                                             port=port)
+        _origins.set(origin, normalized)
+    return normalized
+
+
+def split_url(url):
+    """
+    Splits a URL into its normalized ``host\\nport`` and its resource
+    (path and query string), as mohawk would, or returns None if the URL
+    is unusual.
+    """
+    if not isinstance(url, str) or _unusual_url_chars.search(url):
+        return None
+    scheme_end = url.find('://')
+    if url[:scheme_end] not in _default_ports:
+        return None
+    path_start = url.find('/', scheme_end + 3)
+    if path_start < 0:
+        return None
+    origin = url[:path_start]
+    name = url[path_start:]
+    # urlparse() drops an empty query string and would see a host with
+    # a query string differently.
+    if '?' in origin or name.endswith('?'):
+        return None
+    normalized_origin = parse_origin(origin)
+    if normalized_origin is None:
+        return None
+    return normalized_origin, name
+
+
+def keyed_mac(key):
+    """
+    Returns a sha256 HMAC object that has processed the key, to be
+    copied for each message.
+    """
+    mac = _keyed_macs.get(key)
+    if mac is None:
+        mac = hmac.new(key, digestmod=hashlib.sha256)
+        _keyed_macs.set(key, mac)
+    return mac
+
+
+class FastHawkReceiver(HawkReceiver):
+    """
+    A HawkReceiver that verifies common sha256 requests without mohawk's
+    generic parsing. See the module docstring.
+    """
+
+    def _parse_header(self, request_header):
+        parsed_header = parse_header(request_header)
+        if parsed_header is None:
+            log.debug('Falling back to mohawk to parse the header')
+            return super(FastHawkReceiver, self)._parse_header(
+                request_header)
+        return parsed_header
+
+    def _make_resource(self, **kw):
+        url_parts = split_url(kw['url'])
+        if url_parts is None or not kw['timestamp'] or not kw['nonce']:
+            log.debug('Falling back to mohawk for the resource')
+            return super(FastHawkReceiver, self)._make_resource(**kw)
+
+        # The same attributes Resource.__init__() sets, without parsing
+        # and logging the URL.
+        resource = Resource.__new__(Resource)
+        resource.credentials = kw['credentials']
+        resource.credentials['id'] = prepare_header_val(
+            resource.credentials['id'])
+        resource.method = kw['method'].upper()
+        resource.content = EmptyValue
+        resource.content_type = kw.get('content_type', EmptyValue)
+        resource.always_hash_content = True
+        resource.ext = kw.get('ext')
+        resource.app = kw.get('app')
+        resource.dlg = kw.get('dlg')
+        resource.timestamp = str(kw['timestamp'])
+        resource.nonce = kw['nonce']
+        resource.seen_nonce = kw.get('seen_nonce')
+        resource.url = kw['url']
+        resource._normalized_origin, resource.name = url_parts
+        resource.host, resource.port = resource._normalized_origin.split('\n')
+        return resource
+
+    def _strings_match(self, ours, theirs):
+        # Header values only have ASCII characters. Comparing them in C
+        # is much faster than mohawk's strings_match() and also takes
+        # constant time.
+        return hmac.compare_digest(ours, theirs.encode('ascii'))
+
+    def _check_header_mac(self):
+        resource = self.resource
+        key = resource.credentials['key']
+        if isinstance(key, str):
+            try:
+                key = key.encode('ascii')
+            except UnicodeEncodeError:
+                key = None
+        if (resource.credentials['algorithm'] != 'sha256' or
+                not isinstance(key, bytes) or
+                not hasattr(resource, '_normalized_origin')):
+            return super(FastHawkReceiver, self)._check_header_mac()
+
+        parsed_header = self.parsed_header
+        normalized = [_header_mac_prefix,
+                      resource.timestamp, '\n',
+                      resource.nonce, '\n',
+                      resource.method, '\n',
+                      resource.name, '\n',
+                      resource._normalized_origin, '\n',
+                      parsed_header.get('hash', ''), '\n',
+                      resource.ext or '', '\n']
+        if resource.app:
+            normalized.extend([resource.app, '\n', resource.dlg or '', '\n'])
+
+        mac = keyed_mac(key).copy()
+        mac.update(''.join(normalized).encode('utf8'))
+        mac = b64encode(mac.digest())
+        their_mac = parsed_header.get('mac', '')
+        if not self._strings_match(mac, their_mac):
+            raise MacMismatch('MACs do not match; ours: {ours}; '
+                              'theirs: {theirs}'
+                              .format(ours=mac, theirs=their_mac))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from hawkrest.conf import hawk_settings
+from hawkrest.nonce import DatabaseNonceStore
+
+
+class Command(BaseCommand):
+    help = ('Delete expired Hawk nonces stored by '
+            'hawkrest.nonce.DatabaseNonceStore')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='store',
+            type=str,
+            help='Database alias to clean up. Default: the one used by '
+                 'HAWK_NONCE_STORE_OPTIONS or "default".')
+
+    def handle(self, *args, **options):
+        store = hawk_settings.nonce_store
+        if not isinstance(store, DatabaseNonceStore):
+            store = DatabaseNonceStore(cleanup=False)
+        if options['database']:
+            store = DatabaseNonceStore(
+                using=options['database'],
+                partition_seconds=store.partition_seconds,
+                cleanup=False)
+
+        deleted = store.delete_expired()
+        self.stdout.write('Deleted {n} expired nonces from database {db}'
+                          .format(n=deleted, db=store.using))
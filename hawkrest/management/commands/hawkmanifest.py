@@ -0,0 +1,80 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hawkrest.conf import hawk_settings
+from hawkrest.manifest import PayloadHashManifest
+
+
+def default_algorithms():
+    credentials = getattr(settings, 'HAWK_CREDENTIALS', None) or {}
+    algorithms = set(cr['algorithm'] for cr in credentials.values()
+                     if 'algorithm' in cr)
+    return sorted(algorithms) or ['sha256']
+
+
+def default_directories():
+    return [directory for directory in (getattr(settings, 'STATIC_ROOT', None),
+                                        getattr(settings, 'MEDIA_ROOT', None))
+            if directory]
+
+
+class Command(BaseCommand):
+    help = ('Write a manifest of Hawk payload hashes for files served '
+            'with FileResponse. See HAWK_PAYLOAD_MANIFEST.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directories',
+            nargs='*',
+            help='Directories to walk. Default: STATIC_ROOT and MEDIA_ROOT.')
+        parser.add_argument(
+            '--output',
+            action='store',
+            type=str,
+            help='Manifest file to write. Default: HAWK_PAYLOAD_MANIFEST.')
+        parser.add_argument(
+            '--algorithm',
+            action='append',
+            dest='algorithms',
+            help='Hash algorithm, can be repeated. Default: the algorithms '
+                 'used in HAWK_CREDENTIALS or sha256.')
+        parser.add_argument(
+            '--content-type',
+            action='append',
+            dest='content_types',
+            help='Also hash files for this Content-Type, can be repeated. '
+                 'Each file is always hashed for its guessed Content-Type.')
+
+    def handle(self, *args, **options):
+        output = options['output'] or hawk_settings.HAWK_PAYLOAD_MANIFEST
+        if not output:
+            raise CommandError('Set HAWK_PAYLOAD_MANIFEST or pass --output')
+
+        directories = options['directories'] or default_directories()
+        if not directories:
+            raise CommandError('No directories given and neither '
+                               'STATIC_ROOT nor MEDIA_ROOT is set')
+        for directory in directories:
+            if not os.path.isdir(directory):
+                raise CommandError('Not a directory: {}'.format(directory))
+
+        manifest = PayloadHashManifest()
+        if os.path.exists(output):
+            # Files that haven't changed don't need to be hashed again.
+            try:
+                manifest = PayloadHashManifest.load(output)
+            except ValueError as exc:
+                self.stderr.write('Ignoring existing manifest: {}'
+                                  .format(exc))
+        manifest.prune()
+
+        algorithms = options['algorithms'] or default_algorithms()
+        hashed = 0
+        for directory in directories:
+            hashed += manifest.add_directory(directory, algorithms,
+                                             options['content_types'])
+        manifest.save(output)
+        self.stdout.write('Hashed {n} files; wrote {total} entries to {path}'
+                          .format(n=hashed, total=len(manifest), path=output))
@@ -1,9 +1,15 @@
 import logging
+import math
+import threading
+import zlib
+from collections import Counter
 
 from django.core.management.base import BaseCommand, CommandError
 from mohawk import Sender
+from mohawk.exc import HawkFail
 
 from hawkrest import HawkAuthentication
+from hawkrest.util import perf_counter
 
 
 DEFAULT_HTTP_METHOD = 'GET'
@@ -29,31 +35,205 @@ CMD_OPTIONS = {
         'action': 'store',
         'type': str,
         'help': 'Query string parameters.'
-    }
+    },
+    '--count': {
+        'action': 'store',
+        'type': int,
+        'help': 'Load test: send this many requests.'
+    },
+    '--duration': {
+        'action': 'store',
+        'type': float,
+        'help': 'Load test: send requests for this many seconds.'
+    },
+    '--concurrency': {
+        'action': 'store',
+        'type': int,
+        'help': 'Load test: number of concurrent workers. Default: 1.',
+        'default': 1
+    },
 }
 
+# Load test workers sign this many requests at a time before sending them.
+# Signing them all up front would let them expire during long tests.
+SIGNING_BATCH_SIZE = 50
+
 
 def get_requests_module():
     import requests
     return requests
 
 
-def request(url, method, data, headers):
+def import_requests():
     try:
-        requests = get_requests_module()
+        return get_requests_module()
     except ImportError:
         raise CommandError('To use this command you first need to '
                            'install the requests module')
 
+
+def request(url, method, data, headers):
+    requests = import_requests()
     do_request = getattr(requests, method.lower())
-    res = do_request(url, data=data, headers=headers)
+    # Stream so that the body can be read exactly as it was sent.
+    res = do_request(url, data=data, headers=headers, stream=True)
     return res
 
 
+def read_wire_content(res):
+    """
+    Returns the response body as it was sent, without decoding any
+    Content-Encoding. This is what the server signed.
+    """
+    if res.raw is None:
+        return res.content or b''
+    return res.raw.read(decode_content=False)
+
+
+def decode_content(res, content):
+    if res.headers.get('Content-Encoding', '').lower() == 'gzip':
+        content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    return content.decode(res.encoding or 'utf-8', 'replace')
+
+
 def lookup_credentials(creds_key):
     return HawkAuthentication().hawk_credentials_lookup(creds_key)
 
 
+def percentile(sorted_values, percent):
+    """
+    Returns the nearest-rank percentile of a sorted, non-empty list.
+    """
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class LoadResults(object):
+    """
+    What a load test worker saw. Each worker has its own so that recording
+    a request takes no lock.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.verified = 0
+        self.errors = Counter()
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.verified += other.verified
+        self.errors.update(other.errors)
+
+
+class LoadTest(object):
+    """
+    Sends freshly signed requests from ``concurrency`` threads until
+    ``count`` requests were sent or ``duration`` seconds passed.
+
+    Each worker keeps its connections alive with its own requests.Session
+    and signs its requests in batches, before it starts timing them.
+    """
+
+    def __init__(self, credentials, url, method, content, content_type,
+                 count=None, duration=None, concurrency=1):
+        self.credentials = credentials
+        self.url = url
+        self.method = method.upper()
+        self.content = content
+        self.content_type = content_type
+        self.remaining = count
+        self.duration = duration
+        self.concurrency = concurrency
+        self.deadline = None
+        self.lock = threading.Lock()
+
+    def claim(self, n):
+        """
+        Returns how many of ``n`` more requests a worker may send.
+        """
+        if self.deadline is not None and perf_counter() >= self.deadline:
+            return 0
+        if self.remaining is None:
+            return n
+        with self.lock:
+            n = min(n, self.remaining)
+            self.remaining -= n
+        return n
+
+    def sign(self):
+        sender = Sender(self.credentials, self.url, self.method,
+                        content=self.content,
+                        content_type=self.content_type)
+        return sender, {'Authorization': sender.request_header,
+                        'Content-Type': self.content_type}
+
+    def send(self, session, sender, headers, results):
+        start = perf_counter()
+        try:
+            res = session.request(self.method, self.url, data=self.content,
+                                  headers=headers, stream=True)
+            # Reading the whole body returns the connection to the pool.
+            content = read_wire_content(res)
+        except IOError as exc:
+            # Including requests' RequestException.
+            results.latencies.append(perf_counter() - start)
+            results.errors[type(exc).__name__] += 1
+            return
+        results.latencies.append(perf_counter() - start)
+        results.statuses[res.status_code] += 1
+
+        auth_hdr = res.headers.get('Server-Authorization', None)
+        if auth_hdr:
+            try:
+                sender.accept_response(
+                    auth_hdr, content=content,
+                    content_type=res.headers.get('Content-Type', ''))
+            except HawkFail:
+                pass
+            else:
+                results.verified += 1
+
+    def work(self, session, results):
+        try:
+            while True:
+                n = self.claim(SIGNING_BATCH_SIZE)
+                if not n:
+                    return
+                batch = [self.sign() for _ in range(n)]
+                for sender, headers in batch:
+                    if (self.deadline is not None and
+                            perf_counter() >= self.deadline):
+                        return
+                    self.send(session, sender, headers, results)
+        finally:
+            session.close()
+
+    def run(self, requests):
+        """
+        Runs the load test and returns the merged LoadResults and the
+        number of seconds it took.
+        """
+        worker_results = [LoadResults() for _ in range(self.concurrency)]
+        workers = [threading.Thread(target=self.work,
+                                    args=(requests.Session(), results))
+                   for results in worker_results]
+        start = perf_counter()
+        if self.duration is not None:
+            self.deadline = start + self.duration
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = perf_counter() - start
+
+        results = LoadResults()
+        for worker_result in worker_results:
+            results.merge(worker_result)
+        return results, elapsed
+
+
 class Command(BaseCommand):
     help = 'Make a Hawk authenticated request'
 
@@ -62,11 +242,18 @@ class Command(BaseCommand):
             parser.add_argument(opt, **config)
 
     def handle(self, *args, **options):
-        # Configure the mohawk lib for debug logging so we can see inputs to
-        # the signature functions and other useful stuff.
+        load_test = (options.get('count') is not None or
+                     options.get('duration') is not None)
         hawk_log = logging.getLogger('mohawk')
-        hawk_log.setLevel(logging.DEBUG)
-        hawk_log.addHandler(logging.StreamHandler())
+        if load_test:
+            # Verifying each response would otherwise warn that the
+            # response nonce isn't checked, which clients don't need.
+            hawk_log.setLevel(logging.ERROR)
+        else:
+            # Configure the mohawk lib for debug logging so we can see
+            # inputs to the signature functions and other useful stuff.
+            hawk_log.setLevel(logging.DEBUG)
+            hawk_log.addHandler(logging.StreamHandler())
 
         url = options['url']
         if not url:
@@ -83,6 +270,10 @@ class Command(BaseCommand):
 
         credentials = lookup_credentials(creds_key)
 
+        if load_test:
+            return self.load_test(credentials, url, method, qs,
+                                  request_content_type, options)
+
         sender = Sender(credentials,
                         url, method.upper(),
                         content=qs,
@@ -96,16 +287,62 @@ class Command(BaseCommand):
         self.stdout.write('{method} -d {qs} {url}'.format(method=method.upper(),
                                                           qs=qs or 'None',
                                                           url=url))
-        self.stdout.write(res.text)
+        content = read_wire_content(res)
+        self.stdout.write(decode_content(res, content))
 
         # Verify we're talking to our trusted server.
         self.stdout.write(str(res.headers))
         auth_hdr = res.headers.get('Server-Authorization', None)
         if auth_hdr:
             sender.accept_response(auth_hdr,
-                                   content=res.text,
+                                   content=content,
                                    content_type=res.headers['Content-Type'])
             self.stdout.write('<response was Hawk verified>')
         else:
             self.stdout.write('** NO Server-Authorization header **')
             self.stdout.write('<response was NOT Hawk verified>')
+
+    def load_test(self, credentials, url, method, content, content_type,
+                  options):
+        count = options.get('count')
+        duration = options.get('duration')
+        concurrency = options.get('concurrency', 1)
+        if count is not None and count < 1:
+            raise CommandError('--count must be at least 1')
+        if duration is not None and duration <= 0:
+            raise CommandError('--duration must be more than 0')
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        requests = import_requests()
+        self.stdout.write('{method} -d {qs} {url} with {n} workers'
+                          .format(method=method.upper(), qs=content or 'None',
+                                  url=url, n=concurrency))
+        results, elapsed = LoadTest(
+            credentials, url, method, content, content_type, count=count,
+            duration=duration, concurrency=concurrency).run(requests)
+        self.report(results, elapsed)
+
+    def report(self, results, elapsed):
+        sent = len(results.latencies)
+        self.stdout.write('{n} requests in {s:.2f}s: {rate:.1f} requests/s'
+                          .format(n=sent, s=elapsed,
+                                  rate=sent / elapsed if elapsed else 0))
+        if sent:
+            latencies = sorted(results.latencies)
+            self.stdout.write(
+                'Latency: p50 {p50:.1f}ms, p90 {p90:.1f}ms, p99 {p99:.1f}ms, '
+                'max {max:.1f}ms'.format(
+                    p50=percentile(latencies, 50) * 1000,
+                    p90=percentile(latencies, 90) * 1000,
+                    p99=percentile(latencies, 99) * 1000,
+                    max=latencies[-1] * 1000))
+        self.stdout.write('Status codes: {}'.format(
+            ', '.join('{}: {}'.format(status, n) for status, n in
+                      sorted(results.statuses.items())) or 'None'))
+        if results.errors:
+            self.stdout.write('Errors: {}'.format(
+                ', '.join('{}: {}'.format(error, n) for error, n in
+                          sorted(results.errors.items()))))
+        self.stdout.write('Hawk verified responses: {n} of {sent}'
+                          .format(n=results.verified, sent=sent))
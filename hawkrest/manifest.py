@@ -0,0 +1,172 @@
+import json
+import logging
+import mimetypes
+import os
+
+from mohawk.util import parse_content_type
+
+from hawkrest.receiver import PayloadHash
+from hawkrest.util import get_hawk_setting, write_json
+
+
+log = logging.getLogger(__name__)
+
+# Content types that FileResponse uses for compressed files.
+ENCODING_CONTENT_TYPES = {
+    'br': 'application/x-brotli',
+    'bzip2': 'application/x-bzip',
+    'compress': 'application/x-compress',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+
+def guess_content_type(path):
+    """
+    Returns the Content-Type that FileResponse would send for a file.
+    """
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = ENCODING_CONTENT_TYPES.get(encoding, content_type)
+    return content_type or 'application/octet-stream'
+
+
+def hash_file(path, algorithm, content_type, chunk_size=64 * 1024):
+    """
+    Returns the Hawk payload hash of a file, read in chunks.
+    """
+    payload_hash = PayloadHash(algorithm, content_type)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            payload_hash.update(chunk)
+    return payload_hash.b64digest().decode('ascii')
+
+
+class PayloadHashManifest(object):
+    """
+    Precomputed Hawk payload hashes of files, by path.
+
+    Each entry records the size and modification time the file had when
+    it was hashed. A hash is only returned while the file still has that
+    size and mtime so a stale manifest never signs the wrong content.
+    The ``hawkmanifest`` management command builds manifests.
+    """
+    version = 1
+
+    def __init__(self, files=None):
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != cls.version:
+            raise ValueError('Unsupported Hawk manifest version: {}'
+                             .format(data.get('version')))
+        return cls(data['files'])
+
+    def save(self, path):
+        write_json(path, {'version': self.version, 'files': self.files},
+                   indent=1, sort_keys=True)
+
+    def __len__(self):
+        return len(self.files)
+
+    def add(self, path, algorithms, content_types=None):
+        """
+        Hashes a file for each algorithm and content type.
+
+        The file's own content type (see ``guess_content_type()``) is
+        always included. Returns True if the file had to be hashed, False
+        if the existing entry was still current.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        content_types = set(parse_content_type(content_type)
+                            for content_type in content_types or ())
+        content_types.add(parse_content_type(guess_content_type(path)))
+
+        entry = self.files.get(path)
+        if (not entry or entry['size'] != stat.st_size or
+                entry['mtime'] != stat.st_mtime):
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                     'hashes': {}}
+
+        hashed = False
+        for algorithm in algorithms:
+            hashes = entry['hashes'].setdefault(algorithm, {})
+            for content_type in content_types:
+                if content_type not in hashes:
+                    hashes[content_type] = hash_file(path, algorithm,
+                                                     content_type)
+                    hashed = True
+        self.files[path] = entry
+        return hashed
+
+    def add_directory(self, directory, algorithms, content_types=None):
+        """
+        Adds every file below a directory. Returns the number of files
+        that had to be hashed.
+        """
+        hashed = 0
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if self.add(os.path.join(root, name), algorithms,
+                            content_types):
+                    hashed += 1
+        return hashed
+
+    def prune(self):
+        """
+        Removes entries for files that no longer exist.
+        """
+        for path in list(self.files):
+            if not os.path.isfile(path):
+                del self.files[path]
+
+    def get(self, path, algorithm, content_type, size, mtime):
+        """
+        Returns the payload hash of a file as bytes or None if it's
+        unknown or the file has changed since it was hashed.
+        """
+        entry = self.files.get(os.path.abspath(path))
+        if not entry:
+            return None
+        if entry['size'] != size or entry['mtime'] != mtime:
+            log.debug('Hawk manifest entry for %s is stale', path)
+            return None
+        content_hash = entry['hashes'].get(algorithm, {}).get(
+            parse_content_type(content_type))
+        if content_hash is None:
+            return None
+        return content_hash.encode('ascii')
+
+    def get_for_file(self, filelike, algorithm, content_type):
+        """
+        Looks up an open file, as passed to FileResponse.
+
+        Returns None unless the file has a path, is at its start and is
+        unchanged since it was hashed.
+        """
+        path = getattr(filelike, 'name', None)
+        if not isinstance(path, str):
+            return None
+        try:
+            if filelike.tell() != 0:
+                return None
+            stat = os.fstat(filelike.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+        return self.get(path, algorithm, content_type,
+                        stat.st_size, stat.st_mtime)
+
+
+def get_payload_manifest():
+    """
+    Returns the PayloadHashManifest loaded from ``HAWK_PAYLOAD_MANIFEST``
+    or None if it is not configured.
+    """
+    return get_hawk_setting('payload_manifest')
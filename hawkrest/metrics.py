@@ -0,0 +1,332 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+import weakref
+from bisect import bisect_left
+
+from django.http import Http404, HttpResponse
+from mohawk.exc import (AlreadyProcessed, BadHeaderValue,
+                        CredentialsLookupError, InvalidCredentials,
+                        MacMismatch, MisComputedContentHash,
+                        MissingAuthorization, TokenExpired)
+
+from hawkrest.util import get_hawk_setting, perf_counter, write_json
+
+
+log = logging.getLogger(__name__)
+
+# In seconds.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# The failure reason of each mohawk exception, most specific first.
+FAILURE_REASONS = (
+    (AlreadyProcessed, 'replay'),
+    (TokenExpired, 'expired'),
+    (CredentialsLookupError, 'unknown_id'),
+    (MacMismatch, 'mac_mismatch'),
+    (MisComputedContentHash, 'payload_mismatch'),
+    (InvalidCredentials, 'invalid_credentials'),
+    (BadHeaderValue, 'bad_header'),
+    (MissingAuthorization, 'bad_header'),
+)
+
+AUTHENTICATIONS = 'hawkrest_authentications_total'
+SUCCESS = (AUTHENTICATIONS, 'success', '')
+AUTHENTICATION_SECONDS = 'hawkrest_authentication_seconds'
+SIGNING_SECONDS = 'hawkrest_response_signing_seconds'
+HELP = {
+    AUTHENTICATIONS: 'Hawk requests verified, by outcome and reason.',
+    AUTHENTICATION_SECONDS: 'Time spent verifying Hawk requests.',
+    SIGNING_SECONDS: 'Time spent signing Hawk responses.',
+}
+
+
+def failure_reason(exc):
+    for exc_class, reason in FAILURE_REASONS:
+        if isinstance(exc, exc_class):
+            return reason
+    # Such as an unknown scheme or key in the header.
+    return 'bad_header'
+
+
+class MetricsShard(object):
+    """
+    The metrics recorded by one thread.
+    """
+
+    def __init__(self, buckets):
+        # (name, outcome, reason) -> count
+        self.counters = {SUCCESS: 0}
+        # [bucket counts, sum, count]
+        self.authentication = [[0] * (len(buckets) + 1), 0.0, 0]
+        self.signing = [[0] * (len(buckets) + 1), 0.0, 0]
+        self.histograms = {AUTHENTICATION_SECONDS: self.authentication,
+                           SIGNING_SECONDS: self.signing}
+
+
+class MetricsRegistry(object):
+    """
+    Counts Hawk authentications and records how long authentication and
+    response signing take.
+
+    Each thread records into its own shard so recording never waits for
+    a lock. ``collect()`` adds the shards up.
+
+    With ``multiprocess_dir``, a background thread in every process also
+    writes its totals to a file in that directory every ``flush_interval``
+    seconds, and when the process exits. ``collect()`` adds up all files.
+    This way any gunicorn worker can report the metrics of all workers.
+    Empty the directory when the server starts.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, multiprocess_dir=None,
+                 flush_interval=5):
+        self.buckets = tuple(sorted(buckets))
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reset()
+        _registries.add(self)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards = []
+        self._flusher = None
+        self._path = None
+        if self.multiprocess_dir:
+            self._path = os.path.join(
+                self.multiprocess_dir,
+                'hawkrest-{pid}-{id}.json'.format(pid=os.getpid(),
+                                                  id=uuid.uuid4().hex))
+
+    def _new_shard(self):
+        shard = self._local.shard = MetricsShard(self.buckets)
+        with self._lock:
+            self._shards.append(shard)
+            if (self._path and self._flusher is None and
+                    not self._closed.is_set()):
+                # Threads don't survive a fork, so each process starts
+                # its own when it first records.
+                flusher = threading.Thread(target=self._flush_forever,
+                                           name='hawkrest-metrics')
+                flusher.daemon = True
+                flusher.start()
+                self._flusher = flusher
+        return shard
+
+    def _flush_forever(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def authenticated(self, started, error=None):
+        """
+        Records a Hawk request that was verified, starting at
+        ``perf_counter()`` time ``started``. ``error`` is the HawkFail
+        exception of a rejected request.
+        """
+        seconds = perf_counter() - started
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        if error is None:
+            shard.counters[SUCCESS] += 1
+        else:
+            key = (AUTHENTICATIONS, 'failure', failure_reason(error))
+            shard.counters[key] = shard.counters.get(key, 0) + 1
+        histogram = shard.authentication
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def signed(self, started):
+        """
+        Records a response that was signed, starting at ``perf_counter()``
+        time ``started``.
+        """
+        seconds = perf_counter() - started
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        histogram = shard.signing
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def close(self):
+        """
+        Stops the background thread and writes the totals one last time.
+        """
+        self._closed.set()
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join()
+        if self._path:
+            self.flush()
+
+    def snapshot(self):
+        """
+        Returns the totals of this process as a JSON serializable dict.
+        """
+        counters = {}
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # Copying a dict is atomic, unlike iterating over it while
+            # another thread records.
+            for key, count in shard.counters.copy().items():
+                if not count:
+                    continue
+                key = '|'.join(key)
+                counters[key] = counters.get(key, 0) + count
+            for name, (buckets, total, count) in (
+                    shard.histograms.copy().items()):
+                merged = histograms.setdefault(
+                    name, [[0] * len(buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+        return {'buckets': list(self.buckets), 'counters': counters,
+                'histograms': histograms}
+
+    def flush(self):
+        """
+        Writes the totals of this process to its file in
+        ``multiprocess_dir``.
+        """
+        if not self._flush_lock.acquire(False):
+            # Another thread is writing the file.
+            return
+        try:
+            write_json(self._path, self.snapshot())
+        except (IOError, OSError) as exc:
+            log.warning('Could not write Hawk metrics to %s: %s',
+                        self._path, exc)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """
+        Returns the totals of this process or, with ``multiprocess_dir``,
+        of all processes.
+        """
+        if not self._path:
+            return self.snapshot()
+
+        self.flush()
+        totals = {'buckets': list(self.buckets), 'counters': {},
+                  'histograms': {}}
+        for path in sorted(glob.glob(os.path.join(self.multiprocess_dir,
+                                                  'hawkrest-*.json'))):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (IOError, OSError, ValueError) as exc:
+                log.warning('Could not read Hawk metrics from %s: %s',
+                            path, exc)
+                continue
+            if snapshot['buckets'] != totals['buckets']:
+                log.warning('Ignoring Hawk metrics with other buckets in %s',
+                            path)
+                continue
+            for key, count in snapshot['counters'].items():
+                totals['counters'][key] = (
+                    totals['counters'].get(key, 0) + count)
+            for name, (buckets, total, count) in (
+                    snapshot['histograms'].items()):
+                merged = totals['histograms'].setdefault(
+                    name, [[0] * len(buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+        return totals
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        totals = self.collect()
+        lines = []
+
+        def header(name, metric_type):
+            lines.append('# HELP {name} {help}'.format(name=name,
+                                                       help=HELP[name]))
+            lines.append('# TYPE {name} {type}'.format(name=name,
+                                                       type=metric_type))
+
+        header(AUTHENTICATIONS, 'counter')
+        for key, count in sorted(totals['counters'].items()):
+            name, outcome, reason = key.split('|')
+            labels = 'outcome="{}"'.format(outcome)
+            if reason:
+                labels += ',reason="{}"'.format(reason)
+            lines.append('{name}{{{labels}}} {count}'
+                         .format(name=name, labels=labels, count=count))
+
+        for name in (AUTHENTICATION_SECONDS, SIGNING_SECONDS):
+            header(name, 'histogram')
+            buckets, total, count = totals['histograms'].get(
+                name, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            cumulative = 0
+            for le, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                lines.append('{name}_bucket{{le="{le!r}"}} {count}'
+                             .format(name=name, le=le, count=cumulative))
+            lines.append('{name}_bucket{{le="+Inf"}} {count}'
+                         .format(name=name, count=count))
+            lines.append('{name}_sum {total!r}'.format(name=name,
+                                                       total=total))
+            lines.append('{name}_count {count}'.format(name=name,
+                                                       count=count))
+        return '\n'.join(lines) + '\n'
+
+
+# Every registry in this process, to reset after a fork and flush at exit.
+# Settings reloads create new registries, so the hooks are registered once.
+_registries = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    # A forked worker must not report the metrics of its parent.
+    for registry in list(_registries):
+        registry._reset()
+
+
+def _flush_at_exit():
+    for registry in list(_registries):
+        if registry._path and not registry._closed.is_set():
+            registry.flush()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_flush_at_exit)
+
+
+def get_metrics():
+    """
+    Returns the MetricsRegistry configured by ``HAWK_METRICS`` or None.
+    """
+    return get_hawk_setting('metrics')
+
+
+def metrics_view(request):
+    """
+    Serves the Hawk metrics in the Prometheus text format.
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        raise Http404('HAWK_METRICS is not configured')
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -1,4 +1,7 @@
 import logging
+import tempfile
+
+from django.middleware.gzip import GZipMiddleware
 
 try:
     from django.utils.deprecation import MiddlewareMixin
@@ -6,20 +9,58 @@ try:
 except ImportError:  # Django version < 1.11
     middleware_cls = object
 
-from hawkrest.util import is_hawk_request
+from hawkrest.conf import hawk_settings
+from hawkrest.receiver import PayloadHash, respond_with_content_hash
+from hawkrest.signals import is_timed, response_signing_timed
+from hawkrest.util import (FileChunks, PhaseTimer, is_hawk_request,
+                           perf_counter)
 
 
 log = logging.getLogger(__name__)
 
 
+def get_file_position(filelike):
+    """
+    Returns the current position of a seekable file or None.
+    """
+    if filelike is None:
+        return None
+    try:
+        seekable = filelike.seekable()
+    except AttributeError:
+        seekable = hasattr(filelike, 'seek') and hasattr(filelike, 'tell')
+    except (IOError, OSError, ValueError):
+        return None
+    if not seekable:
+        return None
+    try:
+        return filelike.tell()
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def compress_response(request, response):
+    """
+    Gzips a response the same way as Django's GZipMiddleware, which
+    leaves it alone if the client doesn't accept gzip, it is too small
+    or it already has a Content-Encoding.
+    """
+    if middleware_cls is object:  # Django version < 1.11
+        gzip_middleware = GZipMiddleware()
+    else:
+        gzip_middleware = GZipMiddleware(lambda request: response)
+    return gzip_middleware.process_response(request, response)
+
+
 class HawkResponseMiddleware(middleware_cls):
+    chunk_size = 64 * 1024
 
     def process_response(self, request, response):
         hawk_auth_was_processed = 'hawk.receiver' in request.META
         receiver = request.META.get('hawk.receiver', None)
 
-        log.debug('receiver? {rec}; hawk auth processed? {auth}'
-                  .format(rec=receiver, auth=hawk_auth_was_processed))
+        log.debug('receiver? %s; hawk auth processed? %s',
+                  receiver, hawk_auth_was_processed)
         if is_hawk_request(request) and not hawk_auth_was_processed:
             # This is a paranoid check to make sure Django
             # isn't misconfigured.
@@ -29,10 +70,111 @@ class HawkResponseMiddleware(middleware_cls):
         if receiver:
             # Sign our response, so clients can trust us.
             log.debug('Hawk signing the response')
-            receiver.respond(content=response.content,
-                             content_type=response['Content-Type'])
+            timer = (PhaseTimer() if is_timed(response_signing_timed)
+                     else None)
+            metrics = hawk_settings.metrics
+            if metrics:
+                started = perf_counter()
+            if hawk_settings.HAWK_COMPRESS_RESPONSES:
+                # Sign the bytes that will be sent.
+                response = compress_response(request, response)
+                if timer:
+                    timer.lap('compress')
+            content_type = response['Content-Type']
+            content_hash = self.get_content_hash(
+                request, receiver, response, content_type,
+                hawk_settings.response_hash_cache)
+            if timer:
+                timer.lap('payload_hash')
+            respond_with_content_hash(receiver, content_hash)
             response['Server-Authorization'] = receiver.response_header
+            if metrics:
+                metrics.signed(started)
+            if timer:
+                timer.lap('mac')
+                response_signing_timed.send(sender=self.__class__,
+                                            request=request,
+                                            response=response,
+                                            phases=timer.phases)
         else:
             log.debug('NOT Hawk signing the response, not a Hawk request')
 
         return response
+
+    def get_content_hash(self, request, receiver, response, content_type,
+                         cache):
+        algorithm = receiver.resource.credentials['algorithm']
+        streaming = getattr(response, 'streaming', False)
+
+        manifest = hawk_settings.payload_manifest
+        filelike = getattr(response, 'file_to_stream', None)
+        if manifest is not None and filelike is not None:
+            content_hash = manifest.get_for_file(filelike, algorithm,
+                                                 content_type)
+            if content_hash is not None:
+                log.debug('Hawk payload hash found in the manifest')
+                return content_hash
+
+        content = None if streaming else response.content
+        key = None
+        if cache is not None:
+            key = cache.make_key(algorithm, content_type,
+                                 etag=response.get('ETag'), content=content,
+                                 method=request.method,
+                                 path=request.get_full_path(),
+                                 content_encoding=response.get(
+                                     'Content-Encoding'))
+            if key is not None:
+                content_hash = cache.get(key)
+                if content_hash is not None:
+                    log.debug('Hawk payload hash cache hit')
+                    return content_hash
+
+        payload_hash = PayloadHash(algorithm, content_type)
+        if streaming:
+            self.hash_streaming_content(response, payload_hash)
+        else:
+            payload_hash.update(content)
+        content_hash = payload_hash.b64digest()
+
+        if key is not None:
+            cache.set(key, content_hash)
+        return content_hash
+
+    def hash_streaming_content(self, response, payload_hash):
+        """
+        Hashes a streaming response without buffering it in memory.
+
+        A seekable ``FileResponse`` file is read and then rewound. Any
+        other content is copied to a temporary file as it is hashed and
+        the response then streams that copy. Async content is consumed
+        with ``async_to_sync()``, as Django itself does under WSGI.
+        """
+        filelike = getattr(response, 'file_to_stream', None)
+        start = get_file_position(filelike)
+        if start is not None:
+            log.debug('Hawk hashing the response file in place')
+            while True:
+                chunk = filelike.read(self.chunk_size)
+                if not chunk:
+                    break
+                payload_hash.update(response.make_bytes(chunk))
+            filelike.seek(start)
+            return
+
+        log.debug('Hawk hashing the response through a temporary file')
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=hawk_settings.HAWK_BODY_SPOOL_MAX_MEMORY_SIZE)
+        if getattr(response, 'is_async', False):
+            # Async content needs Python 3, like hawkrest.aio. Under ASGI,
+            # AsyncHawkResponseMiddleware consumes it on the event loop.
+            from asgiref.sync import async_to_sync
+            from hawkrest.aio import spool_async_content
+            async_to_sync(spool_async_content)(response.streaming_content,
+                                               spool, payload_hash)
+        else:
+            for chunk in response.streaming_content:
+                payload_hash.update(chunk)
+                spool.write(chunk)
+        spool.seek(0)
+        response.streaming_content = FileChunks(spool)
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+try:
+    BigAutoField = models.BigAutoField
+except AttributeError:
+    # compatibility with django < 1.10
+    BigAutoField = models.AutoField
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='Nonce',
+            fields=[
+                ('id', BigAutoField(primary_key=True, serialize=False)),
+                ('credentials_id', models.CharField(max_length=255)),
+                ('nonce', models.CharField(max_length=255)),
+                ('timestamp', models.BigIntegerField()),
+                ('partition', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nonce',
+            unique_together=set([('credentials_id', 'nonce', 'timestamp')]),
+        ),
+    ]
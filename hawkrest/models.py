@@ -1 +1,22 @@
-# Dummy file to make this a Django app.
+from django.db import models
+
+try:
+    BigAutoField = models.BigAutoField
+except AttributeError:
+    # compatibility with django < 1.10
+    BigAutoField = models.AutoField
+
+
+class Nonce(models.Model):
+    """
+    A Hawk nonce recorded by hawkrest.nonce.DatabaseNonceStore.
+    """
+    id = BigAutoField(primary_key=True)
+    credentials_id = models.CharField(max_length=255)
+    nonce = models.CharField(max_length=255)
+    timestamp = models.BigIntegerField()
+    # Nonces that expire in the same time partition are deleted together.
+    partition = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        unique_together = ('credentials_id', 'nonce', 'timestamp')
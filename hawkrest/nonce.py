@@ -0,0 +1,906 @@
+import bisect
+import errno
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows.
+    fcntl = None
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from hawkrest.conf import hawk_settings, import_string
+from hawkrest.signals import nonce_store_state_changed
+
+
+log = logging.getLogger(__name__)
+
+
+class BaseNonceStore(object):
+    """
+    Keeps track of Hawk nonces to prevent replay attacks.
+
+    Configure a store with the ``HAWK_NONCE_STORE`` setting. Any
+    ``HAWK_NONCE_STORE_OPTIONS`` are passed as keyword arguments to the
+    constructor. A store instance lives for as long as the settings
+    don't change so it can keep state between requests.
+
+    Subclasses must implement ``seen_nonce()``.
+    """
+    # Whether seen_nonce() may wait on the network or a database. Async
+    # code (see hawkrest.aio) calls stores that don't block directly
+    # instead of in a thread.
+    blocking = True
+    # Whether seen_nonce() uses Django's database connections. Async code
+    # calls these stores in the thread of the request, whose connections
+    # Django closes, rather than in a pool thread that would keep them.
+    uses_database = False
+
+    def seen_nonce(self, id, nonce, timestamp):
+        """
+        Returns True if the Hawk nonce has been seen already.
+
+        Otherwise, the nonce is recorded and False is returned.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Releases threads, files and connections held by the store.
+
+        Called when the settings change and the store is replaced.
+        """
+
+    @property
+    def timeout(self):
+        # We only need the nonce until the message itself expires.
+        # This also adds a little bit of padding.
+        return hawk_settings.HAWK_MESSAGE_EXPIRATION + 5
+
+    def make_key(self, id, nonce, timestamp):
+        return '{id}:{n}:{ts}'.format(id=id, n=nonce, ts=timestamp)
+
+
+class CacheNonceStore(BaseNonceStore):
+    """
+    Stores nonces with the Django cache framework.
+
+    This is the default store. Set the ``cache_alias`` option to use a
+    cache other than ``default``, such as one dedicated to nonces.
+    """
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        # Django cache connections are per thread so look it up each time.
+        return caches[self.cache_alias]
+
+    def get_cache(self, id, nonce):
+        return self.cache
+
+    def seen_nonce(self, id, nonce, timestamp):
+        # The check and the record happen in a single atomic cache.add()
+        # so concurrent replays of the same nonce can't both be accepted.
+        key = self.make_key(id, nonce, timestamp)
+        if self.get_cache(id, nonce).add(key, True, timeout=self.timeout):
+            log.debug('cached nonce %s', key)
+            return False
+        else:
+            log.warning('replay attack? already processed nonce %s', key)
+            return True
+
+
+class ShardedCacheNonceStore(CacheNonceStore):
+    """
+    Spreads nonces over several Django caches.
+
+    This keeps a single cache server from becoming a hot spot. Each
+    credentials ID and nonce pair is assigned to one of ``cache_aliases``
+    with consistent hashing: every alias owns ``virtual_nodes`` points on a
+    hash ring so adding or removing an alias only moves the nonces on
+    that alias's share of the ring.
+    """
+
+    def __init__(self, cache_aliases=('default',), virtual_nodes=100):
+        self.cache_aliases = list(cache_aliases)
+        ring = sorted(
+            (self._hash('{alias}#{n}'.format(alias=alias, n=n)), alias)
+            for alias in self.cache_aliases
+            for n in range(virtual_nodes))
+        self._ring_points = [point for point, alias in ring]
+        self._ring_aliases = [alias for point, alias in ring]
+
+    def _hash(self, value):
+        digest = hashlib.md5(value.encode('utf8')).digest()
+        return struct.unpack('<Q', digest[:8])[0]
+
+    def get_cache_alias(self, id, nonce):
+        point = self._hash('{id}:{n}'.format(id=id, n=nonce))
+        index = bisect.bisect(self._ring_points, point)
+        return self._ring_aliases[index % len(self._ring_aliases)]
+
+    def get_cache(self, id, nonce):
+        return caches[self.get_cache_alias(id, nonce)]
+
+
+class MemoryNonceStore(BaseNonceStore):
+    """
+    Stores nonces in process memory.
+
+    This avoids a network round trip per request but only detects replays
+    sent to the same process so it's only suitable for single process
+    deployments or a sidecar that handles all Hawk traffic for a host.
+
+    Nonces are grouped in buckets of ``bucket_seconds`` by their Hawk
+    timestamp. Once a bucket is older than the message expiration (plus
+    padding) it is dropped as a whole rather than expiring each nonce.
+    If more than ``max_entries`` nonces are stored, the oldest buckets are
+    evicted early which weakens replay protection for those messages;
+    watch the ``evictions`` counter and raise the limit if it grows.
+    """
+    blocking = False
+
+    def __init__(self, bucket_seconds=1, max_entries=100000):
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        # Number of nonces dropped before they expired.
+        self.evictions = 0
+        # Number of nonces dropped because they expired.
+        self.expirations = 0
+        self._buckets = {}
+        self._size = 0
+        self._expired_before = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def seen_nonce(self, id, nonce, timestamp):
+        bucket = int(timestamp) // self.bucket_seconds
+        key = (id, nonce, timestamp)
+        with self._lock:
+            self._expire(int(time.time() - self.timeout) //
+                         self.bucket_seconds)
+            if bucket < self._expired_before:
+                # The message has expired so it will be rejected anyway.
+                return False
+
+            keys = self._buckets.get(bucket)
+            if keys is None:
+                keys = self._buckets[bucket] = set()
+            elif key in keys:
+                log.warning('replay attack? already processed nonce %s',
+                            self.make_key(id, nonce, timestamp))
+                return True
+
+            keys.add(key)
+            self._size += 1
+            if self._size > self.max_entries:
+                self._evict(bucket, key)
+            return False
+
+    def _expire(self, oldest_bucket):
+        if oldest_bucket == self._expired_before:
+            return
+        self._expired_before = oldest_bucket
+        for bucket in [b for b in self._buckets if b < oldest_bucket]:
+            expired = len(self._buckets.pop(bucket))
+            self._size -= expired
+            self.expirations += expired
+
+    def _evict(self, current_bucket, current_key):
+        evicted = 0
+        while self._size > self.max_entries:
+            keys = self._buckets.pop(min(self._buckets))
+            self._size -= len(keys)
+            evicted += len(keys)
+        if current_bucket not in self._buckets:
+            # Always remember the nonce that was just accepted.
+            self._buckets[current_bucket] = set([current_key])
+            self._size += 1
+            evicted -= 1
+        self.evictions += evicted
+        log.warning('evicted %s unexpired nonces; max_entries=%s '
+                    'is too small', evicted, self.max_entries)
+
+    def memory_usage(self):
+        """
+        Returns an estimate of the bytes used to store nonces.
+        """
+        with self._lock:
+            total = sys.getsizeof(self._buckets)
+            for keys in self._buckets.values():
+                total += sys.getsizeof(keys)
+                for key in keys:
+                    total += sys.getsizeof(key)
+                    total += sum(sys.getsizeof(part) for part in key)
+            return total
+
+
+class PendingNonce(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.seen = False
+        # The exception of a batch that failed.
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchedCacheNonceStore(CacheNonceStore):
+    """
+    Checks nonces against recent local nonces first and talks to the Django
+    cache in batches.
+
+    Every nonce is first checked against a MemoryNonceStore of nonces seen
+    by this process, so local replays never reach the cache. New nonces
+    are queued and a background thread sends the queue to the cache every
+    ``flush_interval`` seconds using one ``get_many()`` to look for
+    replays and one ``set_many()`` to record the rest.
+
+    When ``wait_for_remote`` is True (the default), a request waits for the
+    batch containing its nonce, adding up to ``flush_interval`` seconds of
+    latency. Replays of the same nonce sent to different processes within
+    one batch window can both be accepted because neither has been
+    recorded yet; that window is ``flush_interval`` plus the time of the
+    batch round trips. Like with CacheNonceStore, a cache error fails the
+    request: ``seen_nonce()`` raises the error of the batch, whether the
+    batch was sent by the background thread or inline. If the cache
+    doesn't answer within ``remote_timeout`` seconds it raises
+    TimeoutError. Wrap the store in a CircuitBreakerNonceStore to fall back
+    to another store instead.
+
+    When ``wait_for_remote`` is False, requests are only checked locally and
+    the cache is written behind. Replays sent to other processes are then
+    only logged and counted in ``late_replays`` after the fact, and cache
+    errors are only logged.
+    """
+
+    def __init__(self, cache_alias='default', flush_interval=0.005,
+                 wait_for_remote=True, remote_timeout=1.0,
+                 max_local_entries=100000, background=True):
+        super(BatchedCacheNonceStore, self).__init__(cache_alias=cache_alias)
+        self.flush_interval = flush_interval
+        self.wait_for_remote = wait_for_remote
+        # Without waiting for the cache, only the local store is checked.
+        self.blocking = wait_for_remote
+        self.remote_timeout = remote_timeout
+        self.background = background
+        self.local = MemoryNonceStore(max_entries=max_local_entries)
+        self.checks = 0
+        self.round_trips = 0
+        self.late_replays = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self._closed = threading.Event()
+
+    def seen_nonce(self, id, nonce, timestamp):
+        self.checks += 1
+        if self.local.seen_nonce(id, nonce, timestamp):
+            return True
+
+        pending = PendingNonce(self.make_key(id, nonce, timestamp))
+        with self._lock:
+            self._pending.append(pending)
+
+        if not self.background or self._closed.is_set():
+            try:
+                self.flush()
+            except Exception:
+                if self.wait_for_remote:
+                    raise
+                log.exception('failed to flush nonces to the cache')
+        else:
+            self._start_flusher()
+
+        if not self.wait_for_remote:
+            return False
+        if not pending.done.wait(self.remote_timeout):
+            raise TimeoutError('timed out checking nonce {key} with the '
+                               'cache'.format(key=pending.key))
+        if pending.error is not None:
+            raise pending.error
+        if pending.seen:
+            log.warning('replay attack? already processed nonce %s',
+                        pending.key)
+        return pending.seen
+
+    def _start_flusher(self):
+        # Threads don't survive a fork so each process starts its own.
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher is None or self._flusher_pid != os.getpid():
+                flusher = threading.Thread(target=self._flush_forever,
+                                           name='hawkrest-nonces')
+                flusher.daemon = True
+                flusher.start()
+                self._flusher_pid = os.getpid()
+                self._flusher = flusher
+
+    def _flush_forever(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception('failed to flush nonces to the cache')
+
+    def close(self):
+        """
+        Stops the background thread and sends the queued nonces.
+        """
+        self._closed.set()
+        with self._lock:
+            flusher, pid = self._flusher, self._flusher_pid
+            self._flusher = self._flusher_pid = None
+        if (flusher is not None and pid == os.getpid() and
+                flusher is not threading.current_thread()):
+            flusher.join()
+        self.flush()
+
+    def flush(self):
+        """
+        Sends all queued nonces to the cache in one batch.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            cache = self.cache
+            keys = [pending.key for pending in batch]
+            found = cache.get_many(keys)
+            self.round_trips += 1
+            new = dict((key, True) for key in keys if key not in found)
+            if new:
+                cache.set_many(new, timeout=self.timeout)
+                self.round_trips += 1
+        except Exception as exc:
+            # Fail every request waiting for this batch, not only this one.
+            for pending in batch:
+                pending.error = exc
+                pending.done.set()
+            raise
+
+        for pending in batch:
+            pending.seen = pending.key in found
+            pending.done.set()
+
+        if found and not self.wait_for_remote:
+            self.late_replays += len(found)
+            log.warning('replay attack? accepted %s nonces that were '
+                        'already processed: %s', len(found), ', '.join(found))
+
+
+class SharedMemoryNonceStore(BaseNonceStore):
+    """
+    Stores nonces in a memory mapped file shared by all processes on a host.
+
+    This lets many worker processes (such as gunicorn workers) detect
+    replays between each other without a cache server. Replays sent to
+    other hosts are not detected. It requires a POSIX system.
+
+    The file holds a hash table of ``slots`` entries, each one a 16 byte
+    digest of the nonce key plus the time it expires. The table is split
+    into stripes of ``stripe_slots`` entries and a nonce can only live in
+    the stripe its digest points to. Only that stripe is locked while it
+    is checked and updated, with a byte range ``lockf()`` lock between
+    processes and a thread lock within a process. Expired slots are
+    reused. When a stripe is full of unexpired nonces, the one closest to
+    expiry is evicted early and counted in ``evictions``; raise ``slots``
+    if that happens.
+
+    All processes must use the same ``path``, ``slots`` and
+    ``stripe_slots``.
+    """
+    blocking = False
+
+    header = struct.Struct('<8sII')
+    magic = b'HAWKNONC'
+    slot = struct.Struct('<16sq')
+    thread_locks = 64
+
+    def __init__(self, path=None, slots=2 ** 20, stripe_slots=16):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                'SharedMemoryNonceStore requires the fcntl module')
+        if slots % stripe_slots:
+            raise ImproperlyConfigured(
+                'slots must be a multiple of stripe_slots')
+        self.path = path or os.path.join(self.private_dir(),
+                                         'hawkrest-nonces')
+        self.slots = slots
+        self.stripe_slots = stripe_slots
+        self.stripes = slots // stripe_slots
+        self.evictions = 0
+        self.size = self.header.size + slots * self.slot.size
+        self._locks = [threading.Lock() for _ in range(self.thread_locks)]
+        try:
+            # Never follow a symlink that another user may have planted.
+            self._fd = os.open(self.path,
+                               os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        except OSError as exc:
+            if exc.errno != errno.ELOOP:
+                raise
+            raise ImproperlyConfigured(
+                '{path} must not be a symlink'.format(path=self.path))
+        try:
+            self.check_private(os.fstat(self._fd), self.path)
+            self._init_file()
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+        self._map = mmap.mmap(self._fd, self.size)
+
+    @classmethod
+    def private_dir(cls):
+        """
+        Returns a directory in the temp directory that only the current
+        user can write to, creating it if needed.
+        """
+        path = os.path.join(tempfile.gettempdir(),
+                            'hawkrest-{uid}'.format(uid=os.getuid()))
+        try:
+            os.mkdir(path, 0o700)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        # lstat() so that a symlink to someone else's directory fails.
+        cls.check_private(os.lstat(path), path)
+        return path
+
+    @staticmethod
+    def check_private(stat, path):
+        """
+        Raises ImproperlyConfigured unless ``stat`` belongs to a file or
+        directory that only the current user can access. Anyone else who
+        can write the nonce table can turn off replay protection.
+        """
+        if stat.st_uid != os.getuid():
+            raise ImproperlyConfigured(
+                '{path} must be owned by the user running hawkrest'
+                .format(path=path))
+        if stat.st_mode & 0o077:
+            raise ImproperlyConfigured(
+                '{path} must not be accessible to other users (mode {mode})'
+                .format(path=path, mode=oct(stat.st_mode & 0o777)))
+
+    def _init_file(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self.size)
+                os.write(self._fd, self.header.pack(
+                    self.magic, self.slots, self.stripe_slots))
+            else:
+                header = os.read(self._fd, self.header.size)
+                if (header != self.header.pack(self.magic, self.slots,
+                                               self.stripe_slots) or
+                        os.fstat(self._fd).st_size != self.size):
+                    raise ImproperlyConfigured(
+                        '{path} is not a nonce table with slots={slots} '
+                        'and stripe_slots={stripe}'
+                        .format(path=self.path, slots=self.slots,
+                                stripe=self.stripe_slots))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def seen_nonce(self, id, nonce, timestamp):
+        now = int(time.time())
+        expires = int(timestamp) + self.timeout
+        if expires < now:
+            # The message has expired so it will be rejected anyway.
+            return False
+
+        key = self.make_key(id, nonce, timestamp)
+        digest = hashlib.sha256(key.encode('utf8')).digest()[:16]
+        stripe = struct.unpack('<Q', digest[:8])[0] % self.stripes
+        offset = self.header.size + stripe * self.stripe_slots * self.slot.size
+        length = self.stripe_slots * self.slot.size
+
+        with self._locks[stripe % self.thread_locks]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                free_offset = None
+                oldest_offset, oldest_expires = None, None
+                for slot_offset in range(offset, offset + length,
+                                         self.slot.size):
+                    slot_digest, slot_expires = self.slot.unpack_from(
+                        self._map, slot_offset)
+                    if slot_expires < now:
+                        if free_offset is None:
+                            free_offset = slot_offset
+                    elif slot_digest == digest:
+                        log.warning('replay attack? already processed '
+                                    'nonce %s', key)
+                        return True
+                    elif oldest_expires is None or slot_expires < oldest_expires:
+                        oldest_offset = slot_offset
+                        oldest_expires = slot_expires
+
+                if free_offset is None:
+                    log.warning('evicted an unexpired nonce from %s; '
+                                'slots=%s is too small', self.path, self.slots)
+                    self.evictions += 1
+                    free_offset = oldest_offset
+                self.slot.pack_into(self._map, free_offset, digest, expires)
+                return False
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def memory_usage(self):
+        """
+        Returns the bytes used by the shared table.
+        """
+        return self.size
+
+    def close(self):
+        if self._fd is None:
+            return
+        self._map.close()
+        os.close(self._fd)
+        self._fd = None
+
+
+class BloomFilter(object):
+    """
+    A fixed size Bloom filter sized for a number of items and a target
+    false positive rate.
+    """
+
+    def __init__(self, capacity, false_positive_rate):
+        self.bits = int(math.ceil(-capacity * math.log(false_positive_rate) /
+                                  math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) *
+                                       math.log(2))))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.bits_set = 0
+
+    def positions(self, key):
+        digest = hashlib.sha256(key.encode('utf8')).digest()
+        # Double hashing: derive every position from two 64 bit hashes.
+        h1, h2 = struct.unpack('<QQ', digest[:16])
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def contains(self, positions):
+        array = self.array
+        for pos in positions:
+            if not array[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, positions):
+        array = self.array
+        for pos in positions:
+            mask = 1 << (pos & 7)
+            if not array[pos >> 3] & mask:
+                array[pos >> 3] |= mask
+                self.bits_set += 1
+
+    def false_positive_rate(self):
+        """
+        Returns the chance that a new key is reported as present, based on
+        how full the filter is.
+        """
+        return (self.bits_set / float(self.bits)) ** self.hashes
+
+
+class BloomNonceStore(BaseNonceStore):
+    """
+    Stores nonces in a pair of rotating Bloom filters in process memory.
+
+    This uses a fraction of the memory of storing each nonce key at the
+    cost of occasionally rejecting a new request as a replay. The chance
+    of that is ``false_positive_rate`` when traffic stays under
+    ``requests_per_second``; a rejected client can retry with a new nonce.
+    Like MemoryNonceStore, replays are only detected within one process.
+
+    Each filter is sized for the requests expected during one nonce
+    timeout. New nonces are added to the current filter and every
+    timeout it becomes the previous filter and an empty one takes its
+    place, so a nonce is remembered for at least one timeout.
+    """
+    blocking = False
+
+    def __init__(self, requests_per_second=1000, false_positive_rate=0.0001):
+        self.requests_per_second = requests_per_second
+        self.false_positive_rate = false_positive_rate
+        self.rotate_seconds = self.timeout
+        self.capacity = int(requests_per_second * self.rotate_seconds)
+        self.checks = 0
+        self.rejections = 0
+        self._current = self._new_filter()
+        self._previous = self._new_filter()
+        self._rotated_at = time.time()
+        self._lock = threading.Lock()
+
+    def _new_filter(self):
+        return BloomFilter(self.capacity, self.false_positive_rate)
+
+    def seen_nonce(self, id, nonce, timestamp):
+        key = self.make_key(id, nonce, timestamp)
+        positions = self._current.positions(key)
+        with self._lock:
+            now = time.time()
+            if now - self._rotated_at >= self.rotate_seconds:
+                self._rotate(now)
+
+            self.checks += 1
+            if (self._current.contains(positions) or
+                    self._previous.contains(positions)):
+                self.rejections += 1
+                log.warning('replay attack? probably already processed '
+                            'nonce %s', key)
+                return True
+            self._current.add(positions)
+            return False
+
+    def _rotate(self, now):
+        if now - self._rotated_at >= self.rotate_seconds * 2:
+            # Both filters are stale.
+            self._previous = self._new_filter()
+        else:
+            self._previous = self._current
+        self._current = self._new_filter()
+        self._rotated_at = now
+
+    def memory_usage(self):
+        """
+        Returns the bytes used by both filters.
+        """
+        return len(self._current.array) + len(self._previous.array)
+
+    def false_rejection_rate(self):
+        """
+        Returns the estimated chance that a new nonce is rejected right now.
+        """
+        return 1 - ((1 - self._current.false_positive_rate()) *
+                    (1 - self._previous.false_positive_rate()))
+
+
+class DatabaseNonceStore(BaseNonceStore):
+    """
+    Stores nonces as rows of the hawkrest.models.Nonce model.
+
+    This is for deployments that have a shared database but no shared
+    cache. A unique constraint on (credentials ID, nonce, timestamp) makes
+    the insert itself the atomic check: if it violates the constraint, the
+    nonce was seen before.
+
+    Each row records the time partition (of ``partition_seconds``) in
+    which it expires. Expired rows are deleted a whole partition at a time
+    with one bulk DELETE, at most once per partition when ``cleanup`` is
+    True, or by running the ``clearhawknonces`` management command.
+
+    A nonce or credentials ID that is too long for its column is stored
+    as a SHA-256 digest.
+    """
+
+    uses_database = True
+
+    def __init__(self, using='default', partition_seconds=60, cleanup=True):
+        self.using = using
+        self.partition_seconds = partition_seconds
+        self.cleanup = cleanup
+        self._cleaned_partition = None
+
+    def seen_nonce(self, id, nonce, timestamp):
+        # Models can't be imported until Django apps are loaded.
+        from hawkrest.models import Nonce
+
+        now = int(time.time())
+        expires = int(timestamp) + self.timeout
+        if expires < now:
+            # The message has expired so it will be rejected anyway.
+            return False
+
+        if self.cleanup:
+            partition = now // self.partition_seconds
+            if partition != self._cleaned_partition:
+                self._cleaned_partition = partition
+                self.delete_expired(now=now)
+
+        try:
+            # The savepoint keeps a constraint violation from breaking
+            # the transaction of the request, if there is one.
+            with transaction.atomic(using=self.using):
+                Nonce.objects.using(self.using).create(
+                    credentials_id=self.column_value(Nonce, 'credentials_id',
+                                                     id),
+                    nonce=self.column_value(Nonce, 'nonce', nonce),
+                    timestamp=int(timestamp),
+                    partition=expires // self.partition_seconds)
+        except IntegrityError:
+            log.warning('replay attack? already processed nonce %s',
+                        self.make_key(id, nonce, timestamp))
+            return True
+        return False
+
+    def column_value(self, model, name, value):
+        """
+        Returns ``value``, or its digest if it's longer than the ``name``
+        column. Postgres, for one, raises an error for values that don't
+        fit and mohawk allows nonces up to 4096 characters.
+        """
+        if len(value) <= model._meta.get_field(name).max_length:
+            return value
+        return 'sha256:{}'.format(
+            hashlib.sha256(value.encode('utf8')).hexdigest())
+
+    def delete_expired(self, now=None):
+        """
+        Deletes nonces in partitions that have fully expired.
+
+        Returns the number of deleted nonces.
+        """
+        from hawkrest.models import Nonce
+
+        if now is None:
+            now = int(time.time())
+        # Rows in the current partition may expire later than now.
+        deleted, _ = (Nonce.objects.using(self.using)
+                      .filter(partition__lt=now // self.partition_seconds)
+                      .delete())
+        log.debug('deleted %s expired nonces', deleted)
+        return deleted
+
+
+class CircuitBreakerNonceStore(BaseNonceStore):
+    """
+    Protects requests from a slow or unavailable nonce store.
+
+    Calls to ``store`` (the import path of a nonce store, built with
+    ``store_options``) run on a small thread pool and are abandoned after
+    ``call_timeout`` seconds. Calls that time out, raise an exception or
+    take longer than ``slow_call_seconds`` count as failures. After
+    ``failure_threshold`` failures in a row the circuit opens and nonces
+    are checked with the ``fallback`` store instead (in process memory by
+    default). After ``reset_seconds``, the next nonce probes ``store``
+    again: if it succeeds the circuit closes, otherwise it stays open for
+    another ``reset_seconds``.
+
+    While open, replays are only detected by the fallback store, which
+    usually means within one process. Every state change is logged and
+    sent as the ``hawkrest.signals.nonce_store_state_changed`` signal.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, store='hawkrest.nonce.CacheNonceStore',
+                 store_options=None,
+                 fallback='hawkrest.nonce.MemoryNonceStore',
+                 fallback_options=None,
+                 call_timeout=0.1, slow_call_seconds=0.05,
+                 failure_threshold=5, reset_seconds=10, pool_size=4):
+        self.store = import_string(store)(**(store_options or {}))
+        self.fallback = import_string(fallback)(**(fallback_options or {}))
+        self.call_timeout = call_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.pool_size = pool_size
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def seen_nonce(self, id, nonce, timestamp):
+        if not self._allow_remote_call():
+            return self.fallback.seen_nonce(id, nonce, timestamp)
+
+        start = time.time()
+        try:
+            seen = self._get_pool().apply_async(
+                self.store.seen_nonce,
+                (id, nonce, timestamp)).get(self.call_timeout)
+        except TimeoutError:
+            self._record_failure('timed out after {sec}s'
+                                 .format(sec=self.call_timeout))
+            return self.fallback.seen_nonce(id, nonce, timestamp)
+        except Exception as exc:
+            self._record_failure('{etype}: {val}'.format(
+                etype=exc.__class__.__name__, val=exc))
+            return self.fallback.seen_nonce(id, nonce, timestamp)
+
+        elapsed = time.time() - start
+        if elapsed > self.slow_call_seconds:
+            self._record_failure('slow call took {sec:.3f}s'
+                                 .format(sec=elapsed))
+        else:
+            self._record_success()
+        return seen
+
+    @property
+    def uses_database(self):
+        return self.store.uses_database or self.fallback.uses_database
+
+    def close(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.terminate()
+        self._pool = self._pool_pid = None
+        close = getattr(self.store, 'close', None)
+        if close:
+            close()
+
+    def _get_pool(self):
+        # Threads don't survive a fork so each process makes its own pool.
+        if self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ThreadPool(self.pool_size)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _allow_remote_call(self):
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if (self.state == self.OPEN and
+                    time.time() - self._opened_at >= self.reset_seconds):
+                # Let this call probe the store.
+                change = self._set_state(self.HALF_OPEN)
+            else:
+                return False
+        self._send_state_changed(change)
+        return True
+
+    def _record_failure(self, reason):
+        log.warning('nonce store %s failed: %s',
+                    self.store.__class__.__name__, reason)
+        change = None
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self._opened_at = time.time()
+                change = self._set_state(self.OPEN)
+        self._send_state_changed(change)
+
+    def _record_success(self):
+        if not self.failures and self.state == self.CLOSED:
+            return
+        with self._lock:
+            self.failures = 0
+            change = self._set_state(self.CLOSED)
+        self._send_state_changed(change)
+
+    def _set_state(self, new_state):
+        old_state = self.state
+        self.state = new_state
+        if old_state != new_state:
+            return old_state, new_state
+
+    def _send_state_changed(self, change):
+        # This is called without holding the lock in case a receiver
+        # uses the store.
+        if not change:
+            return
+        old_state, new_state = change
+        log.warning('nonce store circuit changed from %s to %s',
+                    old_state, new_state)
+        nonce_store_state_changed.send(sender=self.__class__, store=self,
+                                       old_state=old_state,
+                                       new_state=new_state)
@@ -0,0 +1,337 @@
+import hashlib
+import logging
+import math
+import zlib
+from base64 import b64encode
+
+from mohawk import Receiver
+from mohawk.base import EmptyValue, Resource, default_ts_skew_in_seconds
+from mohawk.exc import (AlreadyProcessed, CredentialsLookupError, MacMismatch,
+                        MisComputedContentHash, MissingAuthorization,
+                        TokenExpired)
+from mohawk.util import (HAWK_VER, calculate_mac, calculate_ts_mac,
+                         parse_authorization_header, parse_content_type,
+                         strings_match, utc_now, validate_credentials)
+
+from hawkrest.util import LRUCache, get_hawk_setting
+
+
+log = logging.getLogger(__name__)
+
+
+class HawkReceiver(Receiver):
+    """
+    A mohawk Receiver that verifies a request in two phases.
+
+    The constructor is the cheap header phase: it parses the header, looks
+    up credentials, checks the header MAC, the timestamp and finally the
+    nonce. The payload phase, ``verify_content()``, hashes the request
+    body. Running the phases in this order means expired, forged or
+    replayed requests are rejected without reading the body, and only
+    authentic, unexpired requests are recorded in the nonce store.
+
+    The same mohawk exceptions as ``Receiver`` are raised and
+    ``respond()`` works the same way.
+    """
+    # Bigger reads make hashing large bodies much faster.
+    block_size = 64 * 1024
+
+    def __init__(self,
+                 credentials_map,
+                 request_header,
+                 url,
+                 method,
+                 content_type=EmptyValue,
+                 seen_nonce=None,
+                 localtime_offset_in_seconds=0,
+                 accept_untrusted_content=False,
+                 timestamp_skew_in_seconds=default_ts_skew_in_seconds,
+                 timer=None):
+
+        self.timer = timer
+        self.response_header = None
+        self.credentials_map = credentials_map
+        self.seen_nonce = seen_nonce
+        self.accept_untrusted_content = accept_untrusted_content
+
+        if not request_header:
+            raise MissingAuthorization()
+
+        parsed_header = self._parse_header(request_header)
+        if timer:
+            timer.lap('header')
+
+        try:
+            credentials = self.credentials_map(parsed_header['id'])
+        except LookupError as exc:
+            log.debug('Catching %s: %s', type(exc), exc)
+            raise CredentialsLookupError(
+                'Could not find credentials for ID {0}'
+                .format(parsed_header['id']))
+        if timer:
+            timer.lap('credentials_lookup')
+        validate_credentials(credentials)
+
+        resource = self._make_resource(url=url,
+                                       method=method,
+                                       ext=parsed_header.get('ext', None),
+                                       app=parsed_header.get('app', None),
+                                       dlg=parsed_header.get('dlg', None),
+                                       credentials=credentials,
+                                       nonce=parsed_header['nonce'],
+                                       seen_nonce=self.seen_nonce,
+                                       timestamp=parsed_header['ts'],
+                                       content_type=content_type)
+
+        self.parsed_header = parsed_header
+        self.resource = resource
+        if timer:
+            timer.lap('header')
+        self._authorize_header(
+            timestamp_skew_in_seconds=timestamp_skew_in_seconds,
+            localtime_offset_in_seconds=localtime_offset_in_seconds)
+
+    def _parse_header(self, request_header):
+        return parse_authorization_header(request_header)
+
+    def _make_resource(self, **kw):
+        return Resource(**kw)
+
+    def _strings_match(self, ours, theirs):
+        return strings_match(ours, theirs)
+
+    def _check_header_mac(self):
+        # The header MAC covers the declared payload hash so it can be
+        # checked before the payload itself.
+        their_mac = self.parsed_header.get('mac', '')
+        mac = calculate_mac('header', self.resource,
+                            self.parsed_header.get('hash', ''))
+        if not self._strings_match(mac, their_mac):
+            raise MacMismatch('MACs do not match; ours: {ours}; '
+                              'theirs: {theirs}'
+                              .format(ours=mac, theirs=their_mac))
+
+    def _authorize_header(self, timestamp_skew_in_seconds,
+                          localtime_offset_in_seconds):
+        parsed_header = self.parsed_header
+        resource = self.resource
+
+        self._check_header_mac()
+
+        now = utc_now(offset_in_seconds=localtime_offset_in_seconds)
+        their_ts = int(parsed_header['ts'])
+        if math.fabs(their_ts - now) > timestamp_skew_in_seconds:
+            message = ('token with UTC timestamp {ts} has expired; '
+                       'it was compared to {now}'
+                       .format(ts=their_ts, now=now))
+            tsm = calculate_ts_mac(now, resource.credentials)
+            if isinstance(tsm, bytes):
+                tsm = tsm.decode('ascii')
+            www_authenticate = ('Hawk ts="{ts}", tsm="{tsm}", error="{error}"'
+                                .format(ts=now, tsm=tsm, error=message))
+            raise TokenExpired(message,
+                               localtime_in_seconds=now,
+                               www_authenticate=www_authenticate)
+        if self.timer:
+            self.timer.lap('mac')
+
+        self._check_nonce()
+        if self.timer:
+            self.timer.lap('nonce')
+
+    def _check_nonce(self):
+        if self.seen_nonce:
+            if self.seen_nonce(self.resource.credentials['id'],
+                               self.parsed_header['nonce'],
+                               self.parsed_header['ts']):
+                raise self._already_processed()
+        else:
+            log.warning('seen_nonce was None; not checking nonce. '
+                        'You may be vulnerable to replay attacks')
+
+    def _already_processed(self):
+        return AlreadyProcessed('Nonce {nonce} with timestamp {ts} '
+                                'has already been processed for {id}'
+                                .format(nonce=self.parsed_header['nonce'],
+                                        ts=self.parsed_header['ts'],
+                                        id=self.resource.credentials['id']))
+
+    def verify_content(self, content):
+        """
+        Verifies the request body against the hash in the header.
+
+        ``content`` is a byte string or a file-like object, which is read
+        in chunks. Raises ``MisComputedContentHash`` if it doesn't match.
+        """
+        resource = self.resource
+        resource.content = content
+
+        if 'hash' not in self.parsed_header:
+            # The request did not hash its content.
+            if not content and not resource.content_type:
+                # It is acceptable to not receive a hash if there is no
+                # content to hash.
+                log.debug('NOT calculating/verifying payload hash '
+                          '(no hash in header, request body is empty)')
+                return
+            elif self.accept_untrusted_content:
+                log.debug('NOT calculating/verifying payload hash '
+                          '(no hash in header, accept_untrusted_content=True)')
+                return
+
+        their_hash = self.parsed_header.get('hash', '')
+        if not their_hash:
+            log.info('request unexpectedly did not hash its content')
+
+        content_hash = self._hash_content(content)
+        if not self._strings_match(content_hash, their_hash):
+            # The hash declared in the header is incorrect.
+            # Content could have been tampered with.
+            raise MisComputedContentHash(
+                'Our hash {ours} ({algo}) did not '
+                'match theirs {theirs}'
+                .format(ours=content_hash,
+                        theirs=their_hash,
+                        algo=resource.credentials['algorithm']))
+        if self.timer:
+            self.timer.lap('payload_hash')
+
+    def _hash_content(self, content):
+        # Unlike calculate_payload_hash(), this doesn't format the content
+        # for a debug log, which holds the GIL for as long as it takes.
+        payload_hash = PayloadHash(self.resource.credentials['algorithm'],
+                                   self.resource.content_type)
+        if hasattr(content, 'read'):
+            while True:
+                block = content.read(self.block_size)
+                if not block:
+                    break
+                payload_hash.update(block)
+        elif content:
+            if not isinstance(content, bytes):
+                content = content.encode('utf8')
+            payload_hash.update(content)
+        return payload_hash.b64digest()
+
+
+class PayloadHash(object):
+    """
+    Computes a Hawk payload hash from content that arrives in chunks.
+
+    The result is the same as mohawk's ``calculate_payload_hash()`` but
+    the content never needs to be held in memory at once:
+
+        payload_hash = PayloadHash('sha256', 'text/plain')
+        for chunk in chunks:
+            payload_hash.update(chunk)
+        content_hash = payload_hash.b64digest()
+    """
+
+    def __init__(self, algorithm, content_type):
+        self.hash = hashlib.new(algorithm)
+        self.hash.update('hawk.{ver}.payload\n{content_type}\n'
+                         .format(ver=HAWK_VER,
+                                 content_type=parse_content_type(content_type))
+                         .encode('utf8'))
+
+    def update(self, chunk):
+        self.hash.update(chunk)
+
+    def b64digest(self):
+        final = self.hash.copy()
+        final.update(b'\n')
+        return b64encode(final.digest())
+
+
+class PayloadHashCache(object):
+    """
+    A bounded cache of response payload hashes.
+
+    Responses with a strong ``ETag`` header are keyed by algorithm,
+    content type, ``Content-Encoding``, request method and path, and the
+    ``ETag``. An ``ETag`` only identifies a version of one resource, so
+    different URLs can use the same one.
+
+    With ``use_checksum=True``, other responses are keyed by algorithm,
+    content type and the length and CRC-32 and Adler-32 checksums of the
+    content. Computing those reads the whole body, which costs about as
+    much as hashing it, so this rarely saves time. The checksums are also
+    not cryptographic: someone who controls the content of one response
+    could craft another with the same key.
+    """
+
+    def __init__(self, max_size=1000, use_checksum=False):
+        self.use_checksum = use_checksum
+        self.hashes = LRUCache(max_size)
+
+    @property
+    def hits(self):
+        return self.hashes.hits
+
+    @property
+    def misses(self):
+        return self.hashes.misses
+
+    @property
+    def hit_rate(self):
+        return self.hashes.hit_rate
+
+    def make_key(self, algorithm, content_type, etag=None, content=None,
+                 method=None, path=None, content_encoding=None):
+        """
+        Returns a cache key or None if the content can't be identified.
+
+        ``method`` and ``path`` are those of the request, as in
+        ``request.get_full_path()``. ``content_encoding`` is the
+        response's ``Content-Encoding``, since the same ``ETag`` may be
+        sent with and without compression.
+        """
+        if etag and not etag.startswith('W/'):
+            return (algorithm, content_type, content_encoding, 'etag',
+                    method, path, etag)
+        if content is not None and self.use_checksum:
+            return (algorithm, content_type, len(content),
+                    zlib.crc32(content), zlib.adler32(content))
+        return None
+
+    def get(self, key):
+        return self.hashes.get(key)
+
+    def set(self, key, content_hash):
+        self.hashes.set(key, content_hash)
+
+    def clear(self):
+        self.hashes.clear()
+
+
+def get_payload_hash_cache():
+    """
+    Returns the active PayloadHashCache or None if
+    ``HAWK_RESPONSE_HASH_CACHE`` is not configured.
+    """
+    return get_hawk_setting('response_hash_cache')
+
+
+def respond_with_content_hash(receiver, content_hash, ext=None):
+    """
+    Signs a response like ``receiver.respond()`` but with a payload hash
+    that was already computed, for example with ``PayloadHash``.
+
+    This works with any mohawk ``Receiver`` and sets its
+    ``response_header``.
+    """
+    resource = Resource(url=receiver.resource.url,
+                        credentials=receiver.resource.credentials,
+                        ext=ext,
+                        app=receiver.parsed_header.get('app', None),
+                        dlg=receiver.parsed_header.get('dlg', None),
+                        method=receiver.resource.method,
+                        nonce=receiver.parsed_header['nonce'],
+                        timestamp=receiver.parsed_header['ts'])
+    # This is what Resource.gen_content_hash() would have set.
+    resource._content_hash = content_hash
+
+    mac = calculate_mac('response', resource, content_hash)
+    receiver.response_header = receiver._make_header(
+        resource, mac, additional_keys=['ext'])
+    return receiver.response_header
@@ -0,0 +1,28 @@
+from django.dispatch import Signal
+
+
+# Sent when a CircuitBreakerNonceStore changes state. Arguments:
+# store, old_state, new_state.
+nonce_store_state_changed = Signal()
+
+# Sent after HawkAuthentication authenticated or rejected a Hawk request.
+# Arguments: request, phases, error. ``phases`` maps each phase (header,
+# credentials_lookup, mac, nonce, payload_hash, user_lookup) to the
+# seconds it took. ``error`` is the HawkFail exception of a rejected
+# request or None.
+authentication_timed = Signal()
+
+# Sent after HawkResponseMiddleware signed a response. Arguments: request,
+# response, phases. ``phases`` maps each phase (compress, payload_hash,
+# mac) to the seconds it took.
+response_signing_timed = Signal()
+
+
+def is_timed(signal):
+    """
+    Returns True if a timing signal has receivers.
+
+    Requests are only timed when someone listens, which keeps the cost
+    to this check otherwise.
+    """
+    return bool(signal.receivers)
@@ -1,3 +1,38 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+# A monotonic clock.
+perf_counter = getattr(time, 'perf_counter', time.time)
+
+
+def get_hawk_setting(name):
+    """
+    Returns the ``name`` attribute of ``hawkrest.conf.hawk_settings``.
+
+    hawkrest.conf imports most hawkrest modules, so they can't import it
+    themselves when they are imported.
+    """
+    from hawkrest.conf import hawk_settings
+    return getattr(hawk_settings, name)
+
+
+def write_json(path, data, **kw):
+    """
+    Writes ``data`` to ``path`` as JSON. The file is written under a
+    temporary name and then renamed, so that processes reading ``path``
+    never see it half written.
+    """
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kw)
+    os.rename(tmp_path, path)
+
+
 def get_auth_header(request):
     return request.META.get('HTTP_AUTHORIZATION', '')
 
@@ -5,3 +40,153 @@ def get_auth_header(request):
 def is_hawk_request(request):
     auth_header = get_auth_header(request)
     return auth_header.startswith('Hawk ')
+
+
+def get_django_request(request):
+    # Django Rest Framework wraps the Django request.
+    return getattr(request, '_request', request)
+
+
+def can_stream_body(request):
+    """
+    Returns True if the request has a body that nobody has read yet.
+    """
+    request = get_django_request(request)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return (content_length > 0 and
+            not hasattr(request, '_body') and
+            not request._read_started)
+
+
+class BodySpool(object):
+    """
+    A file-like object that reads a request body while copying it to a
+    temporary file.
+
+    This lets the body be hashed in chunks instead of read into memory as
+    a whole. The copy stays in memory up to ``max_memory_size`` bytes and
+    then moves to disk. Call ``restore()`` afterwards so that the request
+    body can be read again, for example by parsers.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, request, max_memory_size):
+        self.request = get_django_request(request)
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory_size)
+
+    def read(self, size=-1):
+        data = self.request.read(size)
+        self.file.write(data)
+        return data
+
+    def restore(self):
+        # Copy anything that wasn't read yet.
+        while self.read(self.chunk_size):
+            pass
+        self.file.seek(0)
+        self.request._stream = self.file
+        self.request._read_started = False
+
+
+class FileChunks(object):
+    """
+    Iterates over a file in chunks, for use as streaming response content.
+
+    Django calls ``close()`` when the response is closed, which closes
+    the file.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, file):
+        self.file = file
+
+    def __iter__(self):
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+class LRUCache(object):
+    """
+    A thread-safe, size bounded, in-process cache with optional expiry.
+
+    When the cache is full, the least recently used entry is evicted.
+    Entries older than ``timeout`` seconds are treated as missing.
+    """
+    missing = object()
+
+    def __init__(self, max_size, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, self.missing)
+            if entry is not self.missing:
+                expires, value = entry
+                if expires is None or expires > time.time():
+                    # Re-insert to mark the key as most recently used.
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = None
+        if self.timeout is not None:
+            expires = time.time() + self.timeout
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+class PhaseTimer(object):
+    """
+    Adds up how long each phase of a request takes.
+
+    ``lap(phase)`` adds the time since the previous lap, or since the timer
+    was created or ``mark()`` was called, to ``phases[phase]``.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.mark()
+
+    def mark(self):
+        self._last = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
@@ -0,0 +1,113 @@
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.conf import hawk_settings
+
+
+log = logging.getLogger(__name__)
+
+
+class HawkWSGIMiddleware(object):
+    """
+    WSGI middleware that verifies Hawk requests before Django sees them.
+
+    Requests with a Hawk ``Authorization`` header whose path starts with
+    one of ``path_prefixes`` (default: ``HAWK_WSGI_PATH_PREFIXES``) are
+    verified with ``authentication_class().verify()``, which uses the same
+    credentials lookup and nonce store as ``HawkAuthentication``. A
+    request that fails gets a 401 response without going through Django's
+    middleware, URL resolution or views. The receiver of a request that
+    passes is stored in the environ, where ``HawkAuthentication`` and
+    ``HawkResponseMiddleware`` find it so the request isn't verified
+    twice. For example, in your ``wsgi.py``:
+
+        application = HawkWSGIMiddleware(get_wsgi_application())
+
+    Requests without a Hawk header are passed on unchanged.
+    """
+
+    def __init__(self, application, path_prefixes=None,
+                 authentication_class=HawkAuthentication):
+        self.application = application
+        self.path_prefixes = path_prefixes
+        self.authentication = authentication_class()
+
+    def get_path_prefixes(self):
+        if self.path_prefixes is not None:
+            return tuple(self.path_prefixes)
+        return tuple(hawk_settings.HAWK_WSGI_PATH_PREFIXES)
+
+    def __call__(self, environ, start_response):
+        if (not environ.get('HTTP_AUTHORIZATION', '').startswith('Hawk ') or
+                not environ.get('PATH_INFO', '').startswith(
+                    self.get_path_prefixes())):
+            return self.application(environ, start_response)
+
+        if self.body_too_big(environ):
+            # Verifying would record the nonce before reading the body
+            # failed, and Django would then reject the request as a
+            # replay instead of responding with a 400.
+            log.debug('Not verifying Hawk request in WSGI: body too big')
+            return self.application(environ, start_response)
+
+        # Django's request object uses the environ as its META.
+        request = WSGIRequest(environ)
+
+        try:
+            self.authentication.verify(request)
+        except AuthenticationFailed as exc:
+            return self.unauthorized(request, exc, start_response)
+        except Exception as exc:
+            # Leave disallowed hosts and anything else verify() doesn't
+            # handle, such as a header mohawk can't parse, to Django so it
+            # responds the same way as without this middleware. These fail
+            # before the nonce is recorded.
+            log.debug('Not verifying Hawk request in WSGI: %r', exc)
+            environ.pop('hawk.receiver', None)
+            return self.application(environ, start_response)
+
+        self.restore_body(environ, request)
+        return self.application(environ, start_response)
+
+    def body_too_big(self, environ):
+        """
+        Returns True if Django would refuse to read the request body, as
+        ``request.body`` does with ``DATA_UPLOAD_MAX_MEMORY_SIZE``.
+        """
+        # Django < 1.10 has no limit.
+        max_size = getattr(settings, 'DATA_UPLOAD_MAX_MEMORY_SIZE', None)
+        if max_size is None:
+            return False
+        try:
+            return int(environ.get('CONTENT_LENGTH') or 0) > max_size
+        except ValueError:
+            # Leave it to Django.
+            return True
+
+    def restore_body(self, environ, request):
+        """
+        Makes the request body that was read while verifying it readable
+        again for the application.
+        """
+        if hasattr(request, '_body'):
+            environ['wsgi.input'] = io.BytesIO(request._body)
+        else:
+            # A BodySpool was restored as the stream.
+            environ['wsgi.input'] = request._stream
+
+    def unauthorized(self, request, exc, start_response):
+        # The same response as Django Rest Framework's.
+        body = json.dumps({'detail': str(exc.detail)}).encode('utf8')
+        start_response('401 Unauthorized', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('WWW-Authenticate',
+             self.authentication.authenticate_header(request)),
+        ])
+        return [body]
@@ -24,4 +24,4 @@ setup(name='hawkrest',
           'Topic :: Internet :: WWW/HTTP',
       ],
       packages=find_packages(exclude=['tests']),
-      install_requires=['djangorestframework', 'mohawk>=0.3.4'])
+      install_requires=['djangorestframework', 'mohawk>=1.1.0'])
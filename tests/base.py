@@ -4,6 +4,15 @@ from django.test import RequestFactory, TestCase
 from mohawk import Sender
 
 
+def logged_message(log_method):
+    """
+    Returns the message of the last call to a mocked logger method, with
+    its lazy %-style arguments applied.
+    """
+    args = log_method.call_args[0]
+    return args[0] % args[1:] if len(args) > 1 else args[0]
+
+
 class BaseTest(TestCase):
 
     def setUp(self):
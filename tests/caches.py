@@ -0,0 +1,14 @@
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class SlowCache(LocMemCache):
+    """
+    A cache that takes `delay` seconds to answer, like a stalled server.
+    """
+    delay = 0
+
+    def add(self, *args, **kw):
+        time.sleep(self.delay)
+        return super(SlowCache, self).add(*args, **kw)
@@ -36,7 +36,27 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'hawkrest-tests'
-    }
+    },
+    'nonces': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hawkrest-tests-nonces'
+    },
+    'nonces-2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hawkrest-tests-nonces-2'
+    },
+    'nonces-3': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hawkrest-tests-nonces-3'
+    },
+    'nonces-4': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hawkrest-tests-nonces-4'
+    },
+    'slow': {
+        'BACKEND': 'tests.caches.SlowCache',
+        'LOCATION': 'hawkrest-tests-slow'
+    },
 }
 
 INSTALLED_APPS = (
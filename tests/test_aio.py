@@ -0,0 +1,398 @@
+import asyncio
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.asyncio import async_unsafe
+
+import mock
+from mohawk import Sender
+from mohawk.exc import MisComputedContentHash
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthenticatedUser, default_credentials_lookup
+from hawkrest.aio import (AsyncHawkAuthentication,
+                          AsyncHawkResponseMiddleware, aseen_nonce,
+                          get_hash_executor)
+from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.nonce import (BaseNonceStore, CacheNonceStore,
+                            CircuitBreakerNonceStore, DatabaseNonceStore,
+                            MemoryNonceStore, ShardedCacheNonceStore)
+from hawkrest.receiver import HawkReceiver
+
+from .base import BaseTest, logged_message
+
+
+async def async_credentials_lookup(cr_id):
+    return default_credentials_lookup(cr_id)
+
+
+async def async_user_lookup(request, credentials):
+    return 'async-user', credentials['id']
+
+
+@contextmanager
+def record_threads(cls, method):
+    """
+    Records the name of each thread that calls cls.method().
+    """
+    names = []
+    original = getattr(cls, method)
+
+    def wrapper(*args, **kw):
+        names.append(threading.current_thread().name)
+        return original(*args, **kw)
+
+    with mock.patch.object(cls, method, wrapper):
+        yield names
+
+
+def in_hash_pool(names):
+    return bool(names) and all(name.startswith('hawk-hash')
+                               for name in names)
+
+
+class ThreadedNonceStore(BaseNonceStore):
+
+    def __init__(self):
+        self.seen = set()
+
+    def seen_nonce(self, id, nonce, timestamp):
+        seen = nonce in self.seen
+        self.seen.add(nonce)
+        return seen
+
+
+class TestAseenNonce(BaseTest):
+
+    def setUp(self):
+        super(TestAseenNonce, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    async def check_twice(self, store):
+        now = str(int(time.time()))
+        eq_(await aseen_nonce(store, 'id', 'abc', now), False)
+        eq_(await aseen_nonce(store, 'id', 'abc', now), True)
+
+    async def test_cache_store(self):
+        await self.check_twice(CacheNonceStore())
+
+    async def test_cache_store_uses_aadd(self):
+        store = CacheNonceStore()
+        with mock.patch.object(type(store.cache), 'aadd',
+                               new_callable=mock.AsyncMock,
+                               side_effect=[True, False]) as aadd:
+            await self.check_twice(store)
+        eq_(aadd.call_args[1]['timeout'], store.timeout)
+
+    async def test_sharded_cache_store(self):
+        await self.check_twice(
+            ShardedCacheNonceStore(cache_aliases=['nonces', 'nonces-2']))
+
+    async def test_non_blocking_store_called_directly(self):
+        with mock.patch('hawkrest.aio.sync_to_async') as sync_to_async:
+            await self.check_twice(MemoryNonceStore())
+        assert not sync_to_async.called, 'expected no thread'
+
+    async def test_blocking_store_in_thread(self):
+        await self.check_twice(ThreadedNonceStore())
+
+    async def test_blocking_store_not_thread_sensitive(self):
+        with record_threads(ThreadedNonceStore, 'seen_nonce') as names:
+            await self.check_twice(ThreadedNonceStore())
+        assert threading.main_thread().name not in names, names
+
+    async def test_database_store_in_sync_thread(self):
+        # Django closes the connections of that thread after a request. A
+        # pool thread would keep its connection open.
+        with record_threads(DatabaseNonceStore, 'seen_nonce') as names:
+            await self.check_twice(DatabaseNonceStore())
+        eq_(set(names), {threading.main_thread().name})
+
+    def test_circuit_breaker_uses_database(self):
+        store = CircuitBreakerNonceStore(
+            store='hawkrest.nonce.DatabaseNonceStore')
+        self.addCleanup(store.close)
+        assert store.uses_database, 'expected the wrapped store to count'
+        store = CircuitBreakerNonceStore()
+        self.addCleanup(store.close)
+        assert not store.uses_database
+
+    async def test_store_with_aseen_nonce(self):
+        store = mock.Mock()
+        store.aseen_nonce = mock.AsyncMock(return_value=True)
+        eq_(await aseen_nonce(store, 'id', 'abc', '1'), True)
+        store.aseen_nonce.assert_called_with('id', 'abc', '1')
+
+
+class TestAsyncAuthentication(BaseTest):
+
+    def setUp(self):
+        super(TestAsyncAuthentication, self).setUp()
+        self.auth = AsyncHawkAuthentication()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def post(self, sender=None, **kw):
+        sender = sender or self._sender(method='POST', content='{}',
+                                        content_type='application/json',
+                                        **kw)
+        return self._request(sender, method='POST', data='{}',
+                             content_type='application/json')
+
+    async def test_authenticate(self):
+        req = self.post()
+        user, auth = await self.auth.aauthenticate(req)
+        assert isinstance(user, HawkAuthenticatedUser)
+        eq_(req.META['hawk.receiver'].resource.credentials['id'],
+            self.credentials_id)
+
+    async def test_no_header(self):
+        eq_(await self.auth.aauthenticate(self.factory.get('/')), None)
+
+    async def test_replay(self):
+        sender = self._sender(method='POST', content='{}',
+                              content_type='application/json')
+        await self.auth.aauthenticate(self.post(sender=sender))
+        with self.assertRaisesRegex(AuthenticationFailed,
+                                    '^Hawk authentication failed$'):
+            await self.auth.aauthenticate(self.post(sender=sender))
+
+    async def test_nonce_check_disabled(self):
+        sender = self._sender(method='POST', content='{}',
+                              content_type='application/json')
+        with self.settings(USE_CACHE_FOR_HAWK_NONCE=False):
+            await self.auth.aauthenticate(self.post(sender=sender))
+            await self.auth.aauthenticate(self.post(sender=sender))
+
+    async def test_expired(self):
+        with self.assertRaisesRegex(AuthenticationFailed,
+                                    'The token has expired'):
+            await self.auth.aauthenticate(self.post(_timestamp='123'))
+
+    async def test_unknown_credentials(self):
+        sender = Sender({'id': 'unknown', 'key': 'x', 'algorithm': 'sha256'},
+                        self.url, 'POST', content='{}',
+                        content_type='application/json')
+        with mock.patch('hawkrest.log') as log:
+            with self.assertRaises(AuthenticationFailed):
+                await self.auth.aauthenticate(self.post(sender=sender))
+        assert 'CredentialsLookupError' in logged_message(log.warning)
+
+    async def test_tampered_body(self):
+        sender = self._sender(method='POST', content='{"a": 1}',
+                              content_type='application/json')
+        with mock.patch('hawkrest.log') as log:
+            with self.assertRaises(AuthenticationFailed):
+                await self.auth.aauthenticate(self.post(sender=sender))
+        assert 'MisComputedContentHash' in logged_message(log.warning)
+
+    async def test_async_lookups(self):
+        with self.settings(
+                HAWK_CREDENTIALS_LOOKUP='{}.async_credentials_lookup'
+                                        .format(__name__),
+                HAWK_USER_LOOKUP='{}.async_user_lookup'.format(__name__)):
+            eq_(await self.auth.aauthenticate(self.post()),
+                ('async-user', self.credentials_id))
+
+    async def test_cached_credentials_without_thread(self):
+        with self.settings(HAWK_CREDENTIALS_CACHE={'MAX_SIZE': 10}):
+            await self.auth.aauthenticate(self.post())
+            with mock.patch('hawkrest.aio.sync_to_async') as sync_to_async:
+                await self.auth.aauthenticate(self.post())
+        assert not sync_to_async.called, 'expected no thread'
+
+    async def test_small_body_hashed_inline(self):
+        with record_threads(HawkReceiver, 'verify_content') as names:
+            await self.auth.aauthenticate(self.post())
+        assert not in_hash_pool(names), names
+
+    async def test_large_body_hashed_in_pool(self):
+        with self.settings(HAWK_ASYNC_HASH_THRESHOLD=2):
+            with record_threads(HawkReceiver, 'verify_content') as names:
+                user, auth = await self.auth.aauthenticate(self.post())
+        assert in_hash_pool(names), names
+        assert isinstance(user, HawkAuthenticatedUser)
+
+    async def test_large_tampered_body(self):
+        sender = self._sender(method='POST', content='{"a": 1}',
+                              content_type='application/json')
+        with self.settings(HAWK_ASYNC_HASH_THRESHOLD=2):
+            with self.assertRaises(AuthenticationFailed):
+                await self.auth.aauthenticate(self.post(sender=sender))
+
+    async def test_subclass_lookup(self):
+        class Authentication(AsyncHawkAuthentication):
+            async def ahawk_credentials_lookup(self, cr_id):
+                raise LookupError(cr_id)
+
+        with self.assertRaises(AuthenticationFailed):
+            await Authentication().aauthenticate(self.post())
+
+    async def test_overridden_sync_user_lookup(self):
+        class Authentication(AsyncHawkAuthentication):
+            # Like an ORM query, this must not run on the event loop.
+            @async_unsafe
+            def hawk_user_lookup(self, request, credentials):
+                return 'db-user', credentials['id']
+
+        eq_(await Authentication().aauthenticate(self.post()),
+            ('db-user', self.credentials_id))
+
+    async def test_overridden_sync_credentials_lookup(self):
+        class Authentication(AsyncHawkAuthentication):
+            @async_unsafe
+            def hawk_credentials_lookup(self, cr_id):
+                raise LookupError(cr_id)
+
+        with self.settings(HAWK_CREDENTIALS_CACHE={'MAX_SIZE': 10}):
+            # The default lookup caches the credentials.
+            await self.auth.aauthenticate(self.post())
+            with self.assertRaises(AuthenticationFailed):
+                await Authentication().aauthenticate(self.post())
+
+
+class TestAsyncMiddleware(BaseTest):
+    content = b'the response ' * 100
+
+    def setUp(self):
+        super(TestAsyncMiddleware, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def request(self):
+        sender = self._sender()
+        req = self._request(sender)
+        req.META['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        AsyncHawkAuthentication().authenticate(req)
+        return req, sender
+
+    async def respond(self, response):
+        async def get_response(request):
+            return response
+
+        middleware = AsyncHawkResponseMiddleware(get_response)
+        assert asyncio.iscoroutinefunction(middleware)
+        req, sender = self.request()
+        return await middleware(req), sender
+
+    async def content_of(self, response):
+        if not response.streaming:
+            return response.content
+        if response.is_async:
+            return b''.join([chunk async for chunk in
+                             response.streaming_content])
+        return b''.join(response.streaming_content)
+
+    async def accept(self, response, sender):
+        sender.accept_response(response['Server-Authorization'],
+                               content=await self.content_of(response),
+                               content_type=response['Content-Type'])
+
+    async def test_response(self):
+        with mock.patch('hawkrest.aio.sync_to_async') as sync_to_async:
+            res, sender = await self.respond(HttpResponse(self.content))
+        assert not sync_to_async.called, 'expected no thread'
+        await self.accept(res, sender)
+
+    async def test_tampered_response(self):
+        res, sender = await self.respond(HttpResponse(self.content))
+        res.content = b'TAMPERED WITH'
+        with self.assertRaises(MisComputedContentHash):
+            await self.accept(res, sender)
+
+    async def test_async_streaming_response(self):
+        async def chunks():
+            yield self.content
+            yield self.content
+
+        res, sender = await self.respond(StreamingHttpResponse(chunks()))
+        content = await self.content_of(res)
+        eq_(content, self.content * 2)
+        sender.accept_response(res['Server-Authorization'], content=content,
+                               content_type=res['Content-Type'])
+
+    async def test_sync_streaming_response(self):
+        res, sender = await self.respond(
+            StreamingHttpResponse([self.content, self.content]))
+        await self.accept(res, sender)
+
+    async def test_compressed_async_streaming_response(self):
+        async def chunks():
+            yield self.content
+
+        with self.settings(HAWK_COMPRESS_RESPONSES=True):
+            res, sender = await self.respond(StreamingHttpResponse(chunks()))
+        eq_(res['Content-Encoding'], 'gzip')
+        await self.accept(res, sender)
+
+    async def test_small_response_hashed_inline(self):
+        with record_threads(HawkResponseMiddleware,
+                            'get_content_hash') as names:
+            res, sender = await self.respond(HttpResponse(self.content))
+        assert not in_hash_pool(names), names
+        await self.accept(res, sender)
+
+    async def test_large_response_hashed_in_pool(self):
+        with self.settings(HAWK_ASYNC_HASH_THRESHOLD=len(self.content)):
+            with record_threads(HawkResponseMiddleware,
+                                'get_content_hash') as names:
+                res, sender = await self.respond(HttpResponse(self.content))
+        assert in_hash_pool(names), names
+        await self.accept(res, sender)
+
+    async def test_file_response_hashed_in_pool(self):
+        f = tempfile.NamedTemporaryFile(suffix='.txt')
+        self.addCleanup(f.close)
+        f.write(self.content)
+        f.flush()
+        with record_threads(HawkResponseMiddleware,
+                            'get_content_hash') as names:
+            res, sender = await self.respond(
+                FileResponse(open(f.name, 'rb')))
+        assert in_hash_pool(names), names
+        await self.accept(res, sender)
+        res.close()
+
+    async def test_async_streaming_response_hashed_in_pool(self):
+        async def chunks():
+            yield self.content
+
+        with record_threads(HawkResponseMiddleware,
+                            'get_content_hash') as names:
+            res, sender = await self.respond(StreamingHttpResponse(chunks()))
+        assert in_hash_pool(names), names
+        await self.accept(res, sender)
+
+    async def test_not_hawk_request(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        res = await AsyncHawkResponseMiddleware(get_response)(
+            self.factory.get('/'))
+        assert not res.has_header('Server-Authorization')
+
+    def test_sync_mode(self):
+        req, sender = self.request()
+        middleware = AsyncHawkResponseMiddleware(
+            lambda request: HttpResponse(self.content))
+        res = middleware(req)
+        sender.accept_response(res['Server-Authorization'],
+                               content=res.content,
+                               content_type=res['Content-Type'])
+
+
+class TestHashExecutor(BaseTest):
+
+    def test_workers(self):
+        with self.settings(HAWK_ASYNC_HASH_WORKERS=2):
+            executor = get_hash_executor()
+            eq_(executor._max_workers, 2)
+            assert get_hash_executor() is executor
+        with self.settings(HAWK_ASYNC_HASH_WORKERS=3):
+            eq_(get_hash_executor()._max_workers, 3)
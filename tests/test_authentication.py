@@ -1,7 +1,9 @@
 import re
+import threading
 import unittest
 
 from django.conf import settings
+from django.core.cache import cache
 
 try:
     # Importing via base_user avoids the need for `django.contrib.auth`
@@ -15,9 +17,10 @@ import mock
 from nose.tools import eq_
 from rest_framework.exceptions import AuthenticationFailed
 
-from hawkrest import HawkAuthenticatedUser, HawkAuthentication
+from hawkrest import HawkAuthenticatedUser, HawkAuthentication, seen_nonce
+from hawkrest.util import BodySpool
 
-from .base import BaseTest
+from .base import BaseTest, logged_message
 
 
 ALTERNATIVE_CREDS = {
@@ -56,7 +59,7 @@ class AuthTest(BaseTest):
         self.addCleanup(p.stop)
 
     def assert_log_regex(self, method, pattern):
-        log_call = getattr(self.mock_log, method).call_args[0][0]
+        log_call = logged_message(getattr(self.mock_log, method))
         assert re.search(pattern, log_call), (
             'Expected log.{}() matching "{}", saw: "{}"'.format(method, pattern, log_call))
 
@@ -120,6 +123,10 @@ class TestAuthentication(AuthTest):
                                 '^Hawk authentication failed$',
                                 lambda: self.auth.authenticate(req))
         self.assert_log_regex('warning', '^access denied: MisComputedContentHash: ')
+        # The traceback is left for the logging framework to format, if
+        # debug logging is on.
+        self.mock_log.debug.assert_called_with('Hawk authentication failed',
+                                               exc_info=True)
 
     def test_hawk_get_wrong_sig(self):
         sender = self._sender(url='http://realsite.com')
@@ -201,13 +208,78 @@ class TestAuthentication(AuthTest):
             'Expected returning a user')
 
 
+class TestStreamingBody(AuthTest):
+    post_data = 'one=1&two=2&three=3'
+    content_type = 'application/x-www-form-urlencoded'
+
+    def post(self, sender_data=None, data=None):
+        sender = self._sender(content=sender_data or self.post_data,
+                              content_type=self.content_type,
+                              method='POST')
+        return self._request(sender,
+                             content_type=self.content_type,
+                             data=data or self.post_data,
+                             method='POST')
+
+    def test_hawk_post(self):
+        req = self.post()
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            with mock.patch('hawkrest.BodySpool.read',
+                            autospec=True,
+                            side_effect=BodySpool.read) as read:
+                assert isinstance(self.auth.authenticate(req)[0],
+                                  HawkAuthenticatedUser), (
+                    'Expected a successful authentication returning a user')
+        assert read.called, 'expected the body to be streamed'
+
+    def test_body_readable_afterwards(self):
+        req = self.post()
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            self.auth.authenticate(req)
+        eq_(req.body, self.post_data.encode('ascii'))
+        eq_(req.POST['two'], '2')
+
+    def test_spools_to_disk(self):
+        post_data = 'x=' + 'y' * 1000
+        req = self.post(sender_data=post_data, data=post_data)
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True,
+                           HAWK_BODY_SPOOL_MAX_MEMORY_SIZE=100):
+            self.auth.authenticate(req)
+        assert req._stream._rolled, 'expected the body to be on disk'
+        eq_(req.read(), post_data.encode('ascii'))
+
+    def test_wrong_sig(self):
+        req = self.post(data=self.post_data + '&TAMPERED_WITH=true')
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            self.assertRaisesRegexp(AuthenticationFailed,
+                                    '^Hawk authentication failed$',
+                                    lambda: self.auth.authenticate(req))
+        self.assert_log_regex('warning',
+                              '^access denied: MisComputedContentHash: ')
+
+    def test_body_already_read(self):
+        req = self.post()
+        req.body
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            with mock.patch('hawkrest.BodySpool') as spool:
+                self.auth.authenticate(req)
+        assert not spool.called, 'expected the body to be used as is'
+
+    def test_get(self):
+        req = self._request(self._sender())
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            assert isinstance(self.auth.authenticate(req)[0],
+                              HawkAuthenticatedUser), (
+                'Expected a successful authentication returning a user')
+
+
 class TestNonce(AuthTest):
 
     def setUp(self):
         super(TestNonce, self).setUp()
 
-        p = mock.patch('hawkrest.cache')
-        self.cache = p.start()
+        p = mock.patch('hawkrest.nonce.caches')
+        self.cache = p.start().__getitem__.return_value
         self.addCleanup(p.stop)
 
     def auth_request(self):
@@ -216,17 +288,19 @@ class TestNonce(AuthTest):
         self.auth.authenticate(req)
 
     def test_check_nonce_ok(self):
-        self.cache.get.return_value = False
+        self.cache.add.return_value = True
         self.auth_request()
-        assert self.cache.get.called, 'nonce should have been checked'
+        assert self.cache.add.called, 'nonce should have been checked'
 
-    def test_store_nonce(self):
-        self.cache.get.return_value = False
+    def test_store_nonce_in_one_call(self):
+        self.cache.add.return_value = True
         self.auth_request()
-        assert self.cache.set.called, 'nonce should have been cached'
+        eq_(self.cache.add.call_args[1]['timeout'], 65)
+        assert not self.cache.get.called, 'nonce should be added atomically'
+        assert not self.cache.set.called, 'nonce should be added atomically'
 
     def test_nonce_exists(self):
-        self.cache.get.return_value = True
+        self.cache.add.return_value = False
         self.assertRaisesRegexp(AuthenticationFailed,
                                 '^Hawk authentication failed$',
                                 self.auth_request)
@@ -236,7 +310,32 @@ class TestNonce(AuthTest):
     def test_disabled(self):
         with self.settings(USE_CACHE_FOR_HAWK_NONCE=False):
             self.auth_request()
-        assert not self.cache.get.called, 'nonce check should be disabled'
+        assert not self.cache.add.called, 'nonce check should be disabled'
+
+
+class TestConcurrentNonce(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_parallel_replays_accept_once(self):
+        results = []
+        start = threading.Event()
+
+        def check():
+            start.wait()
+            results.append(seen_nonce('script-user', 'abc123', '1500000000'))
+
+        threads = [threading.Thread(target=check) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        eq_(results.count(False), 1)
+        eq_(results.count(True), 19)
 
 
 class TestHawkAuthenticatedUser(unittest.TestCase):
@@ -268,3 +367,68 @@ class TestHawkAuthenticatedUser(unittest.TestCase):
 
     def test_has_usable_password(self):
         eq_(self.user.has_usable_password(), False)
+
+
+class TestRejectBeforeReadingBody(AuthTest):
+    post_data = 'one=1&two=2&three=3'
+    content_type = 'application/x-www-form-urlencoded'
+
+    def setUp(self):
+        super(TestRejectBeforeReadingBody, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def post(self, sender=None, data=None, **kw):
+        sender = sender or self._sender(content=self.post_data,
+                                        content_type=self.content_type,
+                                        method='POST', **kw)
+        return self._request(sender,
+                             content_type=self.content_type,
+                             data=data or self.post_data,
+                             method='POST')
+
+    def assert_body_not_read(self, req):
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate(req)
+        assert not hasattr(req, '_body'), 'body should not have been read'
+
+    def test_replay(self):
+        sender = self._sender(content=self.post_data,
+                              content_type=self.content_type,
+                              method='POST')
+        self.auth.authenticate(self.post(sender=sender))
+        self.assert_body_not_read(self.post(sender=sender))
+        self.assert_log_regex('warning',
+                              '^access denied: AlreadyProcessed: Nonce')
+
+    def test_expired(self):
+        self.assert_body_not_read(self.post(_timestamp='123'))
+        self.assert_log_regex('warning', '^access denied: TokenExpired: ')
+
+    def test_wrong_credentials(self):
+        self.assert_body_not_read(self.post(credentials=ALTERNATIVE_CREDS))
+        self.assert_log_regex('warning', '^access denied: ')
+
+    def test_expired_nonce_not_recorded(self):
+        with mock.patch('hawkrest.nonce.CacheNonceStore.seen_nonce') as seen:
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.authenticate(self.post(_timestamp='123'))
+        assert not seen.called, 'nonce should not have been checked'
+
+    def test_tampered_body_is_read(self):
+        req = self.post(data=self.post_data + '&TAMPERED_WITH=true')
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate(req)
+        self.assert_log_regex('warning',
+                              '^access denied: MisComputedContentHash: ')
+
+    def test_streamed_replay(self):
+        sender = self._sender(content=self.post_data,
+                              content_type=self.content_type,
+                              method='POST')
+        self.auth.authenticate(self.post(sender=sender))
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            with mock.patch('hawkrest.BodySpool') as spool:
+                with self.assertRaises(AuthenticationFailed):
+                    self.auth.authenticate(self.post(sender=sender))
+        assert not spool.called, 'body should not have been streamed'
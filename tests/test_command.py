@@ -1,8 +1,25 @@
+import io
+import logging
+
+try:
+    from StringIO import StringIO
+except ImportError:  # Python 3
+    from io import StringIO
+
 import mock
 
+from django.core.cache import cache
 from django.core.management.base import CommandError
 from django.core.management import call_command
+from django.http import HttpResponse
+from mohawk.exc import MacMismatch
+from nose.tools import eq_
 from requests.models import Response
+from urllib3 import HTTPResponse
+
+from hawkrest import HawkAuthentication
+from hawkrest.management.commands.hawkrequest import percentile
+from hawkrest.middleware import HawkResponseMiddleware
 
 from tests.base import BaseTest
 
@@ -50,3 +67,136 @@ class TestManagementCommand(BaseTest):
         mk_resp.return_value = response
         exec_cmd(url=self.url, creds=self.credentials_id)
         self.assertTrue(mk_accept.called)
+
+
+class ServerTest(BaseTest):
+
+    def serve(self, url, method, data, headers):
+        # Run the request through Hawk authentication and the middleware,
+        # then hand the response back like requests does.
+        req = getattr(self.factory, method)(
+            url, data=data, content_type=headers['Content-Type'],
+            CONTENT_TYPE=headers['Content-Type'],
+            HTTP_AUTHORIZATION=headers['Authorization'],
+            HTTP_ACCEPT_ENCODING='gzip')
+        HawkAuthentication().authenticate(req)
+        res = HawkResponseMiddleware(mock.Mock()).process_response(
+            req, HttpResponse('the response ' * 100))
+
+        response = Response()
+        response.status_code = res.status_code
+        response.headers.update(res.items())
+        response.raw = HTTPResponse(body=io.BytesIO(res.content),
+                                    headers=dict(res.items()),
+                                    preload_content=False)
+        return response
+
+
+class TestCompressedResponse(ServerTest):
+
+    def test_compressed_response_verified(self):
+        stdout = StringIO()
+        with self.settings(HAWK_COMPRESS_RESPONSES=True):
+            with mock.patch('hawkrest.management.commands.hawkrequest'
+                            '.request', side_effect=self.serve):
+                call_command('hawkrequest', url=self.url,
+                             creds=self.credentials_id, stdout=stdout)
+        output = stdout.getvalue()
+        assert "'Content-Encoding': 'gzip'" in output, output
+        assert 'the response the response' in output, output
+        assert '<response was Hawk verified>' in output, output
+
+
+class FakeSession(object):
+
+    def __init__(self, serve):
+        self.serve = serve
+        self.sent = 0
+        self.closed = False
+
+    def request(self, method, url, data, headers, stream):
+        self.sent += 1
+        return self.serve(url, method.lower(), data, headers)
+
+    def close(self):
+        self.closed = True
+
+
+class TestLoadTest(ServerTest):
+
+    def setUp(self):
+        super(TestLoadTest, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        mohawk_log = logging.getLogger('mohawk')
+        self.addCleanup(mohawk_log.setLevel, mohawk_log.level)
+        self.sessions = []
+
+        def make_session():
+            session = FakeSession(self.serve)
+            self.sessions.append(session)
+            return session
+
+        requests = mock.Mock()
+        requests.Session.side_effect = make_session
+        p = mock.patch('hawkrest.management.commands.hawkrequest'
+                       '.get_requests_module', return_value=requests)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def load(self, **kw):
+        stdout = StringIO()
+        call_command('hawkrequest', url=self.url, creds=self.credentials_id,
+                     stdout=stdout, **kw)
+        return stdout.getvalue()
+
+    def test_count(self):
+        output = self.load(count=7, concurrency=3)
+        # The nonce store would reject requests signed more than once.
+        assert 'Status codes: 200: 7' in output, output
+        assert 'Hawk verified responses: 7 of 7' in output, output
+        assert 'requests/s' in output, output
+        assert 'Latency: p50 ' in output, output
+        eq_(len(self.sessions), 3)
+        eq_(sum(session.sent for session in self.sessions), 7)
+        assert all(session.closed for session in self.sessions)
+
+    def test_duration(self):
+        with mock.patch('hawkrest.management.commands.hawkrequest'
+                        '.SIGNING_BATCH_SIZE', 2):
+            output = self.load(duration=0.05)
+        sent = self.sessions[0].sent
+        assert sent > 0, output
+        assert 'Hawk verified responses: {n} of {n}'.format(n=sent) in output
+
+    def test_count_and_duration(self):
+        self.load(count=3, duration=60)
+        eq_(self.sessions[0].sent, 3)
+
+    def test_unverified_responses(self):
+        with mock.patch('mohawk.Sender.accept_response',
+                        side_effect=MacMismatch('bad')):
+            output = self.load(count=2)
+        assert 'Hawk verified responses: 0 of 2' in output, output
+
+    def test_errors(self):
+        self.serve = mock.Mock(side_effect=IOError('connection refused'))
+        output = self.load(count=2)
+        assert 'Errors: OSError: 2' in output, output
+        assert 'Hawk verified responses: 0 of 2' in output, output
+
+    def test_invalid_options(self):
+        for kw in ({'count': 0}, {'duration': 0},
+                   {'count': 1, 'concurrency': 0}):
+            with self.assertRaises(CommandError):
+                self.load(**kw)
+
+
+class TestPercentile(BaseTest):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        eq_(percentile(values, 50), 50)
+        eq_(percentile(values, 99), 99)
+        eq_(percentile(values, 100), 100)
+        eq_(percentile([5], 90), 5)
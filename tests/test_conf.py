@@ -0,0 +1,103 @@
+import threading
+import time
+
+import mock
+from nose.tools import eq_
+
+from hawkrest import default_credentials_lookup, default_user_lookup
+from hawkrest.conf import hawk_settings
+from hawkrest.nonce import MemoryNonceStore
+
+from .base import BaseTest
+
+
+def alternative_cred_lookup(cr_id):
+    return {}
+
+
+class SlowNonceStore(MemoryNonceStore):
+    created = 0
+
+    def __init__(self, **kw):
+        type(self).created += 1
+        # Give other threads time to ask for the store too.
+        time.sleep(0.05)
+        super(SlowNonceStore, self).__init__(**kw)
+
+
+class TestHawkSettings(BaseTest):
+
+    def setUp(self):
+        super(TestHawkSettings, self).setUp()
+        hawk_settings.reload()
+        self.addCleanup(hawk_settings.reload)
+
+    def test_defaults(self):
+        with self.settings(HAWK_MESSAGE_EXPIRATION=None):
+            eq_(hawk_settings.HAWK_MESSAGE_EXPIRATION, 60)
+            eq_(hawk_settings.HAWK_CREDENTIALS_LOOKUP,
+                default_credentials_lookup)
+            eq_(hawk_settings.HAWK_USER_LOOKUP, default_user_lookup)
+
+    def test_invalid_setting(self):
+        with self.assertRaises(AttributeError):
+            hawk_settings.NOT_A_HAWK_SETTING
+
+    def test_import_string_resolved_once(self):
+        lookup_path = '{}.alternative_cred_lookup'.format(__name__)
+        with self.settings(HAWK_CREDENTIALS_LOOKUP=lookup_path):
+            with mock.patch('hawkrest.conf.import_string') as import_string:
+                import_string.return_value = alternative_cred_lookup
+                hawk_settings.HAWK_CREDENTIALS_LOOKUP
+                hawk_settings.HAWK_CREDENTIALS_LOOKUP
+            eq_(import_string.call_count, 1)
+
+    def test_reloaded_on_setting_changed(self):
+        eq_(hawk_settings.HAWK_MESSAGE_EXPIRATION, 60)
+        with self.settings(HAWK_MESSAGE_EXPIRATION=10):
+            eq_(hawk_settings.HAWK_MESSAGE_EXPIRATION, 10)
+        eq_(hawk_settings.HAWK_MESSAGE_EXPIRATION, 60)
+
+    def test_unrelated_setting_does_not_reload(self):
+        hawk_settings.HAWK_MESSAGE_EXPIRATION
+        with mock.patch.object(hawk_settings, 'reload') as reload:
+            with self.settings(SOME_OTHER_SETTING=True):
+                pass
+        assert not reload.called, 'only Hawk settings should reload'
+
+    def test_credentials_cache_reloaded(self):
+        with self.settings(HAWK_CREDENTIALS_CACHE={'MAX_SIZE': 5},
+                           HAWK_CREDENTIALS={'a': {'key': 'one'}}):
+            eq_(hawk_settings.credentials_lookup('a'), {'key': 'one'})
+            with self.settings(HAWK_CREDENTIALS={'a': {'key': 'two'}}):
+                eq_(hawk_settings.credentials_lookup('a'), {'key': 'two'})
+
+    def test_response_hash_cache(self):
+        eq_(hawk_settings.response_hash_cache, None)
+        with self.settings(HAWK_RESPONSE_HASH_CACHE={'MAX_SIZE': 5}):
+            cache = hawk_settings.response_hash_cache
+            eq_(cache.hashes.max_size, 5)
+            assert not cache.use_checksum, 'checksums should be opt-in'
+
+    def test_nonce_store_closed_on_reload(self):
+        with self.settings(HAWK_NONCE_STORE='hawkrest.nonce.MemoryNonceStore'):
+            store = hawk_settings.nonce_store
+            with mock.patch.object(store, 'close') as close:
+                with self.settings(HAWK_MESSAGE_EXPIRATION=10):
+                    pass
+        assert close.called, 'expected the old store to be closed'
+
+    def test_nonce_store_built_once(self):
+        SlowNonceStore.created = 0
+        with self.settings(
+                HAWK_NONCE_STORE='{}.SlowNonceStore'.format(__name__)):
+            stores = []
+            threads = [threading.Thread(
+                target=lambda: stores.append(hawk_settings.nonce_store))
+                for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        eq_(SlowNonceStore.created, 1)
+        eq_(len(set(map(id, stores))), 1)
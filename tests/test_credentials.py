@@ -0,0 +1,118 @@
+import mock
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.credentials import (CachedCredentialsLookup,
+                                  get_credentials_cache,
+                                  invalidate_credentials)
+
+from .base import BaseTest
+
+
+class TestCachedCredentialsLookup(BaseTest):
+
+    def setUp(self):
+        super(TestCachedCredentialsLookup, self).setUp()
+        self.lookup = mock.Mock()
+        self.lookup.return_value = self.credentials
+        self.cached = CachedCredentialsLookup(self.lookup, max_size=2)
+
+    def test_memoizes(self):
+        eq_(self.cached('script-user'), self.credentials)
+        eq_(self.cached('script-user'), self.credentials)
+        eq_(self.lookup.call_count, 1)
+        eq_(self.cached.hits, 1)
+        eq_(self.cached.misses, 1)
+
+    def test_lru_eviction(self):
+        self.cached('one')
+        self.cached('two')
+        self.cached('one')
+        self.cached('three')  # evicts 'two'
+        self.cached('one')
+        eq_(self.lookup.call_count, 3)
+        self.cached('two')
+        eq_(self.lookup.call_count, 4)
+
+    @mock.patch('hawkrest.util.time')
+    def test_timeout(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cached('script-user')
+        mock_time.time.return_value = 1000 + 61
+        self.cached('script-user')
+        eq_(self.lookup.call_count, 2)
+
+    @mock.patch('hawkrest.util.time')
+    def test_negative_cache(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.lookup.side_effect = LookupError('No Hawk ID of bogus')
+        for _ in range(3):
+            with self.assertRaises(LookupError):
+                self.cached('bogus')
+        eq_(self.lookup.call_count, 1)
+
+        # Negative entries expire much sooner.
+        mock_time.time.return_value = 1000 + 6
+        with self.assertRaises(LookupError):
+            self.cached('bogus')
+        eq_(self.lookup.call_count, 2)
+
+    def test_negative_cache_disabled(self):
+        cached = CachedCredentialsLookup(self.lookup, negative_timeout=0)
+        self.lookup.side_effect = LookupError()
+        for _ in range(2):
+            with self.assertRaises(LookupError):
+                cached('bogus')
+        eq_(self.lookup.call_count, 2)
+
+    def test_invalidate(self):
+        self.cached('script-user')
+        self.cached.invalidate('script-user')
+        self.cached('script-user')
+        eq_(self.lookup.call_count, 2)
+
+    def test_clear(self):
+        self.cached('one')
+        self.cached('two')
+        self.cached.clear()
+        self.cached('one')
+        self.cached('two')
+        eq_(self.lookup.call_count, 4)
+
+
+class TestCredentialsCacheSetting(BaseTest):
+
+    def test_disabled_by_default(self):
+        eq_(get_credentials_cache(), None)
+        # This is a no-op.
+        invalidate_credentials('script-user')
+
+    def test_authenticate_uses_cache(self):
+        with self.settings(HAWK_CREDENTIALS_CACHE={'MAX_SIZE': 10}):
+            auth = HawkAuthentication()
+            for _ in range(2):
+                auth.authenticate(self._request(self._sender()))
+            cache = get_credentials_cache()
+            eq_(cache.hits, 1)
+            eq_(cache.misses, 1)
+
+            invalidate_credentials('script-user')
+            auth.authenticate(self._request(self._sender()))
+            eq_(cache.misses, 2)
+
+            invalidate_credentials()
+            auth.authenticate(self._request(self._sender()))
+            eq_(cache.misses, 3)
+
+    def test_unknown_id_is_negatively_cached(self):
+        wrong_creds = {'id': 'not-a-valid-id',
+                       'key': 'not really',
+                       'algorithm': 'sha256'}
+        with self.settings(HAWK_CREDENTIALS_CACHE={'MAX_SIZE': 10}):
+            auth = HawkAuthentication()
+            for _ in range(2):
+                req = self._request(self._sender(credentials=wrong_creds))
+                with self.assertRaises(AuthenticationFailed):
+                    auth.authenticate(req)
+            eq_(get_credentials_cache().hits, 1)
@@ -0,0 +1,134 @@
+import logging
+import threading
+
+from django.core.cache import cache
+
+import mock
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.aio import AsyncHawkAuthentication
+from hawkrest.events import (DEFAULT_LEVEL, event_log, log_auth_event,
+                             start_event_queue, stop_event_queue)
+
+from .base import BaseTest
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+        self.threads = set()
+        self.handled = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.add(threading.current_thread().name)
+        self.handled.set()
+
+
+class EventsTest(BaseTest):
+
+    def setUp(self):
+        super(EventsTest, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.sender = self._sender(method='POST', content='{}',
+                                   content_type='application/json')
+
+    def request(self):
+        return self._request(self.sender, method='POST', data='{}',
+                             content_type='application/json')
+
+    def listen(self):
+        handler = RecordingHandler()
+        event_log.addHandler(handler)
+        self.addCleanup(event_log.removeHandler, handler)
+        self.addCleanup(event_log.setLevel, event_log.level)
+        event_log.setLevel(logging.INFO)
+        return handler
+
+
+class TestAuthEvents(EventsTest):
+
+    def test_success(self):
+        handler = self.listen()
+        HawkAuthentication().authenticate(self.request())
+        record, = handler.records
+        eq_(record.hawk_event, {'outcome': 'success', 'reason': None,
+                                'id': 'script-user', 'method': 'POST',
+                                'path': '/'})
+        eq_(record.getMessage(), 'Hawk authentication success: POST / '
+                                 '(id=script-user reason=None)')
+
+    def test_failure(self):
+        HawkAuthentication().authenticate(self.request())
+        handler = self.listen()
+        with self.assertRaises(AuthenticationFailed):
+            HawkAuthentication().authenticate(self.request())
+        record, = handler.records
+        eq_(record.hawk_event['outcome'], 'failure')
+        eq_(record.hawk_event['reason'], 'replay')
+
+    def test_disabled(self):
+        with mock.patch.object(event_log, 'info') as info:
+            HawkAuthentication().authenticate(self.request())
+        assert not info.called, 'expected no event'
+
+    def test_not_inherited(self):
+        # INFO for hawkrest's other messages doesn't turn events on.
+        parent = logging.getLogger('hawkrest')
+        self.addCleanup(parent.setLevel, parent.level)
+        parent.setLevel(logging.INFO)
+        with mock.patch.object(event_log, 'info') as info:
+            HawkAuthentication().authenticate(self.request())
+        assert not info.called, 'expected no event'
+
+    def test_not_hawk_request(self):
+        handler = self.listen()
+        HawkAuthentication().authenticate(self.factory.get('/'))
+        eq_(handler.records, [])
+
+    async def test_async(self):
+        handler = self.listen()
+        await AsyncHawkAuthentication().aauthenticate(self.request())
+        eq_([r.hawk_event['outcome'] for r in handler.records], ['success'])
+
+
+class TestEventQueue(EventsTest):
+
+    def setUp(self):
+        super(TestEventQueue, self).setUp()
+        self.addCleanup(stop_event_queue)
+
+    def test_handled_on_another_thread(self):
+        handler = RecordingHandler()
+        start_event_queue(handler)
+        HawkAuthentication().authenticate(self.request())
+        assert handler.handled.wait(5), 'expected an event'
+        assert threading.current_thread().name not in handler.threads
+        record, = handler.records
+        # The message was not formatted before it was queued.
+        eq_(record.args['outcome'], 'success')
+
+    def test_stop_handles_queued_events(self):
+        handler = RecordingHandler()
+        start_event_queue(handler)
+        for _ in range(10):
+            log_auth_event(self.request(), error=Exception())
+        stop_event_queue()
+        eq_(len(handler.records), 10)
+        assert event_log.propagate, 'expected the logger to be restored'
+        eq_(event_log.level, DEFAULT_LEVEL)
+        eq_(event_log.handlers, [])
+
+    def test_restart(self):
+        first, second = RecordingHandler(), RecordingHandler()
+        start_event_queue(first)
+        start_event_queue(second)
+        HawkAuthentication().authenticate(self.request())
+        stop_event_queue()
+        eq_(len(first.records), 0)
+        eq_(len(second.records), 1)
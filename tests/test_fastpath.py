@@ -0,0 +1,214 @@
+import random
+import string
+import time
+
+import mock
+from mohawk import Sender
+from mohawk.base import Resource
+from mohawk.util import calculate_mac, parse_authorization_header
+from nose.tools import eq_
+
+from hawkrest import HawkAuthentication
+from hawkrest.aio import AsyncFastHawkReceiver, AsyncHawkAuthentication
+from hawkrest.conf import hawk_settings
+from hawkrest.fastpath import FastHawkReceiver, parse_header, split_url
+from hawkrest.receiver import HawkReceiver, respond_with_content_hash
+
+from .base import BaseTest
+
+# Characters mohawk allows in header values.
+VALUE_CHARS = (string.ascii_letters + string.digits +
+               " _!#$%&'()*+,-./:;<=>?@[]^`{|}~")
+HOSTS = ('example.com', 'Example.COM', '127.0.0.1', '[::1]',
+         'user@example.com', 'api.example.com')
+PORTS = ('', '', '', ':80', ':443', ':8000', ':', ':99999')
+PATHS = ('/', '/api', '/api/items/1', '/a%20b/', '/a/../b', '/;p')
+QUERIES = ('', '', '', '?a=1&b=2', '?', '?x?y', '#frag', '?q#frag', ' ')
+HEADER_MUTATIONS = (
+    lambda h: h,
+    lambda h: h,
+    lambda h: h,
+    lambda h: h.replace(', ', ','),
+    lambda h: h.replace(', ', ' ,  '),
+    lambda h: h.replace(', ', ',\t'),
+    lambda h: h + ',',
+    lambda h: h + ', ',
+    lambda h: h + '\n',
+    lambda h: h + ', id="other"',
+    lambda h: h + ', unknown="x"',
+    lambda h: h + ', tsm="x"',
+    lambda h: h.replace('Hawk ', 'hawk '),
+    lambda h: h.replace('Hawk ', 'Hawk  '),
+    lambda h: h.replace('mac="', 'mac="A'),
+    lambda h: h.replace('nonce="', 'nonce="\\"'),
+    lambda h: h.replace('nonce="', 'nonce="\xe9'),
+    lambda h: h.replace('ts="', 'ts="1'),
+    lambda h: h.replace(', ', ', ', 1).replace('", ', '"', 1),
+    lambda h: h.split(', ')[0],
+    lambda h: h.replace('ext="', 'ext="a\n'),
+)
+
+
+def random_value(rand, size=8):
+    return ''.join(rand.choice(VALUE_CHARS)
+                   for _ in range(rand.randint(1, size)))
+
+
+def random_url(rand):
+    return '{scheme}://{host}{port}{path}{query}'.format(
+        scheme=rand.choice(('http', 'https', 'http', 'https', 'ftp')),
+        host=rand.choice(HOSTS),
+        port=rand.choice(PORTS),
+        path=rand.choice(PATHS),
+        query=rand.choice(QUERIES))
+
+
+def random_case(rand):
+    """
+    Returns the arguments for a receiver, signed by mohawk and then maybe
+    tampered with.
+    """
+    credentials = {'id': rand.choice(('script-user', 'other-user')),
+                   'key': random_value(rand, 30),
+                   'algorithm': rand.choice(('sha256', 'sha256', 'sha1'))}
+    url = random_url(rand)
+    method = rand.choice(('GET', 'post', 'PUT'))
+    content = random_value(rand) if rand.random() < 0.5 else ''
+    content_type = 'application/json' if content else ''
+    kw = {}
+    if rand.random() < 0.3:
+        kw['ext'] = random_value(rand)
+    if rand.random() < 0.2:
+        kw['app'] = random_value(rand)
+        if rand.random() < 0.5:
+            kw['dlg'] = random_value(rand)
+    if rand.random() < 0.1:
+        kw['_timestamp'] = '123'
+    try:
+        header = Sender(credentials, url, method, content=content,
+                        content_type=content_type, **kw).request_header
+    except Exception:
+        # Let the receiver deal with a URL that mohawk can't sign.
+        header = Sender(credentials, 'http://example.com/', method,
+                        content=content, content_type=content_type,
+                        **kw).request_header
+    header = rand.choice(HEADER_MUTATIONS)(header)
+    if rand.random() < 0.1:
+        url = random_url(rand)
+    if rand.random() < 0.1:
+        content += 'tampered'
+    return credentials, header, url, method, content, content_type
+
+
+def outcome(receiver_class, credentials, header, url, method, content,
+            content_type):
+    try:
+        receiver = receiver_class(lambda cr_id: dict(credentials), header,
+                                  url, method, content_type=content_type)
+        receiver.verify_content(content)
+        resource = receiver.resource
+        return ('ok', receiver.parsed_header,
+                [getattr(resource, attr) for attr in
+                 ('credentials', 'method', 'content_type', 'ext', 'app',
+                  'dlg', 'timestamp', 'nonce', 'url', 'name', 'host',
+                  'port')],
+                respond_with_content_hash(receiver, b'hash', ext='ext'))
+    except Exception as exc:
+        return (type(exc), str(exc))
+
+
+class TestDifferential(BaseTest):
+    """
+    FastHawkReceiver must do exactly what mohawk does.
+    """
+    cases = 1000
+
+    def test_random_requests(self):
+        rand = random.Random(1234)
+        fast = 0
+        for i in range(self.cases):
+            args = random_case(rand)
+            # Expired tokens report the current time.
+            with mock.patch('hawkrest.receiver.utc_now',
+                            return_value=int(time.time())):
+                expected = outcome(HawkReceiver, *args)
+                actual = outcome(FastHawkReceiver, *args)
+            eq_(actual, expected, 'case {}: {!r}'.format(i, args))
+            if actual[0] == 'ok' and parse_header(args[1]) is not None:
+                fast += 1
+        # Make sure the fast path was tested.
+        assert fast > self.cases // 4, fast
+
+    def test_random_headers(self):
+        rand = random.Random(5678)
+        for i in range(self.cases):
+            header = random_case(rand)[1]
+            parsed = parse_header(header)
+            if parsed is not None:
+                eq_(parsed, parse_authorization_header(header), header)
+
+    def test_random_urls(self):
+        rand = random.Random(9012)
+        for i in range(self.cases):
+            url = random_url(rand)
+            parts = split_url(url)
+            if parts is None:
+                continue
+            expected = Resource(url=url, method='GET', credentials={
+                'id': 'id', 'key': 'key', 'algorithm': 'sha256'})
+            eq_(parts, ('{}\n{}'.format(expected.host, expected.port),
+                        expected.name), url)
+
+
+class TestFastHawkReceiver(BaseTest):
+
+    def setUp(self):
+        super(TestFastHawkReceiver, self).setUp()
+        self.sender = self._sender(method='POST', content='{}',
+                                   content_type='application/json')
+
+    def receive(self, receiver_class=FastHawkReceiver, **kw):
+        return receiver_class(lambda cr_id: self.credentials,
+                              self.sender.request_header, self.url, 'POST',
+                              content_type='application/json', **kw)
+
+    def test_fast_path(self):
+        with mock.patch('hawkrest.receiver.calculate_mac') as mac:
+            with mock.patch('hawkrest.receiver.Resource') as resource:
+                receiver = self.receive()
+        assert not mac.called, 'expected the fast path'
+        assert not resource.called, 'expected the fast path'
+        receiver.verify_content('{}')
+        eq_(receiver.resource.name, '/')
+
+    def test_falls_back_for_other_algorithms(self):
+        self.credentials = dict(self.credentials, algorithm='sha1')
+        self.sender = Sender(self.credentials, self.url, 'POST',
+                             content='{}', content_type='application/json')
+        with mock.patch('hawkrest.receiver.calculate_mac',
+                        wraps=calculate_mac) as mac:
+            self.receive()
+        assert mac.called, 'expected mohawk'
+
+    def test_keyed_mac_is_not_reused(self):
+        self.receive()
+        self.sender = self._sender(method='POST', content='{}',
+                                   content_type='application/json')
+        # The cached HMAC object was copied, not updated.
+        self.receive()
+
+    def test_setting(self):
+        with self.settings(HAWK_FAST_VERIFIER=True):
+            eq_(hawk_settings.receiver_class, FastHawkReceiver)
+            req = self._request(self.sender, method='POST', data='{}',
+                                content_type='application/json')
+            HawkAuthentication().authenticate(req)
+        assert isinstance(req.META['hawk.receiver'], FastHawkReceiver)
+        eq_(hawk_settings.receiver_class, HawkReceiver)
+
+    async def test_async_setting(self):
+        req = self._request(self.sender, method='POST', data='{}',
+                            content_type='application/json')
+        with self.settings(HAWK_FAST_VERIFIER=True):
+            await AsyncHawkAuthentication().aauthenticate(req)
+        assert isinstance(req.META['hawk.receiver'], AsyncFastHawkReceiver)
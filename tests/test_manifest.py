@@ -0,0 +1,217 @@
+import os
+import shutil
+import tempfile
+
+try:
+    from StringIO import StringIO
+except ImportError:  # Python 3
+    from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import FileResponse
+
+import mock
+from mohawk.util import calculate_payload_hash
+from nose.tools import eq_
+
+from hawkrest.manifest import (PayloadHashManifest, get_payload_manifest,
+                               guess_content_type)
+from hawkrest.receiver import PayloadHash
+
+from .base import BaseTest
+from .test_middleware import MiddlewareTest
+
+
+class ManifestTest(BaseTest):
+    content = b'file content ' * 1000
+
+    def setUp(self):
+        super(ManifestTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = self.write('file.txt', self.content)
+        self.manifest_path = os.path.join(self.dir, 'manifest.json')
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def expected_hash(self, content_type='text/plain', content=None):
+        return calculate_payload_hash(content or self.content, 'sha256',
+                                      content_type)
+
+    def lookup(self, manifest, path=None, content_type='text/plain'):
+        path = path or self.path
+        stat = os.stat(path)
+        return manifest.get(path, 'sha256', content_type,
+                            stat.st_size, stat.st_mtime)
+
+
+class TestPayloadHashManifest(ManifestTest):
+
+    def test_add(self):
+        manifest = PayloadHashManifest()
+        assert manifest.add(self.path, ['sha256']), 'expected a new hash'
+        eq_(self.lookup(manifest), self.expected_hash())
+
+    def test_content_type_parameters_ignored(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        eq_(self.lookup(manifest, content_type='text/plain; charset=utf-8'),
+            self.expected_hash())
+
+    def test_extra_content_types(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'], ['application/json'])
+        eq_(self.lookup(manifest, content_type='application/json'),
+            self.expected_hash('application/json'))
+
+    def test_unknown_content_type(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        eq_(self.lookup(manifest, content_type='application/json'), None)
+
+    def test_unchanged_files_not_rehashed(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        assert not manifest.add(self.path, ['sha256']), (
+            'expected the existing entry to be used')
+
+    def test_changed_size(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        self.write('file.txt', b'changed')
+        eq_(self.lookup(manifest), None)
+
+    def test_changed_mtime(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        eq_(self.lookup(manifest), None)
+
+    def test_save_and_load(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        manifest.save(self.manifest_path)
+        eq_(self.lookup(PayloadHashManifest.load(self.manifest_path)),
+            self.expected_hash())
+
+    def test_prune(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        os.unlink(self.path)
+        manifest.prune()
+        eq_(len(manifest), 0)
+
+    def test_get_for_file(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        with open(self.path, 'rb') as f:
+            eq_(manifest.get_for_file(f, 'sha256', 'text/plain'),
+                self.expected_hash())
+
+    def test_get_for_file_not_at_start(self):
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        with open(self.path, 'rb') as f:
+            f.read(1)
+            eq_(manifest.get_for_file(f, 'sha256', 'text/plain'), None)
+
+    def test_guess_content_type(self):
+        eq_(guess_content_type('a.json'), 'application/json')
+        eq_(guess_content_type('a.tar.gz'), 'application/gzip')
+        eq_(guess_content_type('a'), 'application/octet-stream')
+
+    def test_setting(self):
+        PayloadHashManifest().save(self.manifest_path)
+        with self.settings(HAWK_PAYLOAD_MANIFEST=self.manifest_path):
+            assert isinstance(get_payload_manifest(), PayloadHashManifest)
+        eq_(get_payload_manifest(), None)
+
+    def test_missing_manifest(self):
+        with self.settings(HAWK_PAYLOAD_MANIFEST=self.manifest_path):
+            with mock.patch('hawkrest.conf.log') as log:
+                eq_(get_payload_manifest(), None)
+        assert log.warning.called, 'expected a warning'
+
+
+class TestManifestCommand(ManifestTest):
+
+    def call(self, *args, **kw):
+        stdout = StringIO()
+        call_command('hawkmanifest', *args, stdout=stdout, **kw)
+        return stdout.getvalue()
+
+    def test_write(self):
+        os.mkdir(os.path.join(self.dir, 'sub'))
+        other = self.write(os.path.join('sub', 'other.json'), b'{}')
+        out = self.call(self.dir, output=self.manifest_path)
+        eq_(out.strip(), 'Hashed 2 files; wrote 2 entries to {}'
+            .format(self.manifest_path))
+        manifest = PayloadHashManifest.load(self.manifest_path)
+        eq_(self.lookup(manifest), self.expected_hash())
+        eq_(self.lookup(manifest, path=other, content_type='application/json'),
+            self.expected_hash('application/json', b'{}'))
+
+    def test_incremental(self):
+        self.call(self.dir, output=self.manifest_path)
+        out = self.call(self.dir, output=self.manifest_path)
+        # Only the previous manifest itself is new.
+        assert out.startswith('Hashed 1 files'), out
+
+    def test_output_setting(self):
+        with self.settings(HAWK_PAYLOAD_MANIFEST=self.manifest_path):
+            self.call(self.dir)
+        assert os.path.exists(self.manifest_path)
+
+    def test_no_output(self):
+        with self.assertRaises(CommandError):
+            self.call(self.dir)
+
+    def test_default_directories(self):
+        with self.settings(STATIC_ROOT=self.dir, MEDIA_ROOT=None):
+            self.call(output=self.manifest_path)
+        eq_(self.lookup(PayloadHashManifest.load(self.manifest_path)),
+            self.expected_hash())
+
+    def test_not_a_directory(self):
+        with self.assertRaises(CommandError):
+            self.call(self.path, output=self.manifest_path)
+
+
+class TestManifestMiddleware(ManifestTest, MiddlewareTest):
+
+    def setUp(self):
+        super(TestManifestMiddleware, self).setUp()
+        manifest = PayloadHashManifest()
+        manifest.add(self.path, ['sha256'])
+        manifest.save(self.manifest_path)
+        p = self.settings(HAWK_PAYLOAD_MANIFEST=self.manifest_path)
+        p.enable()
+        self.addCleanup(p.disable)
+
+    def respond(self):
+        req, sender = self.request()
+        res = self.mw.process_response(req, FileResponse(open(self.path,
+                                                              'rb')))
+        self.addCleanup(res.close)
+        sender.accept_response(res['Server-Authorization'],
+                               content=b''.join(res.streaming_content),
+                               content_type=res['Content-Type'])
+
+    def test_manifest_used(self):
+        with mock.patch('hawkrest.middleware.PayloadHash') as payload_hash:
+            self.respond()
+        assert not payload_hash.called, 'expected the manifest hash'
+
+    def test_changed_file_is_hashed(self):
+        self.content = b'changed'
+        self.write('file.txt', self.content)
+        with mock.patch('hawkrest.middleware.PayloadHash',
+                        wraps=PayloadHash) as payload_hash:
+            self.respond()
+        assert payload_hash.called, 'expected the file to be hashed'
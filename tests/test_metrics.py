@@ -0,0 +1,248 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+
+import mock
+from mohawk.exc import (AlreadyProcessed, BadHeaderValue,
+                        CredentialsLookupError, HawkFail, MacMismatch,
+                        TokenExpired)
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.aio import AsyncHawkAuthentication
+from hawkrest.conf import hawk_settings
+from hawkrest.metrics import (MetricsRegistry, _reset_after_fork,
+                              failure_reason, metrics_view)
+from hawkrest.middleware import HawkResponseMiddleware
+
+from .base import BaseTest
+
+
+def expired():
+    return TokenExpired('expired', localtime_in_seconds=1,
+                        www_authenticate='Hawk ts="1"')
+
+
+def counters(registry):
+    return registry.collect()['counters']
+
+
+class TestMetricsRegistry(BaseTest):
+
+    def setUp(self):
+        super(TestMetricsRegistry, self).setUp()
+        self.registry = MetricsRegistry(buckets=(0.1, 1.0))
+
+    def test_counts_outcomes(self):
+        self.registry.authenticated(0)
+        self.registry.authenticated(0)
+        self.registry.authenticated(0, error=expired())
+        eq_(counters(self.registry), {
+            'hawkrest_authentications_total|success|': 2,
+            'hawkrest_authentications_total|failure|expired': 1,
+        })
+
+    def test_failure_reasons(self):
+        for exc, reason in ((AlreadyProcessed(), 'replay'),
+                            (expired(), 'expired'),
+                            (CredentialsLookupError(), 'unknown_id'),
+                            (MacMismatch(), 'mac_mismatch'),
+                            (BadHeaderValue(), 'bad_header'),
+                            (HawkFail(), 'bad_header')):
+            eq_(failure_reason(exc), reason)
+
+    def test_histogram(self):
+        with mock.patch('hawkrest.metrics.perf_counter',
+                        side_effect=[0.05, 0.5, 0.5, 5.0]):
+            self.registry.authenticated(0)
+            self.registry.authenticated(0)
+            self.registry.signed(0.4)
+            self.registry.signed(0)
+        histograms = self.registry.collect()['histograms']
+        eq_(histograms['hawkrest_authentication_seconds'],
+            [[1, 1, 0], 0.55, 2])
+        eq_(histograms['hawkrest_response_signing_seconds'][0], [1, 0, 1])
+
+    def test_render(self):
+        with mock.patch('hawkrest.metrics.perf_counter',
+                        side_effect=[0.05, 0.5]):
+            self.registry.authenticated(0)
+            self.registry.authenticated(0, error=AlreadyProcessed())
+        lines = self.registry.render().splitlines()
+        for line in (
+                '# TYPE hawkrest_authentications_total counter',
+                'hawkrest_authentications_total{outcome="success"} 1',
+                'hawkrest_authentications_total'
+                '{outcome="failure",reason="replay"} 1',
+                '# TYPE hawkrest_authentication_seconds histogram',
+                'hawkrest_authentication_seconds_bucket{le="0.1"} 1',
+                'hawkrest_authentication_seconds_bucket{le="1.0"} 2',
+                'hawkrest_authentication_seconds_bucket{le="+Inf"} 2',
+                'hawkrest_authentication_seconds_sum 0.55',
+                'hawkrest_authentication_seconds_count 2',
+                'hawkrest_response_signing_seconds_count 0'):
+            assert line in lines, (line, lines)
+
+    def test_threads(self):
+        def record():
+            for i in range(100):
+                self.registry.authenticated(0)
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_(counters(self.registry),
+            {'hawkrest_authentications_total|success|': 400})
+
+
+class TestMultiprocess(BaseTest):
+
+    def setUp(self):
+        super(TestMultiprocess, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def registry(self, **kw):
+        registry = MetricsRegistry(multiprocess_dir=self.dir, **kw)
+        self.addCleanup(registry.close)
+        return registry
+
+    def test_adds_up_processes(self):
+        worker1 = self.registry()
+        worker2 = self.registry()
+        worker1.authenticated(0)
+        worker2.authenticated(0)
+        worker2.authenticated(0, error=MacMismatch())
+        worker2.close()
+        eq_(counters(worker1), {
+            'hawkrest_authentications_total|success|': 2,
+            'hawkrest_authentications_total|failure|mac_mismatch': 1,
+        })
+        eq_(len(os.listdir(self.dir)), 2)
+
+    def test_flushed_in_background(self):
+        worker = self.registry(flush_interval=0.01)
+        with mock.patch('hawkrest.metrics.write_json') as write_json:
+            worker.authenticated(0)
+            # Recording doesn't write the file itself.
+            eq_(write_json.call_count, 0)
+            deadline = time.time() + 5
+            while not write_json.called and time.time() < deadline:
+                time.sleep(0.01)
+        assert write_json.called, 'expected the background thread to write'
+        eq_(worker._flusher.name, 'hawkrest-metrics')
+
+    def test_close(self):
+        worker = self.registry(flush_interval=60)
+        worker.authenticated(0)
+        flusher = worker._flusher
+        worker.close()
+        assert not flusher.is_alive(), 'expected the thread to stop'
+        eq_(counters(self.registry()),
+            {'hawkrest_authentications_total|success|': 1})
+
+    def test_ignores_bad_files(self):
+        with open(os.path.join(self.dir, 'hawkrest-1-x.json'), 'w') as f:
+            f.write('{not json')
+        worker = self.registry()
+        worker.authenticated(0)
+        eq_(counters(worker), {'hawkrest_authentications_total|success|': 1})
+
+    def test_reset_after_fork(self):
+        worker = self.registry()
+        worker.authenticated(0)
+        path = worker._path
+        _reset_after_fork()
+        assert worker._path != path, 'expected a file per process'
+        eq_(worker.snapshot()['counters'], {})
+
+    def test_fork_hook_registered_once(self):
+        with mock.patch('os.register_at_fork') as register_at_fork:
+            self.registry()
+        assert not register_at_fork.called, 'expected the module hook'
+
+    def test_closed_on_reload(self):
+        with self.settings(HAWK_METRICS={}):
+            registry = hawk_settings.metrics
+            with mock.patch.object(registry, 'close') as close:
+                with self.settings(HAWK_METRICS={'FLUSH_INTERVAL': 1}):
+                    pass
+        assert close.called, 'expected the old registry to be closed'
+
+
+class MetricsTest(BaseTest):
+
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        override = self.settings(HAWK_METRICS={})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.sender = self._sender(method='POST', content='{}',
+                                   content_type='application/json')
+
+    def request(self):
+        return self._request(self.sender, method='POST', data='{}',
+                             content_type='application/json')
+
+
+class TestAuthenticationMetrics(MetricsTest):
+
+    def test_recorded(self):
+        req = self.request()
+        HawkAuthentication().authenticate(req)
+        # A verified request is only counted once.
+        HawkAuthentication().authenticate(req)
+        with self.assertRaises(AuthenticationFailed):
+            HawkAuthentication().authenticate(self.request())
+        eq_(counters(hawk_settings.metrics), {
+            'hawkrest_authentications_total|success|': 1,
+            'hawkrest_authentications_total|failure|replay': 1,
+        })
+
+    def test_not_hawk_request(self):
+        HawkAuthentication().authenticate(self.factory.get('/'))
+        eq_(counters(hawk_settings.metrics), {})
+
+    def test_disabled(self):
+        with self.settings(HAWK_METRICS=None):
+            with mock.patch('hawkrest.perf_counter') as perf_counter:
+                HawkAuthentication().authenticate(self.request())
+        assert not perf_counter.called, 'expected no metrics'
+
+    async def test_async(self):
+        await AsyncHawkAuthentication().aauthenticate(self.request())
+        eq_(counters(hawk_settings.metrics),
+            {'hawkrest_authentications_total|success|': 1})
+
+    def test_signed(self):
+        req = self.request()
+        HawkAuthentication().authenticate(req)
+        HawkResponseMiddleware(mock.Mock()).process_response(
+            req, HttpResponse('the response'))
+        histograms = hawk_settings.metrics.collect()['histograms']
+        eq_(histograms['hawkrest_response_signing_seconds'][2], 1)
+
+
+class TestMetricsView(MetricsTest):
+
+    def test_view(self):
+        HawkAuthentication().authenticate(self.request())
+        res = metrics_view(self.factory.get('/metrics'))
+        eq_(res['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        assert (b'hawkrest_authentications_total{outcome="success"} 1' in
+                res.content), res.content
+
+    def test_not_configured(self):
+        with self.settings(HAWK_METRICS=None):
+            with self.assertRaises(Http404):
+                metrics_view(self.factory.get('/metrics'))
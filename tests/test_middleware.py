@@ -1,21 +1,29 @@
+import gzip
+import io
+import os
+import tempfile
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 
 import mock
 from mohawk.exc import MisComputedContentHash
 from mohawk import Receiver
+from nose.tools import eq_
 
 from hawkrest import default_credentials_lookup
 from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.receiver import get_payload_hash_cache
+from hawkrest.util import FileChunks
 
 from .base import BaseTest
 
 
-class TestMiddleware(BaseTest):
+class MiddlewareTest(BaseTest):
 
     def setUp(self):
-        super(TestMiddleware, self).setUp()
-        self.mw = HawkResponseMiddleware()
+        super(MiddlewareTest, self).setUp()
+        self.mw = HawkResponseMiddleware(mock.Mock())
 
     def request(self, method='GET', content_type='text/plain', url=None):
         if not url:
@@ -37,6 +45,9 @@ class TestMiddleware(BaseTest):
                             content_type=req.META['CONTENT_TYPE'])
         req.META['hawk.receiver'] = receiver
 
+
+class TestMiddleware(MiddlewareTest):
+
     def accept_response(self, response, sender):
         sender.accept_response(response['Server-Authorization'],
                                content=response.content,
@@ -70,3 +81,271 @@ class TestMiddleware(BaseTest):
 
         with self.assertRaises(MisComputedContentHash):
             self.accept_response(res, sender)
+
+
+class TestStreamingMiddleware(MiddlewareTest):
+    content = b'the response ' * 1000
+
+    def chunks(self):
+        for start in range(0, len(self.content), 100):
+            yield self.content[start:start + 100]
+
+    def accept_response(self, response, sender):
+        sender.accept_response(response['Server-Authorization'],
+                               content=b''.join(response.streaming_content),
+                               content_type=response['Content-Type'])
+
+    def test_streaming_response(self):
+        req, sender = self.request()
+        res = self.mw.process_response(req, StreamingHttpResponse(
+            self.chunks(), content_type='text/plain'))
+        self.accept_response(res, sender)
+
+    def test_streaming_response_still_streams(self):
+        req, sender = self.request()
+        res = self.mw.process_response(req, StreamingHttpResponse(
+            self.chunks(), content_type='text/plain'))
+        eq_(b''.join(res.streaming_content), self.content)
+
+    def test_streaming_response_tampered(self):
+        req, sender = self.request()
+        res = self.mw.process_response(req, StreamingHttpResponse(
+            self.chunks(), content_type='text/plain'))
+        res.streaming_content = [b'TAMPERED WITH']
+        with self.assertRaises(MisComputedContentHash):
+            self.accept_response(res, sender)
+
+    def test_async_streaming_response(self):
+        async def chunks():
+            for chunk in self.chunks():
+                yield chunk
+
+        req, sender = self.request()
+        res = self.mw.process_response(req, StreamingHttpResponse(
+            chunks(), content_type='text/plain'))
+        assert not res.is_async, 'expected the spooled copy to be sent'
+        self.accept_response(res, sender)
+
+    def test_streaming_response_spools_to_disk(self):
+        req, sender = self.request()
+        with self.settings(HAWK_BODY_SPOOL_MAX_MEMORY_SIZE=100):
+            with mock.patch('hawkrest.middleware.FileChunks',
+                            wraps=FileChunks) as chunks:
+                res = self.mw.process_response(req, StreamingHttpResponse(
+                    self.chunks(), content_type='text/plain'))
+        assert chunks.call_args[0][0]._rolled, (
+            'expected the response to be on disk')
+        self.accept_response(res, sender)
+
+    def test_file_response(self):
+        req, sender = self.request()
+        res = self.mw.process_response(req, FileResponse(
+            io.BytesIO(self.content), content_type='text/plain'))
+        self.accept_response(res, sender)
+
+    def test_file_response_read_in_place(self):
+        handle, path = tempfile.mkstemp()
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(self.content)
+
+        req, sender = self.request()
+        with mock.patch('hawkrest.middleware.tempfile') as temp:
+            res = self.mw.process_response(req, FileResponse(
+                open(path, 'rb'), content_type='text/plain'))
+            self.accept_response(res, sender)
+            res.close()
+        assert not temp.SpooledTemporaryFile.called, (
+            'the file should not have been copied')
+
+    def test_file_response_from_position(self):
+        f = io.BytesIO(b'skipped' + self.content)
+        f.seek(len(b'skipped'))
+        req, sender = self.request()
+        res = self.mw.process_response(req, FileResponse(
+            f, content_type='text/plain'))
+        self.accept_response(res, sender)
+
+    def test_unseekable_file_response(self):
+        f = mock.Mock(spec=['read'])
+        f.read.side_effect = io.BytesIO(self.content).read
+        req, sender = self.request()
+        res = self.mw.process_response(req, FileResponse(
+            f, content_type='text/plain'))
+        self.accept_response(res, sender)
+
+
+class TestPayloadHashCache(MiddlewareTest):
+    hash_cache = {'MAX_SIZE': 10, 'USE_CHECKSUM': True}
+
+    def setUp(self):
+        super(TestPayloadHashCache, self).setUp()
+        p = self.settings(HAWK_RESPONSE_HASH_CACHE=self.hash_cache)
+        p.enable()
+        self.addCleanup(p.disable)
+        self.cache = get_payload_hash_cache()
+
+    def respond(self, response, path='/'):
+        url = 'http://testserver' + path
+        sender = self._sender(url=url, content_type='text/plain')
+        req = self.factory.get(path, HTTP_AUTHORIZATION=sender.request_header,
+                               CONTENT_TYPE='text/plain')
+        self.authorize_request(sender, req, url=url)
+        res = self.mw.process_response(req, response)
+        content = (b''.join(res.streaming_content) if res.streaming
+                   else res.content)
+        sender.accept_response(res['Server-Authorization'],
+                               content=content,
+                               content_type=res['Content-Type'])
+        return res
+
+    def test_hit(self):
+        self.respond(HttpResponse('the response'))
+        with mock.patch('hawkrest.middleware.PayloadHash') as payload_hash:
+            self.respond(HttpResponse('the response'))
+        assert not payload_hash.called, 'expected a cached hash'
+        eq_(self.cache.hits, 1)
+        eq_(self.cache.misses, 1)
+        eq_(self.cache.hit_rate, 0.5)
+
+    def test_different_content(self):
+        self.respond(HttpResponse('the response'))
+        self.respond(HttpResponse('another response'))
+        eq_(self.cache.hits, 0)
+
+    def test_different_content_type(self):
+        self.respond(HttpResponse('the response'))
+        self.respond(HttpResponse('the response', content_type='text/html'))
+        eq_(self.cache.hits, 0)
+
+    def test_etag(self):
+        response = HttpResponse('the response')
+        response['ETag'] = '"v1"'
+        self.respond(response)
+        key = self.cache.make_key('sha256', response['Content-Type'],
+                                  etag='"v1"', method='GET', path='/')
+        assert self.cache.get(key), 'expected the hash keyed by ETag'
+
+    def test_same_etag_other_path(self):
+        # ETags only identify a version of one resource.
+        for path, content in (('/users/1/', 'a user'),
+                              ('/orders/1/', 'an order'),
+                              ('/orders/1/?expand=1', 'an expanded order')):
+            response = HttpResponse(content)
+            response['ETag'] = '"1"'
+            self.respond(response, path=path)
+        eq_(self.cache.hits, 0)
+
+    def test_etag_streaming(self):
+        def streaming_response():
+            response = StreamingHttpResponse([b'the ', b'response'])
+            response['ETag'] = '"v1"'
+            return response
+
+        self.respond(streaming_response())
+        with mock.patch('hawkrest.middleware.PayloadHash') as payload_hash:
+            self.respond(streaming_response())
+        assert not payload_hash.called, 'expected a cached hash'
+
+    def test_streaming_without_etag(self):
+        self.respond(StreamingHttpResponse([b'the ', b'response']))
+        self.respond(StreamingHttpResponse([b'the ', b'response']))
+        eq_(self.cache.hits + self.cache.misses, 0)
+
+    def test_weak_etag_uses_checksum(self):
+        response = HttpResponse('the response')
+        response['ETag'] = 'W/"v1"'
+        self.respond(response)
+        response = HttpResponse('the response')
+        response['ETag'] = 'W/"v2"'
+        self.respond(response)
+        eq_(self.cache.hits, 1)
+
+    def test_same_etag_other_encoding(self):
+        for content, encoding in ((b'the response', None),
+                                  (b'\x1f\x8b compressed', 'gzip')):
+            response = HttpResponse(content)
+            response['ETag'] = '"v1"'
+            if encoding:
+                response['Content-Encoding'] = encoding
+            self.respond(response)
+        eq_(self.cache.hits, 0)
+
+    def test_without_checksum(self):
+        with self.settings(HAWK_RESPONSE_HASH_CACHE={'USE_CHECKSUM': False}):
+            cache = get_payload_hash_cache()
+            self.respond(HttpResponse('the response'))
+            self.respond(HttpResponse('the response'))
+        eq_(cache.hits + cache.misses, 0)
+
+    def test_bounded(self):
+        for i in range(20):
+            self.respond(HttpResponse('response {}'.format(i)))
+        eq_(len(self.cache.hashes), 10)
+
+
+class TestCompression(MiddlewareTest):
+    content = b'the response ' * 100
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+        p = self.settings(HAWK_COMPRESS_RESPONSES=True)
+        p.enable()
+        self.addCleanup(p.disable)
+
+    def respond(self, response, accept_encoding='gzip, deflate'):
+        req, sender = self.request()
+        if accept_encoding:
+            req.META['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return self.mw.process_response(req, response), sender
+
+    def accept_response(self, response, sender, content):
+        sender.accept_response(response['Server-Authorization'],
+                               content=content,
+                               content_type=response['Content-Type'])
+
+    def test_signs_compressed_content(self):
+        res, sender = self.respond(HttpResponse(self.content))
+        eq_(res['Content-Encoding'], 'gzip')
+        eq_(res['Vary'], 'Accept-Encoding')
+        eq_(int(res['Content-Length']), len(res.content))
+        eq_(gzip.GzipFile(fileobj=io.BytesIO(res.content)).read(),
+            self.content)
+        self.accept_response(res, sender, res.content)
+
+    def test_uncompressed_content_does_not_match(self):
+        res, sender = self.respond(HttpResponse(self.content))
+        with self.assertRaises(MisComputedContentHash):
+            self.accept_response(res, sender, self.content)
+
+    def test_client_does_not_accept_gzip(self):
+        res, sender = self.respond(HttpResponse(self.content),
+                                   accept_encoding=None)
+        assert not res.has_header('Content-Encoding')
+        self.accept_response(res, sender, self.content)
+
+    def test_small_response(self):
+        res, sender = self.respond(HttpResponse(b'small'))
+        assert not res.has_header('Content-Encoding')
+        self.accept_response(res, sender, b'small')
+
+    def test_already_encoded(self):
+        response = HttpResponse(self.content)
+        response['Content-Encoding'] = 'br'
+        res, sender = self.respond(response)
+        eq_(res.content, self.content)
+        self.accept_response(res, sender, self.content)
+
+    def test_streaming(self):
+        res, sender = self.respond(StreamingHttpResponse(
+            [self.content, self.content]))
+        eq_(res['Content-Encoding'], 'gzip')
+        content = b''.join(res.streaming_content)
+        eq_(gzip.GzipFile(fileobj=io.BytesIO(content)).read(),
+            self.content * 2)
+        self.accept_response(res, sender, content)
+
+    def test_disabled(self):
+        with self.settings(HAWK_COMPRESS_RESPONSES=False):
+            res, sender = self.respond(HttpResponse(self.content))
+        assert not res.has_header('Content-Encoding')
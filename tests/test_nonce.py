@@ -0,0 +1,672 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:  # Python 3
+    from io import StringIO
+
+import mock
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import transaction
+from multiprocessing import TimeoutError
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.conf import hawk_settings
+from hawkrest.models import Nonce
+from hawkrest.nonce import (BaseNonceStore, BatchedCacheNonceStore,
+                            BloomNonceStore, CacheNonceStore,
+                            CircuitBreakerNonceStore,
+                            DatabaseNonceStore, MemoryNonceStore,
+                            ShardedCacheNonceStore, SharedMemoryNonceStore)
+from hawkrest.signals import nonce_store_state_changed
+
+from .base import BaseTest
+from .caches import SlowCache
+
+
+class RecordingNonceStore(BaseNonceStore):
+    instances = []
+
+    def __init__(self, **options):
+        self.options = options
+        self.seen = []
+        self.instances.append(self)
+
+    def seen_nonce(self, id, nonce, timestamp):
+        key = self.make_key(id, nonce, timestamp)
+        if key in self.seen:
+            return True
+        self.seen.append(key)
+        return False
+
+
+class NonceTest(BaseTest):
+
+    def setUp(self):
+        super(NonceTest, self).setUp()
+        for alias in settings.CACHES:
+            caches[alias].clear()
+            self.addCleanup(caches[alias].clear)
+
+    def authenticate(self, sender):
+        return HawkAuthentication().authenticate(self._request(sender))
+
+    def assert_replay_rejected(self):
+        sender = self._sender()
+        self.authenticate(sender)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(sender)
+
+
+class TestCacheNonceStore(NonceTest):
+
+    def test_seen_nonce(self):
+        store = CacheNonceStore()
+        eq_(store.seen_nonce('script-user', 'abc', '1'), False)
+        eq_(store.seen_nonce('script-user', 'abc', '1'), True)
+        eq_(store.seen_nonce('script-user', 'abc', '2'), False)
+
+    def test_default_store(self):
+        assert isinstance(hawk_settings.nonce_store, CacheNonceStore)
+        self.assert_replay_rejected()
+        eq_(len(caches['default']._cache), 1)
+
+    def test_cache_alias(self):
+        with self.settings(
+                HAWK_NONCE_STORE_OPTIONS={'cache_alias': 'nonces'}):
+            self.assert_replay_rejected()
+        eq_(len(caches['default']._cache), 0)
+        eq_(len(caches['nonces']._cache), 1)
+
+
+class TestShardedCacheNonceStore(NonceTest):
+    aliases = ['nonces', 'nonces-2', 'nonces-3']
+
+    def assign(self, store, count=3000):
+        return dict((str(n), store.get_cache_alias('script-user', str(n)))
+                    for n in range(count))
+
+    def test_seen_nonce(self):
+        store = ShardedCacheNonceStore(cache_aliases=self.aliases)
+        for n in range(30):
+            eq_(store.seen_nonce('script-user', str(n), '1'), False)
+            eq_(store.seen_nonce('script-user', str(n), '1'), True)
+        eq_(sum(len(caches[alias]._cache) for alias in self.aliases), 30)
+
+    def test_even_distribution(self):
+        store = ShardedCacheNonceStore(cache_aliases=self.aliases)
+        assigned = list(self.assign(store).values())
+        for alias in self.aliases:
+            share = assigned.count(alias) / float(len(assigned))
+            assert 0.25 < share < 0.42, (
+                'expected about a third of nonces on {}; got {}'
+                .format(alias, share))
+
+    def test_adding_a_shard_moves_a_fraction(self):
+        before = self.assign(ShardedCacheNonceStore(
+            cache_aliases=self.aliases))
+        after = self.assign(ShardedCacheNonceStore(
+            cache_aliases=self.aliases + ['nonces-4']))
+        moved = [n for n in before if before[n] != after[n]]
+        # Only nonces claimed by the new shard should move.
+        eq_(set(after[n] for n in moved), set(['nonces-4']))
+        assert len(moved) < len(before) * 0.35, len(moved)
+
+    def test_setting(self):
+        store_path = 'hawkrest.nonce.ShardedCacheNonceStore'
+        with self.settings(
+                HAWK_NONCE_STORE=store_path,
+                HAWK_NONCE_STORE_OPTIONS={'cache_aliases': self.aliases}):
+            self.assert_replay_rejected()
+        eq_(len(caches['default']._cache), 0)
+
+
+class TestNonceStoreSetting(NonceTest):
+
+    def test_custom_store(self):
+        store_path = '{}.RecordingNonceStore'.format(__name__)
+        with self.settings(HAWK_NONCE_STORE=store_path,
+                           HAWK_NONCE_STORE_OPTIONS={'size': 10}):
+            self.assert_replay_rejected()
+        store = RecordingNonceStore.instances[-1]
+        eq_(store.options, {'size': 10})
+        eq_(len(store.seen), 1)
+
+    def test_store_is_kept_between_requests(self):
+        eq_(hawk_settings.nonce_store, hawk_settings.nonce_store)
+
+    def test_disabled(self):
+        with self.settings(USE_CACHE_FOR_HAWK_NONCE=False):
+            eq_(hawk_settings.nonce_store, None)
+
+
+class TestMemoryNonceStore(NonceTest):
+
+    def setUp(self):
+        super(TestMemoryNonceStore, self).setUp()
+        p = mock.patch('hawkrest.nonce.time')
+        self.time = p.start().time
+        self.time.return_value = 1000
+        self.addCleanup(p.stop)
+
+    def test_seen_nonce(self):
+        store = MemoryNonceStore()
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), False)
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), True)
+        eq_(store.seen_nonce('script-user', 'abc', '1001'), False)
+        eq_(store.seen_nonce('other-user', 'abc', '1000'), False)
+        eq_(len(store), 3)
+
+    def test_expired_buckets_are_dropped(self):
+        store = MemoryNonceStore(bucket_seconds=5)
+        store.seen_nonce('script-user', 'abc', '1000')
+        store.seen_nonce('script-user', 'def', '1003')
+        store.seen_nonce('script-user', 'ghi', '1010')
+
+        # Expiration is 60 seconds plus 5 seconds of padding. The first
+        # bucket is only dropped once its newest timestamp has expired.
+        self.time.return_value = 1004 + 65
+        store.seen_nonce('script-user', 'jkl', '1069')
+        eq_(store.expirations, 0)
+        self.time.return_value = 1005 + 65
+        store.seen_nonce('script-user', 'mno', '1070')
+        eq_(store.expirations, 2)
+        eq_(len(store), 3)
+        eq_(sorted(store._buckets), [202, 213, 214])
+
+    def test_expired_timestamp_is_not_stored(self):
+        store = MemoryNonceStore()
+        eq_(store.seen_nonce('script-user', 'abc', '900'), False)
+        eq_(len(store), 0)
+
+    def test_max_entries(self):
+        store = MemoryNonceStore(max_entries=2)
+        store.seen_nonce('script-user', 'abc', '1000')
+        store.seen_nonce('script-user', 'def', '1001')
+        store.seen_nonce('script-user', 'ghi', '1002')
+        eq_(store.evictions, 1)
+        eq_(len(store), 2)
+        eq_(store.seen_nonce('script-user', 'ghi', '1002'), True)
+
+    def test_max_entries_in_one_bucket(self):
+        store = MemoryNonceStore(max_entries=2)
+        for nonce in ('abc', 'def', 'ghi'):
+            store.seen_nonce('script-user', nonce, '1000')
+        eq_(store.evictions, 2)
+        eq_(len(store), 1)
+        eq_(store.seen_nonce('script-user', 'ghi', '1000'), True)
+
+    def test_memory_usage(self):
+        store = MemoryNonceStore()
+        empty = store.memory_usage()
+        store.seen_nonce('script-user', 'abc', '1000')
+        assert store.memory_usage() > empty, 'expected memory to be used'
+
+    def test_setting(self):
+        self.time.side_effect = time.time
+        store_path = 'hawkrest.nonce.MemoryNonceStore'
+        with self.settings(HAWK_NONCE_STORE=store_path):
+            self.assert_replay_rejected()
+            eq_(len(hawk_settings.nonce_store), 1)
+
+
+def check_shared_nonce(args):
+    path, timestamp = args
+    store = SharedMemoryNonceStore(path=path, slots=64)
+    try:
+        return store.seen_nonce('script-user', 'abc', timestamp)
+    finally:
+        store.close()
+
+
+class TestSharedMemoryNonceStore(NonceTest):
+
+    def setUp(self):
+        super(TestSharedMemoryNonceStore, self).setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'nonces')
+        self.now = str(int(time.time()))
+
+    def store(self, **kw):
+        kw.setdefault('path', self.path)
+        kw.setdefault('slots', 64)
+        store = SharedMemoryNonceStore(**kw)
+        self.addCleanup(store.close)
+        return store
+
+    def test_seen_nonce(self):
+        store = self.store()
+        eq_(store.seen_nonce('script-user', 'abc', self.now), False)
+        eq_(store.seen_nonce('script-user', 'abc', self.now), True)
+        eq_(store.seen_nonce('script-user', 'def', self.now), False)
+
+    def test_default_path_is_private(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        with mock.patch('tempfile.gettempdir', return_value=tmp_dir):
+            store = self.store(path=None)
+        directory = os.path.dirname(store.path)
+        eq_(os.path.dirname(directory), tmp_dir)
+        eq_(os.stat(directory).st_mode & 0o777, 0o700)
+        eq_(os.stat(store.path).st_mode & 0o777, 0o600)
+
+    def test_symlink_rejected(self):
+        target = self.path + '-target'
+        os.symlink(target, self.path)
+        with self.assertRaises(ImproperlyConfigured):
+            self.store()
+        assert not os.path.exists(target), 'expected no file to be created'
+
+    def test_shared_file_rejected(self):
+        self.store().close()
+        os.chmod(self.path, 0o666)
+        with self.assertRaises(ImproperlyConfigured):
+            self.store()
+
+    def test_other_owner_rejected(self):
+        self.store().close()
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(ImproperlyConfigured):
+                self.store()
+
+    def test_shared_private_dir_rejected(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        os.mkdir(os.path.join(tmp_dir, 'hawkrest-{}'.format(os.getuid())),
+                 0o777)
+        os.chmod(os.path.join(tmp_dir, 'hawkrest-{}'.format(os.getuid())),
+                 0o777)
+        with mock.patch('tempfile.gettempdir', return_value=tmp_dir):
+            with self.assertRaises(ImproperlyConfigured):
+                self.store(path=None)
+
+    def test_close_twice(self):
+        store = self.store()
+        store.close()
+        store.close()
+
+    def test_shared_between_instances(self):
+        eq_(self.store().seen_nonce('script-user', 'abc', self.now), False)
+        eq_(self.store().seen_nonce('script-user', 'abc', self.now), True)
+
+    def test_replay_rejected_across_processes(self):
+        pool = multiprocessing.get_context('fork').Pool(8)
+        try:
+            results = pool.map(check_shared_nonce,
+                               [(self.path, self.now)] * 32)
+        finally:
+            pool.close()
+            pool.join()
+        eq_(results.count(False), 1)
+        eq_(results.count(True), 31)
+
+    def test_expired_slots_are_reused(self):
+        store = self.store(slots=4, stripe_slots=4)
+        with mock.patch('hawkrest.nonce.time') as mock_time:
+            mock_time.time.return_value = 1000
+            for nonce in ('a', 'b', 'c', 'd'):
+                store.seen_nonce('script-user', nonce, '1000')
+            mock_time.time.return_value = 1000 + 66
+            eq_(store.seen_nonce('script-user', 'e', '1066'), False)
+            eq_(store.seen_nonce('script-user', 'e', '1066'), True)
+        eq_(store.evictions, 0)
+
+    def test_full_stripe_evicts(self):
+        store = self.store(slots=4, stripe_slots=4)
+        for nonce in ('a', 'b', 'c', 'd', 'e'):
+            store.seen_nonce('script-user', nonce, self.now)
+        eq_(store.evictions, 1)
+        eq_(store.seen_nonce('script-user', 'e', self.now), True)
+
+    def test_mismatched_table(self):
+        self.store()
+        with self.assertRaises(ImproperlyConfigured):
+            self.store(slots=128)
+
+    def test_slots_must_fill_stripes(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.store(slots=10, stripe_slots=4)
+
+    def test_memory_usage(self):
+        eq_(self.store().memory_usage(), 16 + 64 * 24)
+
+
+class TestBloomNonceStore(NonceTest):
+
+    def setUp(self):
+        super(TestBloomNonceStore, self).setUp()
+        p = mock.patch('hawkrest.nonce.time')
+        self.time = p.start().time
+        self.time.return_value = 1000
+        self.addCleanup(p.stop)
+
+    def test_seen_nonce(self):
+        store = BloomNonceStore()
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), False)
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), True)
+        eq_(store.seen_nonce('script-user', 'abc', '1001'), False)
+        eq_(store.checks, 3)
+        eq_(store.rejections, 1)
+
+    def test_filter_size(self):
+        store = BloomNonceStore(requests_per_second=100,
+                                false_positive_rate=0.01)
+        # 100 requests/second over the 65 second nonce timeout.
+        eq_(store.capacity, 6500)
+        eq_(store._current.hashes, 7)
+        # About 9.6 bits per nonce for both filters.
+        eq_(store.memory_usage(), 2 * 7788)
+
+    def test_remembered_for_one_rotation(self):
+        store = BloomNonceStore()
+        store.seen_nonce('script-user', 'abc', '1000')
+        self.time.return_value = 1000 + 65
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), True)
+        self.time.return_value = 1000 + 65 * 2
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), False)
+
+    def test_stale_filters_are_dropped(self):
+        store = BloomNonceStore()
+        store.seen_nonce('script-user', 'abc', '1000')
+        self.time.return_value = 1000 + 65 * 2
+        eq_(store.seen_nonce('script-user', 'abc', '1000'), False)
+
+    def test_false_rejection_rate(self):
+        store = BloomNonceStore(requests_per_second=10,
+                                false_positive_rate=0.01)
+        eq_(store.false_rejection_rate(), 0)
+        for i in range(store.capacity):
+            store.seen_nonce('script-user', str(i), '1000')
+        rate = store.false_rejection_rate()
+        assert 0.005 < rate < 0.02, (
+            'expected a rate near 0.01 at capacity; got {}'.format(rate))
+        # Some of the nonces were likely rejected by mistake but not many.
+        assert store.rejections < store.capacity * 0.02, store.rejections
+
+
+class TestDatabaseNonceStore(NonceTest):
+
+    def setUp(self):
+        super(TestDatabaseNonceStore, self).setUp()
+        self.now = int(time.time())
+        self.store = DatabaseNonceStore(cleanup=False)
+
+    def add_nonce(self, nonce, timestamp):
+        return self.store.seen_nonce('script-user', nonce, str(timestamp))
+
+    def test_seen_nonce(self):
+        eq_(self.add_nonce('abc', self.now), False)
+        eq_(self.add_nonce('abc', self.now), True)
+        eq_(self.add_nonce('abc', self.now + 1), False)
+        eq_(Nonce.objects.count(), 2)
+
+    def test_long_nonce(self):
+        nonce = 'a' * 1000
+        eq_(self.add_nonce(nonce, self.now), False)
+        eq_(self.add_nonce(nonce, self.now), True)
+        eq_(self.add_nonce(nonce + 'b', self.now), False)
+        # SQLite doesn't enforce the length but Postgres would fail.
+        for stored in Nonce.objects.values_list('nonce', flat=True):
+            assert len(stored) <= 255, stored
+
+    def test_long_credentials_id(self):
+        id = 'u' * 300
+        eq_(self.store.seen_nonce(id, 'abc', str(self.now)), False)
+        eq_(self.store.seen_nonce(id, 'abc', str(self.now)), True)
+        assert len(Nonce.objects.get().credentials_id) <= 255
+
+    def test_replay_inside_transaction(self):
+        with transaction.atomic():
+            self.add_nonce('abc', self.now)
+            eq_(self.add_nonce('abc', self.now), True)
+            # The transaction is still usable.
+            eq_(Nonce.objects.count(), 1)
+
+    def test_partition(self):
+        self.add_nonce('abc', self.now)
+        # Partitions are numbered by when the nonce expires.
+        eq_(Nonce.objects.get().partition, (self.now + 65) // 60)
+
+    def test_expired_timestamp_is_not_stored(self):
+        eq_(self.add_nonce('abc', self.now - 120), False)
+        eq_(Nonce.objects.count(), 0)
+
+    def test_delete_expired(self):
+        self.add_nonce('abc', self.now)
+        self.add_nonce('def', self.now - 30)
+        eq_(self.store.delete_expired(now=self.now), 0)
+        eq_(self.store.delete_expired(now=self.now + 65 + 60), 2)
+        eq_(Nonce.objects.count(), 0)
+
+    def test_cleanup(self):
+        store = DatabaseNonceStore()
+        Nonce.objects.create(credentials_id='script-user', nonce='old',
+                             timestamp=0, partition=0)
+        store.seen_nonce('script-user', 'abc', str(self.now))
+        eq_(list(Nonce.objects.values_list('nonce', flat=True)), ['abc'])
+
+    def test_setting(self):
+        store_path = 'hawkrest.nonce.DatabaseNonceStore'
+        with self.settings(HAWK_NONCE_STORE=store_path):
+            self.assert_replay_rejected()
+        eq_(Nonce.objects.count(), 1)
+
+    def test_clearhawknonces(self):
+        Nonce.objects.create(credentials_id='script-user', nonce='old',
+                             timestamp=0, partition=0)
+        self.add_nonce('abc', self.now)
+        out = StringIO()
+        call_command('clearhawknonces', stdout=out)
+        eq_(Nonce.objects.count(), 1)
+        assert 'Deleted 1 expired nonces' in out.getvalue(), out.getvalue()
+
+
+class TestBatchedCacheNonceStore(NonceTest):
+
+    def store(self, **kw):
+        kw.setdefault('cache_alias', 'nonces')
+        return BatchedCacheNonceStore(**kw)
+
+    def test_local_replay_skips_cache(self):
+        store = self.store(background=False)
+        now = str(int(time.time()))
+        eq_(store.seen_nonce('script-user', 'abc', now), False)
+        eq_(store.round_trips, 2)
+        eq_(store.seen_nonce('script-user', 'abc', now), True)
+        eq_(store.round_trips, 2)
+
+    def test_close(self):
+        store = self.store(flush_interval=60)
+        now = str(int(time.time()))
+        thread = threading.Thread(target=store.seen_nonce,
+                                  args=('script-user', 'abc', now))
+        thread.start()
+        while not store._pending:
+            time.sleep(0.001)
+        store.close()
+        thread.join(1)
+        assert not thread.is_alive(), 'expected the queued nonce to be sent'
+        assert not store._flusher, 'expected the flusher to stop'
+        eq_(caches['nonces'].get(store.make_key('script-user', 'abc', now)),
+            True)
+        # Nonces are sent right away after closing.
+        eq_(store.seen_nonce('script-user', 'def', now), False)
+
+    def test_remote_replay(self):
+        now = str(int(time.time()))
+        eq_(self.store(background=False)
+            .seen_nonce('script-user', 'abc', now), False)
+        # Another process shares the cache but not local nonces.
+        eq_(self.store(background=False)
+            .seen_nonce('script-user', 'abc', now), True)
+
+    def test_batches(self):
+        store = self.store(background=False)
+        now = str(int(time.time()))
+        with mock.patch.object(store, 'flush'):
+            threads = [
+                threading.Thread(target=store.seen_nonce,
+                                 args=('script-user', str(n), now))
+                for n in range(10)]
+            for thread in threads:
+                thread.start()
+            # Wait until every request is queued.
+            while len(store._pending) < 10:
+                time.sleep(0.001)
+        store.flush()
+        for thread in threads:
+            thread.join()
+        eq_(store.round_trips, 2)
+        eq_(len(caches['nonces']._cache), 10)
+
+    def test_background_flush(self):
+        store = self.store(flush_interval=0.001)
+        now = str(int(time.time()))
+        eq_(store.seen_nonce('script-user', 'abc', now), False)
+        eq_(len(caches['nonces']._cache), 1)
+        eq_(self.store(flush_interval=0.001)
+            .seen_nonce('script-user', 'abc', now), True)
+
+    def test_write_behind(self):
+        now = str(int(time.time()))
+        self.store(background=False).seen_nonce('script-user', 'abc', now)
+        store = self.store(background=False, wait_for_remote=False)
+        # Only the local check decides.
+        eq_(store.seen_nonce('script-user', 'abc', now), False)
+        eq_(store.late_replays, 1)
+
+    def check_cache_failure(self, **kw):
+        store = self.store(**kw)
+        self.addCleanup(store.close)
+        with mock.patch.object(BatchedCacheNonceStore, 'cache') as cache:
+            cache.get_many.side_effect = RuntimeError('cache is down')
+            with self.assertRaises(RuntimeError):
+                store.seen_nonce('script-user', 'abc',
+                                 str(int(time.time())))
+        eq_(store._pending, [])
+
+    def test_cache_failure_fails_request(self):
+        self.check_cache_failure(background=False)
+
+    def test_cache_failure_fails_request_in_background(self):
+        with mock.patch('hawkrest.nonce.log'):
+            self.check_cache_failure(flush_interval=0.001)
+
+    def test_cache_failure_write_behind(self):
+        store = self.store(background=False, wait_for_remote=False)
+        with mock.patch.object(BatchedCacheNonceStore, 'cache') as cache:
+            cache.get_many.side_effect = RuntimeError('cache is down')
+            with mock.patch('hawkrest.nonce.log') as log:
+                eq_(store.seen_nonce('script-user', 'abc',
+                                     str(int(time.time()))), False)
+        assert log.exception.called, 'expected the error to be logged'
+
+    def test_cache_timeout(self):
+        store = self.store(remote_timeout=0.01)
+        with mock.patch.object(store, '_start_flusher'):
+            with self.assertRaises(TimeoutError):
+                store.seen_nonce('script-user', 'abc',
+                                 str(int(time.time())))
+
+
+class TestCircuitBreakerNonceStore(NonceTest):
+
+    def setUp(self):
+        super(TestCircuitBreakerNonceStore, self).setUp()
+        self.now = str(int(time.time()))
+        self.events = []
+        nonce_store_state_changed.connect(self.record_event)
+        self.addCleanup(nonce_store_state_changed.disconnect,
+                        self.record_event)
+        self.addCleanup(setattr, SlowCache, 'delay', 0)
+
+    def record_event(self, sender, store, old_state, new_state, **kw):
+        self.events.append((old_state, new_state))
+
+    def store(self, **kw):
+        kw.setdefault('store_options', {'cache_alias': 'slow'})
+        kw.setdefault('call_timeout', 0.05)
+        kw.setdefault('slow_call_seconds', 0.02)
+        kw.setdefault('failure_threshold', 2)
+        kw.setdefault('reset_seconds', 0.1)
+        store = CircuitBreakerNonceStore(**kw)
+        self.addCleanup(store.close)
+        return store
+
+    def test_close_closes_store(self):
+        store = self.store()
+        with mock.patch.object(store.store, 'close') as close:
+            store.close()
+        assert close.called, 'expected the wrapped store to be closed'
+
+    def test_closed(self):
+        store = self.store()
+        eq_(store.seen_nonce('script-user', 'abc', self.now), False)
+        eq_(store.seen_nonce('script-user', 'abc', self.now), True)
+        eq_(len(caches['slow']._cache), 1)
+        eq_(store.state, 'closed')
+        eq_(self.events, [])
+
+    def test_full_cycle(self):
+        store = self.store()
+        SlowCache.delay = 0.2
+
+        # Timed out calls count as failures until the circuit opens.
+        eq_(store.seen_nonce('script-user', 'a', self.now), False)
+        eq_(store.state, 'closed')
+        eq_(store.seen_nonce('script-user', 'b', self.now), False)
+        eq_(store.state, 'open')
+        eq_(self.events, [('closed', 'open')])
+
+        # While open, the fallback store still catches replays.
+        start = time.time()
+        eq_(store.seen_nonce('script-user', 'c', self.now), False)
+        eq_(store.seen_nonce('script-user', 'c', self.now), True)
+        assert time.time() - start < 0.05, 'expected no remote calls'
+
+        # A failed probe opens the circuit again.
+        time.sleep(0.1)
+        store.seen_nonce('script-user', 'd', self.now)
+        eq_(self.events[1:], [('open', 'half-open'), ('half-open', 'open')])
+
+        # Once the cache recovers, a probe closes the circuit.
+        SlowCache.delay = 0
+        time.sleep(0.1)
+        eq_(store.seen_nonce('script-user', 'e', self.now), False)
+        eq_(store.state, 'closed')
+        eq_(self.events[3:], [('open', 'half-open'), ('half-open', 'closed')])
+        eq_(store.seen_nonce('script-user', 'e', self.now), True)
+
+    def test_slow_calls_are_failures(self):
+        store = self.store(call_timeout=1)
+        SlowCache.delay = 0.03
+        # Slow answers are still used.
+        eq_(store.seen_nonce('script-user', 'a', self.now), False)
+        eq_(store.seen_nonce('script-user', 'a', self.now), True)
+        eq_(store.state, 'open')
+
+    def test_errors_are_failures(self):
+        store = self.store(failure_threshold=1)
+        with mock.patch.object(store.store, 'seen_nonce') as seen_nonce:
+            seen_nonce.side_effect = RuntimeError('cache is down')
+            eq_(store.seen_nonce('script-user', 'a', self.now), False)
+        eq_(store.state, 'open')
+
+    def test_success_resets_failures(self):
+        store = self.store()
+        SlowCache.delay = 0.2
+        store.seen_nonce('script-user', 'a', self.now)
+        SlowCache.delay = 0
+        store.seen_nonce('script-user', 'b', self.now)
+        eq_(store.failures, 0)
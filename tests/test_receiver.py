@@ -0,0 +1,154 @@
+import io
+
+from django.core.cache import cache
+
+import mock
+from mohawk import Receiver, Sender
+from mohawk.base import EmptyValue
+from mohawk.util import calculate_payload_hash
+from mohawk.exc import (AlreadyProcessed, CredentialsLookupError, MacMismatch,
+                        MisComputedContentHash, MissingAuthorization,
+                        TokenExpired)
+from nose.tools import eq_
+
+from hawkrest import default_credentials_lookup
+from hawkrest.receiver import (HawkReceiver, PayloadHash,
+                               respond_with_content_hash)
+
+from .base import BaseTest
+
+
+class TestHawkReceiver(BaseTest):
+    url = 'http://testserver/'
+    content = b'{"one": 1}'
+    content_type = 'application/json'
+
+    def setUp(self):
+        super(TestHawkReceiver, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def sender(self, content=None, content_type=None, **kw):
+        return Sender(self.credentials, self.url, 'POST',
+                      content=self.content if content is None else content,
+                      content_type=(self.content_type if content_type is None
+                                    else content_type),
+                      **kw)
+
+    def receive(self, sender, content_type=None, **kw):
+        return HawkReceiver(default_credentials_lookup,
+                            sender.request_header, self.url, 'POST',
+                            content_type=(self.content_type
+                                          if content_type is None
+                                          else content_type),
+                            **kw)
+
+    def test_verify(self):
+        receiver = self.receive(self.sender())
+        receiver.verify_content(self.content)
+        eq_(receiver.resource.credentials['id'], self.credentials_id)
+
+    def test_verify_file(self):
+        receiver = self.receive(self.sender())
+        receiver.verify_content(io.BytesIO(self.content))
+
+    def test_tampered_content(self):
+        receiver = self.receive(self.sender())
+        with self.assertRaises(MisComputedContentHash):
+            receiver.verify_content(self.content + b' ')
+
+    def test_tampered_hash(self):
+        sender = self.sender()
+        header = sender.request_header.replace('hash="', 'hash="x')
+        with self.assertRaises(MacMismatch):
+            HawkReceiver(default_credentials_lookup, header, self.url, 'POST',
+                         content_type=self.content_type)
+
+    def test_missing_header(self):
+        with self.assertRaises(MissingAuthorization):
+            HawkReceiver(default_credentials_lookup, '', self.url, 'POST')
+
+    def test_unknown_credentials(self):
+        sender = Sender({'id': 'unknown', 'key': 'x', 'algorithm': 'sha256'},
+                        self.url, 'POST', content=self.content,
+                        content_type=self.content_type)
+        with self.assertRaises(CredentialsLookupError):
+            self.receive(sender)
+
+    def test_expired_before_nonce(self):
+        seen_nonce = mock.Mock(return_value=False)
+        with self.assertRaises(TokenExpired) as cm:
+            self.receive(self.sender(_timestamp='123'), seen_nonce=seen_nonce)
+        assert cm.exception.www_authenticate.startswith('Hawk ts="')
+        assert not seen_nonce.called, 'nonce should not have been checked'
+
+    def test_nonce(self):
+        seen_nonce = mock.Mock(return_value=True)
+        with self.assertRaises(AlreadyProcessed):
+            self.receive(self.sender(), seen_nonce=seen_nonce)
+        eq_(seen_nonce.call_args[0][0], self.credentials_id)
+
+    def test_no_hash_for_empty_content(self):
+        sender = self.sender(content=EmptyValue, content_type=EmptyValue,
+                             always_hash_content=False)
+        self.receive(sender, content_type='').verify_content(b'')
+
+    def test_no_hash_rejected(self):
+        sender = self.sender(content=EmptyValue, content_type=EmptyValue,
+                             always_hash_content=False)
+        receiver = self.receive(sender)
+        with self.assertRaises(MisComputedContentHash):
+            receiver.verify_content(self.content)
+
+    def test_no_hash_accept_untrusted_content(self):
+        sender = self.sender(content=EmptyValue, content_type=EmptyValue,
+                             always_hash_content=False)
+        receiver = self.receive(sender, accept_untrusted_content=True)
+        receiver.verify_content(self.content)
+
+    def test_respond(self):
+        sender = self.sender()
+        receiver = self.receive(sender)
+        receiver.verify_content(self.content)
+        receiver.respond(content='ok', content_type='text/plain')
+        sender.accept_response(receiver.response_header,
+                               content='ok', content_type='text/plain')
+
+    def test_same_result_as_mohawk(self):
+        sender = self.sender()
+        receiver = self.receive(sender)
+        receiver.verify_content(self.content)
+        cache.clear()
+        expected = Receiver(default_credentials_lookup, sender.request_header,
+                            self.url, 'POST', content=self.content,
+                            content_type=self.content_type)
+        eq_(receiver.parsed_header, expected.parsed_header)
+        eq_(receiver.resource.credentials, expected.resource.credentials)
+
+
+class TestPayloadHash(BaseTest):
+
+    def test_same_as_mohawk(self):
+        payload_hash = PayloadHash('sha256', 'text/plain; charset=utf-8')
+        payload_hash.update(b'one ')
+        payload_hash.update(b'two')
+        eq_(payload_hash.b64digest(),
+            calculate_payload_hash(b'one two', 'sha256', 'text/plain'))
+
+    def test_empty(self):
+        eq_(PayloadHash('sha256', '').b64digest(),
+            calculate_payload_hash(b'', 'sha256', ''))
+
+    def test_respond_with_content_hash(self):
+        url = 'http://testserver/'
+        sender = Sender(self.credentials, url, 'GET',
+                        content='', content_type='')
+        receiver = Receiver(default_credentials_lookup,
+                            sender.request_header, url, 'GET',
+                            content='', content_type='')
+        payload_hash = PayloadHash('sha256', 'text/plain')
+        payload_hash.update(b'the response')
+        respond_with_content_hash(receiver, payload_hash.b64digest())
+        sender.accept_response(receiver.response_header,
+                               content=b'the response',
+                               content_type='text/plain')
@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.http import HttpResponse
+
+import mock
+from mohawk.exc import AlreadyProcessed
+from nose.tools import eq_
+from rest_framework.exceptions import AuthenticationFailed
+
+from hawkrest import HawkAuthentication
+from hawkrest.aio import AsyncHawkAuthentication
+from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.signals import authentication_timed, response_signing_timed
+from hawkrest.util import PhaseTimer
+
+from .base import BaseTest
+
+AUTH_PHASES = set(['header', 'credentials_lookup', 'mac', 'nonce',
+                   'payload_hash', 'user_lookup'])
+
+
+class TimingTest(BaseTest):
+
+    def setUp(self):
+        super(TimingTest, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.sender = self._sender(method='POST', content='{}',
+                                   content_type='application/json')
+
+    def request(self):
+        return self._request(self.sender, method='POST', data='{}',
+                             content_type='application/json')
+
+    def listen(self, signal):
+        listener = mock.Mock()
+        signal.connect(listener, weak=False)
+        self.addCleanup(signal.disconnect, listener)
+        return listener
+
+
+class TestAuthenticationTimed(TimingTest):
+
+    def assert_phases(self, phases, expected):
+        eq_(set(phases), expected)
+        assert all(seconds >= 0 for seconds in phases.values()), phases
+
+    def test_phases(self):
+        listener = self.listen(authentication_timed)
+        req = self.request()
+        HawkAuthentication().authenticate(req)
+        kw = listener.call_args[1]
+        eq_(kw['sender'], HawkAuthentication)
+        eq_(kw['request'], req)
+        eq_(kw['error'], None)
+        self.assert_phases(kw['phases'], AUTH_PHASES)
+
+    def test_rejected(self):
+        HawkAuthentication().authenticate(self.request())
+        listener = self.listen(authentication_timed)
+        with self.assertRaises(AuthenticationFailed):
+            HawkAuthentication().authenticate(self.request())
+        kw = listener.call_args[1]
+        assert isinstance(kw['error'], AlreadyProcessed), kw['error']
+        self.assert_phases(kw['phases'],
+                           set(['header', 'credentials_lookup', 'mac']))
+
+    def test_not_timed_without_listeners(self):
+        with mock.patch('hawkrest.PhaseTimer') as timer:
+            HawkAuthentication().authenticate(self.request())
+        assert not timer.called, 'expected no timer'
+
+    def test_not_hawk_request(self):
+        listener = self.listen(authentication_timed)
+        HawkAuthentication().authenticate(self.factory.get('/'))
+        assert not listener.called, 'expected no timing'
+
+    async def test_async(self):
+        listener = self.listen(authentication_timed)
+        await AsyncHawkAuthentication().aauthenticate(self.request())
+        kw = listener.call_args[1]
+        eq_(kw['sender'], AsyncHawkAuthentication)
+        eq_(kw['error'], None)
+        self.assert_phases(kw['phases'], AUTH_PHASES)
+
+
+class TestResponseSigningTimed(TimingTest):
+
+    def sign(self, response):
+        req = self.request()
+        HawkAuthentication().authenticate(req)
+        return req, HawkResponseMiddleware(mock.Mock()).process_response(
+            req, response)
+
+    def test_phases(self):
+        listener = self.listen(response_signing_timed)
+        req, res = self.sign(HttpResponse('the response'))
+        kw = listener.call_args[1]
+        eq_(kw['sender'], HawkResponseMiddleware)
+        eq_(kw['request'], req)
+        eq_(kw['response'], res)
+        eq_(set(kw['phases']), set(['payload_hash', 'mac']))
+
+    def test_compressed(self):
+        listener = self.listen(response_signing_timed)
+        with self.settings(HAWK_COMPRESS_RESPONSES=True):
+            self.sign(HttpResponse('the response ' * 100))
+        eq_(set(listener.call_args[1]['phases']),
+            set(['compress', 'payload_hash', 'mac']))
+
+    def test_not_timed_without_listeners(self):
+        with mock.patch('hawkrest.middleware.PhaseTimer') as timer:
+            self.sign(HttpResponse('the response'))
+        assert not timer.called, 'expected no timer'
+
+
+class TestPhaseTimer(BaseTest):
+
+    def test_laps(self):
+        with mock.patch('hawkrest.util.perf_counter',
+                        side_effect=[1.0, 1.5, 2.0, 10.0, 12.0]):
+            timer = PhaseTimer()
+            timer.lap('one')
+            timer.lap('two')
+            timer.mark()
+            timer.lap('one')
+        eq_(timer.phases, {'one': 2.5, 'two': 0.5})
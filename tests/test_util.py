@@ -1,7 +1,8 @@
 from django.test import RequestFactory
 
 from tests.base import BaseTest
-from hawkrest.util import get_auth_header, is_hawk_request
+from hawkrest.util import (BodySpool, can_stream_body, get_auth_header,
+                           is_hawk_request)
 
 
 class TestGetAuthHeader(BaseTest):
@@ -36,3 +37,28 @@ class TestIsHawkRequest(BaseTest):
         factory_obj = RequestFactory()
         request = factory_obj.request()
         self.assertFalse(is_hawk_request(request))
+
+
+class TestBodySpool(BaseTest):
+
+    def request(self, data='abc'):
+        return RequestFactory().post('/', data=data,
+                                     content_type='text/plain')
+
+    def test_can_stream_body(self):
+        self.assertTrue(can_stream_body(self.request()))
+
+    def test_cannot_stream_empty_body(self):
+        self.assertFalse(can_stream_body(self.request(data='')))
+
+    def test_cannot_stream_read_body(self):
+        request = self.request()
+        request.read(1)
+        self.assertFalse(can_stream_body(request))
+
+    def test_restore(self):
+        request = self.request(data='abcdef')
+        spool = BodySpool(request, max_memory_size=10)
+        self.assertEqual(spool.read(2), b'ab')
+        spool.restore()
+        self.assertEqual(request.read(), b'abcdef')
@@ -0,0 +1,160 @@
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import RequestDataTooBig
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import HttpResponse
+
+import mock
+from nose.tools import eq_
+
+from hawkrest import HawkAuthentication, HawkAuthenticatedUser
+from hawkrest.middleware import HawkResponseMiddleware
+from hawkrest.wsgi import HawkWSGIMiddleware
+
+from .base import BaseTest
+
+
+class TestHawkWSGIMiddleware(BaseTest):
+    content = '{"data": "some content"}'
+    content_type = 'application/json'
+
+    def setUp(self):
+        super(TestHawkWSGIMiddleware, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.app = mock.Mock(side_effect=self.django_app)
+        self.body = None
+        self.user = None
+
+    def django_app(self, environ, start_response):
+        # Like a DRF view behind HawkResponseMiddleware.
+        request = WSGIRequest(environ)
+        self.user, auth = HawkAuthentication().authenticate(request)
+        self.body = request.body
+        response = HawkResponseMiddleware(mock.Mock()).process_response(
+            request, HttpResponse('the response'))
+        start_response('200 OK', list(response.items()))
+        return [response.content]
+
+    def environ(self, sender=None, content=None, **kw):
+        content = self.content if content is None else content
+        sender = sender or self._sender(method='POST', content=content,
+                                        content_type=self.content_type)
+        return self._request(sender, method='POST', data=content,
+                             content_type=self.content_type, **kw).environ
+
+    def call(self, environ, **kw):
+        start_response = mock.Mock()
+        body = b''.join(HawkWSGIMiddleware(self.app, **kw)(environ,
+                                                           start_response))
+        status, headers = start_response.call_args[0]
+        return status, dict(headers), body
+
+    def assert_unauthorized(self, status, headers, body, detail=None):
+        eq_(status, '401 Unauthorized')
+        eq_(headers['WWW-Authenticate'], 'Hawk')
+        eq_(headers['Content-Type'], 'application/json')
+        eq_(json.loads(body.decode('utf8')),
+            {'detail': detail or 'Hawk authentication failed'})
+        assert not self.app.called, 'expected Django not to be called'
+
+    def test_valid_request(self):
+        sender = self._sender(method='POST', content=self.content,
+                              content_type=self.content_type)
+        status, headers, body = self.call(self.environ(sender=sender))
+        eq_(status, '200 OK')
+        # Verifying the request again in Django would have been a replay.
+        assert isinstance(self.user, HawkAuthenticatedUser)
+        eq_(self.body, self.content.encode('utf8'))
+        sender.accept_response(headers['Server-Authorization'],
+                               content=body,
+                               content_type=headers['Content-Type'])
+
+    def test_streamed_body(self):
+        with self.settings(HAWK_STREAM_REQUEST_BODY=True):
+            status, headers, body = self.call(self.environ())
+        eq_(status, '200 OK')
+        eq_(self.body, self.content.encode('utf8'))
+
+    def test_tampered_body(self):
+        sender = self._sender(method='POST', content='{"a": 1}',
+                              content_type=self.content_type)
+        self.assert_unauthorized(*self.call(self.environ(sender=sender)))
+
+    def test_replay(self):
+        sender = self._sender(method='POST', content=self.content,
+                              content_type=self.content_type)
+        self.call(self.environ(sender=sender))
+        self.app.reset_mock()
+        self.assert_unauthorized(*self.call(self.environ(sender=sender)))
+
+    def test_expired(self):
+        sender = self._sender(method='POST', content=self.content,
+                              content_type=self.content_type,
+                              _timestamp='123')
+        self.assert_unauthorized(
+            *self.call(self.environ(sender=sender)),
+            detail='Hawk authentication failed: The token has expired. '
+                   'Is your system clock correct?')
+
+    def test_unchecked_path(self):
+        sender = self._sender(method='POST', content='{"a": 1}',
+                              content_type=self.content_type)
+        environ = self.environ(sender=sender)
+        app = mock.Mock(return_value=[b'ok'])
+        HawkWSGIMiddleware(app, path_prefixes=['/api/'])(environ, mock.Mock())
+        assert app.called, 'expected Django to be called'
+        assert 'hawk.receiver' not in environ
+
+    def test_path_prefixes_setting(self):
+        sender = self._sender(method='POST', content='{"a": 1}',
+                              content_type=self.content_type)
+        environ = self.environ(sender=sender)
+        app = mock.Mock(return_value=[b'ok'])
+        with self.settings(HAWK_WSGI_PATH_PREFIXES=['/api/']):
+            HawkWSGIMiddleware(app)(environ, mock.Mock())
+        assert app.called, 'expected Django to be called'
+        assert 'hawk.receiver' not in environ
+
+    def test_not_hawk_request(self):
+        environ = self.environ()
+        environ['HTTP_AUTHORIZATION'] = 'Basic dXNlcjpwYXNz'
+        app = mock.Mock(return_value=[b'ok'])
+        eq_(b''.join(HawkWSGIMiddleware(app)(environ, mock.Mock())), b'ok')
+        assert 'hawk.receiver' not in environ
+
+    def test_disallowed_host(self):
+        environ = self.environ(HTTP_HOST='evil.example.com')
+        app = mock.Mock(return_value=[b'ok'])
+        with self.settings(ALLOWED_HOSTS=['testserver']):
+            HawkWSGIMiddleware(app)(environ, mock.Mock())
+        assert app.called, 'expected Django to handle the host'
+        assert 'hawk.receiver' not in environ
+
+    def test_body_too_big(self):
+        content = json.dumps({'data': 'x' * 200})
+        sender = self._sender(method='POST', content=content,
+                              content_type=self.content_type)
+        environ = self.environ(sender=sender, content=content)
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100):
+            # Django responds to this with a 400. The request must not
+            # have been verified already, which would make it a replay.
+            with self.assertRaises(RequestDataTooBig):
+                self.call(environ)
+        assert self.app.called, 'expected Django to handle the body'
+        assert environ['hawk.receiver'] is None
+
+    def test_no_upload_limit(self):
+        # Django < 1.10 has no DATA_UPLOAD_MAX_MEMORY_SIZE.
+        with mock.patch('hawkrest.wsgi.settings', spec=[]):
+            status, headers, body = self.call(self.environ())
+        eq_(status, '200 OK')
+
+    def test_unexpected_error(self):
+        # mohawk raises KeyError for a header without an id.
+        environ = self.environ()
+        environ['HTTP_AUTHORIZATION'] = 'Hawk mac="abc"'
+        app = mock.Mock(return_value=[b'ok'])
+        eq_(b''.join(HawkWSGIMiddleware(app)(environ, mock.Mock())), b'ok')
+        assert 'hawk.receiver' not in environ